@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетна перевірка списку осіб з CSV файлу
+"""
+
+import csv
+import io
+import os
+
+from dataset import FUZZY_MAX_DISTANCE
+
+# Скільки рядків перевіряти між оновленнями повідомлення про прогрес
+BATCH_CHUNK_ROWS = int(os.getenv('BATCH_CHUNK_ROWS', 1000))
+
+# Назви колонок, які розпізнаються у заголовку файлу
+COLUMN_ALIASES = {
+    'last_name': ('прізвище', 'фамилия', 'last_name', 'lastname', 'surname'),
+    'first_name': ("ім'я", 'імя', 'имя', 'first_name', 'firstname', 'name'),
+    'patronymic': ('по-батькові', 'по батькові', 'побатькові', 'отчество', 'patronymic', 'middle_name'),
+    'birth_date': ('дата народження', 'дата рождения', 'birth_date', 'birthdate', 'birthday'),
+}
+DEFAULT_HEADER = ['Прізвище', "Ім'я", 'По-батькові', 'Дата народження']
+RESULT_COLUMNS = ['Результат', 'Записів', 'Схожих']
+
+
+def decode_upload(data: bytes):
+    """Декодує CSV: UTF-8 (з BOM або без), інакше Windows-1251 (експорт з Excel)"""
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return data.decode('cp1251')
+
+
+def open_csv(text):
+    """
+    Відкриває CSV для потокового читання.
+
+    Повертає (заголовок або None, індекси колонок ПІБ та дати, ітератор рядків).
+    Якщо заголовка немає, колонки йдуть у порядку DEFAULT_HEADER.
+    """
+    try:
+        dialect = csv.Sniffer().sniff(text[:64 * 1024], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    rows = csv.reader(io.StringIO(text), dialect)
+
+    first_row = next(rows, [])
+    names = [name.strip().lower().replace('’', "'").replace('ʼ', "'") for name in first_row]
+    columns = []
+    for field in ('last_name', 'first_name', 'patronymic', 'birth_date'):
+        position = next((i for i, name in enumerate(names) if name in COLUMN_ALIASES[field]), None)
+        if position is None:
+            break
+        columns.append(position)
+
+    if len(columns) == 4:
+        return first_row, tuple(columns), rows
+    # Заголовка немає: перший рядок теж дані
+    return None, (0, 1, 2, 3), _prepend(first_row, rows)
+
+
+def _prepend(first_row, rows):
+    if first_row:
+        yield first_row
+    yield from rows
+
+
+def iter_chunks(rows, size: int = BATCH_CHUNK_ROWS):
+    """Ділить рядки на шматки по size, пропускаючи порожні"""
+    chunk = []
+    for row in rows:
+        if not any(cell.strip() for cell in row):
+            continue
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def check_chunk(datasets, rows, columns, max_distance: int = FUZZY_MAX_DISTANCE):
+    """
+    Перевіряє шматок рядків по індексах знімків datasets (по одному на джерело);
+    до кожного рядка додаються RESULT_COLUMNS із сумою збігів в усіх джерелах.
+    """
+    results = []
+    for row in rows:
+        fields = [row[i].strip() if i < len(row) else '' for i in columns]
+        matches = [match for dataset in datasets for match in dataset.find(*fields)]
+        similar = []
+        if not matches and max_distance > 0:
+            similar = [candidate for dataset in datasets
+                       for candidate in dataset.find_fuzzy(*fields, max_distance=max_distance)]
+        if matches:
+            verdict = 'ЗНАЙДЕНО'
+        elif similar:
+            verdict = 'СХОЖІ'
+        else:
+            verdict = 'НЕМАЄ'
+        results.append(row + [verdict, len(matches), len(similar)])
+    return results
+
+
+def summarize(results):
+    """Лічильники (рядків, знайдено, схожих) для перевірених рядків"""
+    found = sum(1 for row in results if row[-2])
+    similar = sum(1 for row in results if not row[-2] and row[-1])
+    return len(results), found, similar
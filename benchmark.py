@@ -0,0 +1,1755 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарки пошуку в базі розшукуваних осіб на синтетичних даних
+
+Запуск: python benchmark.py index --sizes 100000 1000000
+        python benchmark.py parse --size-mb 500
+        python benchmark.py memory --size 1000000
+        python benchmark.py fuzzy --sizes 100000 1000000
+        python benchmark.py batch --size 1000000 --rows 100000
+        python benchmark.py persistence --users 100000
+        python benchmark.py health --size 100000 --seconds 5
+        python benchmark.py updates --updates 1000 --users 100
+        python benchmark.py sends --chats 50 --edits 10
+        python benchmark.py download --size-mb 50
+        python benchmark.py stall --stall 3
+        python benchmark.py e2e --sizes 10000 100000 1000000 --output e2e.json
+        python benchmark.py e2e --baseline e2e.json
+        python benchmark.py sources --size 100000 --queries 300
+        python benchmark.py inline --size 1000000 --queries 200
+        python benchmark.py refresh --size-mb 100
+        python benchmark.py coldstart --size-mb 100
+"""
+
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+import urllib.parse
+
+import httpx
+from telegram.ext import Application, MessageHandler, filters
+from telegram.request import HTTPXRequest
+
+from batch import check_chunk, iter_chunks, open_csv
+from dataset import (FUZZY_MAX_DISTANCE, PREFIX_SCAN_LIMIT, Dataset, DatasetCache, PersonRecord, SnapshotStore,
+                     create_http_client, download_dataset, levenshtein, normalize_birth_date, normalize_text,
+                     shutdown_build_pool)
+from download import DownloadFailed, ResumableDownload
+from health import HealthServer
+from metrics import render_metrics
+from persistence import SQLitePersistence
+from rate_limiter import CHAT_BURST, MessageScheduler, TokenBucket
+from sources import DatasetFederation, DatasetSource, SourceResult, federation
+from updates import CONCURRENT_UPDATES, WEBHOOK_PATH, PerUserUpdateProcessor, UpdateReceiver
+
+LAST_NAMES = ['Осауленко', 'Шевченко', 'Коваленко', 'Бондаренко', 'Ткаченко', 'Кравченко',
+              'Олійник', 'Шевчук', 'Поліщук', 'Мельник', "Дем'яненко", 'Лисенко']
+FIRST_NAMES = ['Микита', 'Олександр', 'Іван', 'Петро', 'Андрій', 'Сергій', 'Юрій', 'Дмитро']
+PATRONYMICS = ['Петрович', 'Іванович', 'Олександрович', 'Андрійович', 'Сергійович', 'Юрійович']
+CATEGORIES = ['Особа, яка переховується від органів досудового розслідування',
+              'Особа, яка зникла безвісти']
+OVDS = ['ГУНП в Київській області', 'ГУНП у Львівській області', 'ГУНП в Одеській області']
+
+
+def iter_records(count: int, seed: int = 42):
+    """Генерує записи у форматі дампу МВС (разом з полями, які бот не використовує)"""
+    rng = random.Random(seed)
+    for i in range(count):
+        year = rng.randint(1950, 2005)
+        month = rng.randint(1, 12)
+        day = rng.randint(1, 28)
+        yield {
+            'ID': str(i),
+            'OVD': rng.choice(OVDS),
+            'CATEGORY': rng.choice(CATEGORIES),
+            'FIRST_NAME_U': rng.choice(FIRST_NAMES),
+            'LAST_NAME_U': f"{rng.choice(LAST_NAMES)}{i % 997}",
+            'MIDDLE_NAME_U': rng.choice(PATRONYMICS),
+            'FIRST_NAME_R': 'Никита',
+            'LAST_NAME_R': 'Осауленко',
+            'MIDDLE_NAME_R': 'Петрович',
+            'FIRST_NAME_E': 'Mykyta',
+            'LAST_NAME_E': 'Osaulenko',
+            'MIDDLE_NAME_E': 'Petrovych',
+            'BIRTH_DATE': f"{year:04d}-{month:02d}-{day:02d}T00:00:00",
+            'SEX': rng.choice(['ЧОЛОВІЧА', 'ЖІНОЧА']),
+            'LOST_DATE': f"{rng.randint(2014, 2024)}-01-01T00:00:00",
+            'LOST_PLACE': 'м. Київ',
+            'RESTRAINT': 'тримання під вартою',
+            'ARTICLE_CRIM': f"{rng.randint(100, 440)}",
+            'PHOTOID': f"{rng.getrandbits(64):016x}",
+            'CONTACT': 'Тел.: 102',
+        }
+
+
+def generate_records(count: int, seed: int = 42):
+    """Генерує список записів у форматі дампу МВС"""
+    return list(iter_records(count, seed))
+
+
+def _write_persons(path, records, limit: int = None, records_key: str = 'persons'):
+    """
+    Записує записи як дамп МВС (об'єкт з ключем records_key або, якщо він None,
+    масив), поки не набереться limit байтів
+    """
+    written = 0
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'{{"{records_key}": [\n' if records_key else '[\n')
+        for record in records:
+            if limit is not None and written >= limit:
+                break
+            line = (',\n' if count else '') + json.dumps(record, ensure_ascii=False)
+            f.write(line)
+            written += len(line.encode('utf-8'))
+            count += 1
+        f.write('\n]}' if records_key else '\n]')
+    return count
+
+
+def write_dump(path, size_mb: int, seed: int = 42):
+    """Записує синтетичний дамп розміром приблизно size_mb МБ; повертає кількість записів"""
+    return _write_persons(path, iter_records(10 ** 9, seed), size_mb * 1024 * 1024)
+
+
+def write_dump_records(path, count: int, seed: int = 42):
+    """Записує синтетичний дамп рівно з count записів"""
+    return _write_persons(path, iter_records(count, seed))
+
+
+def legacy_scan(records, last_name, first_name, patronymic, birth_date):
+    """Лінійний пошук, як у старому perform_search (нормалізація на кожен запис)"""
+    matches = []
+    for record in records:
+        record_first = record.get('FIRST_NAME_U') or record.get('FIRST_NAME') or record.get('OVD') or ''
+        record_last = record.get('LAST_NAME_U') or record.get('LAST_NAME') or record.get('OVDSURNAME') or ''
+        record_patronymic = record.get('MIDDLE_NAME_U') or record.get('PATRONYMIC') or record.get('OVDPATRONYMIC') or ''
+        record_birth = normalize_birth_date(record.get('BIRTH_DATE') or record.get('BIRTHDAY') or '')
+        if (normalize_text(record_first) == normalize_text(first_name) and
+                normalize_text(record_last) == normalize_text(last_name) and
+                normalize_text(record_patronymic) == normalize_text(patronymic) and
+                record_birth == birth_date.strip()):
+            matches.append(record)
+    return matches
+
+
+def sample_queries(records, count: int, seed: int = 7):
+    """Запити: половина існуючих осіб, половина відсутніх"""
+    rng = random.Random(seed)
+    queries = []
+    for i in range(count):
+        record = rng.choice(records)
+        query = (
+            record['LAST_NAME_U'],
+            record['FIRST_NAME_U'],
+            record['MIDDLE_NAME_U'],
+            normalize_birth_date(record['BIRTH_DATE']),
+        )
+        if i % 2:
+            query = (query[0] + 'х',) + query[1:]
+        queries.append(query)
+    return queries
+
+
+def bench_index(sizes, queries: int = 20):
+    """Порівнює лінійний пошук з пошуком по індексу"""
+    for size in sizes:
+        records = generate_records(size)
+        search_queries = sample_queries(records, queries)
+
+        started = time.perf_counter()
+        dataset = Dataset(records)
+        build_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for query in search_queries:
+            legacy_scan(records, *query)
+        scan_time = (time.perf_counter() - started) / len(search_queries)
+
+        started = time.perf_counter()
+        for query in search_queries:
+            dataset.find(*query)
+        index_time = (time.perf_counter() - started) / len(search_queries)
+
+        print(f"📊 {size} записів: побудова індексу {build_time:.2f} с, "
+              f"лінійний пошук {scan_time * 1000:.1f} мс/запит, "
+              f"індекс {index_time * 1_000_000:.1f} мкс/запит "
+              f"(x{scan_time / index_time:.0f})")
+
+
+def peak_rss_mb():
+    """Пікове використання пам'яті процесом (МБ)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def parse_child(path, mode):
+    """Парсить дамп в окремому процесі, щоб виміряти його піковий RSS"""
+    store = SnapshotStore(os.path.dirname(path), os.path.basename(path)[:-len('.json')])
+    started = time.perf_counter()
+    dataset = Dataset(store.read_records(streaming=(mode == 'streaming')))
+    print(json.dumps({
+        'mode': mode,
+        'records': len(dataset),
+        'seconds': round(time.perf_counter() - started, 2),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }))
+
+
+def bench_parse(size_mb: int, modes):
+    """Порівнює піковий RSS json.load та потокового парсингу"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'dump.json')
+        count = write_dump(path, size_mb)
+        print(f"📄 Дамп {os.path.getsize(path) / 1024 / 1024:.0f} МБ, {count} записів")
+        for mode in modes:
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), 'parse-child', path, mode],
+                capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                print(f"❌ {mode}: процес завершився з кодом {result.returncode}")
+                continue
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            print(f"📊 {mode}: {stats['seconds']} с, піковий RSS {stats['peak_rss_mb']} МБ")
+
+
+def _parsed_records(size: int):
+    """Записи, як після json.load: кожен рядок створюється парсером заново"""
+    for record in iter_records(size):
+        yield json.loads(json.dumps(record, ensure_ascii=False))
+
+
+def _traced_size(build):
+    """Пам'ять (байти), яку займає результат build() за даними tracemalloc"""
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def bench_memory(size: int):
+    """Порівнює пам'ять списку словників МВС та компактних PersonRecord"""
+    records, dicts_bytes = _traced_size(lambda: list(_parsed_records(size)))
+    del records
+    records, compact_bytes = _traced_size(lambda: [PersonRecord.from_dict(r) for r in _parsed_records(size)])
+    del records
+
+    print(f"📊 {size} записів:")
+    print(f"   список словників: {dicts_bytes / 1024 / 1024:.0f} МБ ({dicts_bytes / size:.0f} Б/запис)")
+    print(f"   PersonRecord:     {compact_bytes / 1024 / 1024:.0f} МБ ({compact_bytes / size:.0f} Б/запис)")
+    print(f"   економія: x{dicts_bytes / compact_bytes:.1f}")
+
+
+def with_typo(text, rng):
+    """Замінює одну літеру, як при помилці користувача"""
+    position = rng.randrange(len(text))
+    return text[:position] + rng.choice('авеіоу') + text[position + 1:]
+
+
+def pairwise_scan(records, last_name, first_name, patronymic, birth_date, max_distance):
+    """Нечіткий пошук без індексу: Левенштейн з кожним записом бази"""
+    matches = []
+    for record in records:
+        distance = (levenshtein(normalize_text(last_name), normalize_text(record.last_name)) +
+                    levenshtein(normalize_text(first_name), normalize_text(record.first_name)) +
+                    levenshtein(normalize_text(patronymic), normalize_text(record.patronymic)))
+        if distance <= max_distance and record.birth_date == birth_date:
+            matches.append((distance, record))
+    return matches
+
+
+def bench_fuzzy(sizes, queries: int = 20, max_distance: int = FUZZY_MAX_DISTANCE):
+    """Затримка нечіткого пошуку по BK-деревах проти попарного Левенштейна"""
+    rng = random.Random(11)
+    for size in sizes:
+        records = generate_records(size)
+        search_queries = [(with_typo(query[0], rng),) + query[1:] for query in sample_queries(records, queries)]
+        dataset = Dataset(records)
+        del records
+
+        latencies = []
+        found = 0
+        for query in search_queries:
+            started = time.perf_counter()
+            found += bool(dataset.find_fuzzy(*query, max_distance=max_distance))
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+
+        # Попарне порівняння дуже повільне, тому міряємо на кількох запитах
+        started = time.perf_counter()
+        for query in search_queries[:2]:
+            pairwise_scan(dataset.records, *query, max_distance)
+        scan_time = (time.perf_counter() - started) / 2
+
+        print(f"📊 {size} записів: BK-дерево медіана {latencies[len(latencies) // 2] * 1000:.2f} мс, "
+              f"макс {latencies[-1] * 1000:.2f} мс (знайдено {found}/{len(search_queries)}), "
+              f"попарний Левенштейн {scan_time:.1f} с/запит")
+
+
+def bench_batch(size: int, rows: int, max_distance: int = FUZZY_MAX_DISTANCE):
+    """Пропускна здатність пакетної перевірки CSV (рядків за секунду)"""
+    records = generate_records(size)
+    queries = sample_queries(records, rows)
+    dataset = Dataset(records)
+    del records
+
+    upload = io.StringIO()
+    writer = csv.writer(upload)
+    writer.writerow(['Прізвище', "Ім'я", 'По-батькові', 'Дата народження'])
+    writer.writerows(queries)
+    text = upload.getvalue()
+
+    started = time.perf_counter()
+    header, columns, csv_rows = open_csv(text)
+    output = csv.writer(io.StringIO())
+    checked = 0
+    for chunk in iter_chunks(csv_rows):
+        results = check_chunk([dataset], chunk, columns, max_distance)
+        output.writerows(results)
+        checked += len(results)
+    elapsed = time.perf_counter() - started
+
+    print(f"📊 {size} записів у базі, {checked} рядків CSV (нечіткий пошук до {max_distance}): "
+          f"{elapsed:.2f} с, {checked / elapsed:.0f} рядків/с")
+
+
+def user_params(records, user_id):
+    record = records[user_id % len(records)]
+    return {
+        'first_name': record['FIRST_NAME_U'],
+        'last_name': record['LAST_NAME_U'],
+        'patronymic': record['MIDDLE_NAME_U'],
+        'birth_date': normalize_birth_date(record['BIRTH_DATE']),
+    }
+
+
+async def bench_persistence_async(users: int, batch: int, cache_size: int):
+    records = generate_records(1000)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'state.sqlite3')
+
+        # Запис: кожні batch користувачів — один цикл update_persistence
+        persistence = SQLitePersistence(path, cache_size=cache_size)
+        application = (Application.builder().token(BENCH_TOKEN).persistence(persistence)
+                       .concurrent_updates(PerUserUpdateProcessor()).build())
+        persistence.attach(application)
+        flush_times = []
+        for start in range(0, users, batch):
+            # Як Application: вивантажених користувачів persistence отримує в drop_user_data
+            await application.update_persistence()
+            for user_id in range(start, min(start + batch, users)):
+                # Запис у Application.user_data створюється при першому зверненні
+                user_data = application.user_data[user_id]
+                await persistence.refresh_user_data(user_id, user_data)
+                user_data['saved_params'] = user_params(records, user_id)
+                if user_id % 10 == 0:
+                    user_data['watchlist'] = [user_params(records, user_id + 1)]
+                await persistence.update_user_data(user_id, user_data)
+            started = time.perf_counter()
+            await persistence._flush()
+            flush_times.append(time.perf_counter() - started)
+        await application.update_persistence()
+        await persistence.flush()
+        flush_times.sort()
+        application_users = len(application.user_data)
+
+        # Старт: відкриття бази та читання всіх підписок; user_data не завантажується
+        started = time.perf_counter()
+        persistence = SQLitePersistence(path, cache_size=cache_size)
+        await persistence.get_user_data()
+        subscriptions = await persistence.get_user_values('watchlist')
+        startup_time = time.perf_counter() - started
+
+        # Ліниве завантаження при першому зверненні користувача
+        rng = random.Random(3)
+        started = time.perf_counter()
+        for _ in range(1000):
+            await persistence.refresh_user_data(rng.randrange(users), {})
+        lazy_time = (time.perf_counter() - started) / 1000
+        await persistence.flush()
+
+        print(f"📊 {users} користувачів, база {os.path.getsize(path) / 1024 / 1024:.1f} МБ:")
+        print(f"   запис пакета з {batch}: медіана {flush_times[len(flush_times) // 2] * 1000:.1f} мс, "
+              f"макс {flush_times[-1] * 1000:.1f} мс")
+        print(f"   користувачів у пам'яті Application: {application_users} (кеш {cache_size})")
+        print(f"   старт: {startup_time * 1000:.0f} мс (підписок: {len(subscriptions)})")
+        print(f"   ліниве завантаження користувача: {lazy_time * 1_000_000:.0f} мкс")
+
+
+def bench_persistence(users: int, batch: int, cache_size: int):
+    """Затримка запису та час старту SQLitePersistence"""
+    asyncio.run(bench_persistence_async(users, batch, cache_size))
+
+
+async def probe_client(port: int, seconds: float, connections: int):
+    """Keep-alive клієнти, що без пауз опитують /ready (кожен десятий запит — /metrics)"""
+    deadline = time.monotonic() + seconds
+    counts = []
+
+    async def worker():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        count = 0
+        while time.monotonic() < deadline:
+            path = '/metrics' if count % 10 == 9 else '/ready'
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line == b'\r\n':
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            count += 1
+        counts.append(count)
+        writer.close()
+
+    await asyncio.gather(*(worker() for _ in range(connections)))
+    print(json.dumps({'requests': sum(counts)}))
+
+
+async def search_load(dataset, queries, seconds: float, interval: float, until=None):
+    """
+    Пошуки з фіксованим темпом у циклі подій; затримка рахується від запланованого моменту.
+
+    Якщо задано until (future), пошуки йдуть, доки він не завершиться.
+    """
+    loop = asyncio.get_running_loop()
+    latencies = []
+    started = loop.time()
+    i = 0
+    while not until.done() if until is not None else loop.time() - started < seconds:
+        scheduled = started + i * interval
+        await asyncio.sleep(max(0, scheduled - loop.time()))
+        query = queries[i % len(queries)]
+        if not dataset.find(*query):
+            dataset.find_fuzzy(*query)
+        latencies.append(loop.time() - scheduled)
+        i += 1
+    latencies.sort()
+    return latencies
+
+
+async def bench_health_async(size: int, seconds: float, connections: int, interval: float):
+    records = generate_records(size)
+    queries = sample_queries(records, 200)
+    dataset = Dataset(records)
+    del records
+
+    def handler(path):
+        if path == '/metrics':
+            return 200, 'text/plain', render_metrics().encode('utf-8')
+        return 200, 'text/plain', b'Ready'
+
+    server = HealthServer(handler, '127.0.0.1', 0)
+    await server.start()
+    try:
+        for probes in (False, True):
+            client = None
+            if probes:
+                client = await asyncio.create_subprocess_exec(
+                    sys.executable, os.path.abspath(__file__), 'health-client', str(server.port),
+                    '--seconds', str(seconds), '--connections', str(connections),
+                    stdout=asyncio.subprocess.PIPE,
+                )
+            latencies = await search_load(dataset, queries, seconds, interval)
+            line = f"📊 пошуки {'з пробами' if probes else 'без проб'}: " \
+                   f"p50 {latencies[len(latencies) // 2] * 1000:.2f} мс, " \
+                   f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} мс"
+            if client is not None:
+                output, _ = await client.communicate()
+                requests = json.loads(output.decode().strip().splitlines()[-1])['requests']
+                line += f"; проби: {requests / seconds:.0f} запитів/с через {connections} keep-alive з'єднань"
+            print(line)
+    finally:
+        await server.stop()
+
+
+def bench_health(size: int, seconds: float, connections: int, interval: float):
+    """Пропускна здатність health сервера під час пошуків у тому ж циклі подій"""
+    asyncio.run(bench_health_async(size, seconds, connections, interval))
+
+
+def anonymous_memory_mb():
+    """Анонімна (приватна, не з файлів) пам'ять процесу в МБ; лише Linux"""
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+    except OSError:
+        return None
+    return int(fields['Anonymous'].split()[0]) / 1024
+
+
+def coldstart_child(directory, mode):
+    """Старт з диска в окремому процесі: час до першої відповіді та пам'ять"""
+    started = time.perf_counter()
+    store = SnapshotStore(directory)
+    dataset = store.open_index() if mode == 'mmap' else store.build_dataset()[0]
+    opened = time.perf_counter() - started
+    rng = random.Random(7)
+    people = [dataset.records[rng.randrange(len(dataset))] for _ in range(1000)]
+    first_started = time.perf_counter()
+    dataset.find(people[0].last_name, people[0].first_name, people[0].patronymic, people[0].birth_date)
+    first_query = time.perf_counter() - first_started
+    queries_started = time.perf_counter()
+    for person in people:
+        dataset.find(person.last_name, person.first_name, person.patronymic, person.birth_date)
+    print(json.dumps({
+        'mode': mode,
+        'records': len(dataset),
+        'open_seconds': opened,
+        'first_query_ms': first_query * 1000,
+        'query_us': (time.perf_counter() - queries_started) / len(people) * 1e6,
+        'anonymous_mb': anonymous_memory_mb(),
+    }))
+
+
+def bench_coldstart(size_mb: int):
+    """Холодний старт: парсинг JSON проти mmap готового індексу, кожен у новому процесі"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = SnapshotStore(directory)
+        write_dump(store.body_path, size_mb)
+        with open(store.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'sha256': 'benchmark'}, f)
+        store.build_index()
+        print(f"📊 {size_mb} МБ JSON, індекс {os.path.getsize(store.index_path) / 1024 / 1024:.0f} МБ")
+        for mode in ('parse', 'mmap'):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), 'coldstart-child', directory, mode],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            memory = result['anonymous_mb']
+            print(f"   {mode:6} {result['records']} записів: відкриття {result['open_seconds'] * 1000:.1f} мс, "
+                  f"перший пошук {result['first_query_ms']:.2f} мс, далі {result['query_us']:.0f} мкс/запит"
+                  + (f", анонімна пам'ять {memory:.0f} МБ" if memory is not None else ''))
+
+
+def latency_summary(latencies):
+    return (f"p50 {latencies[len(latencies) // 2] * 1000:.2f} мс, "
+            f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} мс, "
+            f"макс {latencies[-1] * 1000:.0f} мс")
+
+
+async def bench_refresh_async(size_mb: int, interval: float):
+    with tempfile.TemporaryDirectory() as directory:
+        store = SnapshotStore(directory)
+        write_dump(store.body_path, size_mb)
+        with open(store.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'sha256': 'benchmark'}, f)
+        dataset = store.load_dataset()
+        queries = sample_queries(list(store.read_records()), 200)
+        print(f"📊 {len(dataset)} записів ({size_mb} МБ JSON), пошук кожні {interval * 1000:.0f} мс")
+
+        latencies = await search_load(dataset, queries, 3, interval)
+        print(f"   без оновлення:            {latency_summary(latencies)}")
+        for label, process_pool in (('оновлення в потоці', False), ('оновлення в процесі', True)):
+            started = time.perf_counter()
+            refresh = asyncio.ensure_future(store.load_dataset_async(process_pool))
+            latencies = await search_load(dataset, queries, 0, interval, until=refresh)
+            await refresh
+            print(f"   {label + ':':26}{latency_summary(latencies)}; "
+                  f"оновлення {time.perf_counter() - started:.1f} с")
+        shutdown_build_pool()
+
+
+def bench_refresh(size_mb: int, interval: float):
+    """Затримка пошуків у циклі подій, поки будується новий знімок бази"""
+    asyncio.run(bench_refresh_async(size_mb, interval))
+
+
+BENCH_TOKEN = '123456:benchmark'
+
+# Ліміти відправки, які імітує FakeBotAPI: повідомлень/с загалом, у чат та сплеск у чат
+TELEGRAM_GLOBAL_LIMIT = 30
+TELEGRAM_CHAT_LIMIT = 1
+TELEGRAM_CHAT_BURST = 3
+
+
+def fake_updates(count: int, users: int):
+    """Текстові повідомлення від users користувачів; текст — порядковий номер у межах користувача"""
+    sequence = {}
+    updates = []
+    for update_id in range(1, count + 1):
+        user_id = 1000 + update_id % users
+        sequence[user_id] = sequence.get(user_id, -1) + 1
+        user = {'id': user_id, 'is_bot': False, 'first_name': 'Bench'}
+        updates.append({'update_id': update_id, 'message': {
+            'message_id': update_id, 'date': 0, 'chat': {'id': user_id, 'type': 'private'},
+            'from': user, 'text': str(sequence[user_id]),
+        }})
+    return updates
+
+
+class FakeBotAPI:
+    """
+    Локальний замінник Bot API: віддає підготовлені оновлення і відповідає із затримкою.
+
+    З flood_control відповідає 429 з retry_after, як Telegram, коли перевищено
+    ліміт відправки загалом або в один чат.
+    """
+
+    def __init__(self, updates, latency: float, flood_control: bool = False):
+        self.updates = updates
+        self.latency = latency
+        self.sent = 0
+        self.calls = 0
+        self.rejected = 0
+        # (chat_id, message_id) -> поточний текст повідомлення
+        self.texts = {}
+        self.flood_control = flood_control
+        self.global_bucket = TokenBucket(TELEGRAM_GLOBAL_LIMIT, TELEGRAM_GLOBAL_LIMIT)
+        self.chat_buckets = {}
+        self.done = asyncio.Event()
+        self.server = HealthServer(lambda path: (404, 'text/plain', b'Not Found'), '127.0.0.1', 0)
+        for method, handler in (('getMe', self.get_me), ('deleteWebhook', self.ok), ('setWebhook', self.ok),
+                                ('getUpdates', self.get_updates), ('sendMessage', self.send_message),
+                                ('editMessageText', self.edit_message_text)):
+            self.server.add_post_handler(f'/bot{BENCH_TOKEN}/{method}', handler)
+
+    @staticmethod
+    def _result(result):
+        return 200, 'application/json', json.dumps({'ok': True, 'result': result}).encode()
+
+    def _flood_wait(self, chat_id):
+        """Секунди retry_after, якщо запит у чат зараз перевищує ліміт, інакше 0"""
+        self.calls += 1
+        if not self.flood_control:
+            return 0
+        chat_bucket = self.chat_buckets.get(chat_id)
+        if chat_bucket is None:
+            chat_bucket = self.chat_buckets[chat_id] = TokenBucket(TELEGRAM_CHAT_LIMIT, TELEGRAM_CHAT_BURST)
+        wait = max(chat_bucket.wait_time(), self.global_bucket.wait_time())
+        if wait:
+            self.rejected += 1
+            return max(1, math.ceil(wait))
+        chat_bucket.try_take()
+        self.global_bucket.try_take()
+        return 0
+
+    @staticmethod
+    def _too_many_requests(retry_after):
+        return 429, 'application/json', json.dumps({
+            'ok': False, 'error_code': 429, 'description': f'Too Many Requests: retry after {retry_after}',
+            'parameters': {'retry_after': retry_after},
+        }).encode()
+
+    @staticmethod
+    def _params(body):
+        return {key: values[0] for key, values in urllib.parse.parse_qs(body.decode()).items()}
+
+    async def get_me(self, headers, body):
+        return self._result({'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'})
+
+    async def ok(self, headers, body):
+        return self._result(True)
+
+    async def get_updates(self, headers, body):
+        offset = max(1, int(self._params(body).get('offset', 1)))
+        batch = self.updates[offset - 1:offset + 99]
+        if not batch:
+            # Імітація long polling без нових оновлень
+            await asyncio.sleep(0.05)
+        return self._result(batch)
+
+    async def send_message(self, headers, body):
+        params = self._params(body)
+        chat_id = int(params['chat_id'])
+        if retry_after := self._flood_wait(chat_id):
+            return self._too_many_requests(retry_after)
+        await asyncio.sleep(self.latency)
+        self.sent += 1
+        if self.sent == len(self.updates):
+            self.done.set()
+        self.texts[chat_id, self.sent] = params['text']
+        return self._result({'message_id': self.sent, 'date': 0, 'text': params['text'],
+                             'chat': {'id': chat_id, 'type': 'private'}})
+
+    async def edit_message_text(self, headers, body):
+        params = self._params(body)
+        chat_id, message_id = int(params['chat_id']), int(params['message_id'])
+        if retry_after := self._flood_wait(chat_id):
+            return self._too_many_requests(retry_after)
+        await asyncio.sleep(self.latency)
+        self.texts[chat_id, message_id] = params['text']
+        return self._result({'message_id': message_id, 'date': 0, 'edit_date': 0, 'text': params['text'],
+                             'chat': {'id': chat_id, 'type': 'private'}})
+
+
+async def deliver_webhook(port: int, path: str, secret_token: str, updates, connections: int):
+    """
+    Доставка оновлень на webhook, як це робить Telegram: до connections запитів
+    одночасно, але наступне оновлення користувача — лише після відповіді на попереднє
+    """
+    by_user = {}
+    for update in updates:
+        by_user.setdefault(update['message']['from']['id'], []).append(update)
+    for pending in by_user.values():
+        pending.reverse()
+    ready = asyncio.Queue()
+    for user_id in by_user:
+        ready.put_nowait(user_id)
+    remaining = len(updates)
+
+    async def worker():
+        nonlocal remaining
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        while (user_id := await ready.get()) is not None:
+            body = json.dumps(by_user[user_id].pop()).encode()
+            writer.write(f'POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                         f'X-Telegram-Bot-Api-Secret-Token: {secret_token}\r\n'
+                         f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while (line := await reader.readline()) != b'\r\n':
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            if status != 200:
+                raise RuntimeError(f'webhook відповів {status}')
+            remaining -= 1
+            if by_user[user_id]:
+                ready.put_nowait(user_id)
+            if not remaining:
+                for _ in range(connections):
+                    ready.put_nowait(None)
+        writer.close()
+
+    await asyncio.gather(*(worker() for _ in range(connections)))
+
+
+async def run_updates_mode(mode: str, concurrency: int, count: int, users: int, latency: float):
+    updates = fake_updates(count, users)
+    api = FakeBotAPI(updates, latency)
+    await api.server.start()
+    bot_server = HealthServer(lambda path: (200, 'text/plain', b'OK'), '127.0.0.1', 0)
+    await bot_server.start()
+
+    application = (
+        Application.builder()
+        .token(BENCH_TOKEN)
+        .base_url(f'http://127.0.0.1:{api.server.port}/bot')
+        .request(HTTPXRequest(connection_pool_size=256))
+        .concurrent_updates(PerUserUpdateProcessor(concurrency))
+        .build()
+    )
+    order = {}
+
+    async def reply(update, context):
+        order.setdefault(update.effective_user.id, []).append(int(update.message.text))
+        await update.message.reply_text('✅')
+
+    application.add_handler(MessageHandler(filters.TEXT, reply))
+    webhook_url = f'http://127.0.0.1:{bot_server.port}' if mode == 'webhook' else ''
+    receiver = UpdateReceiver(application, bot_server, webhook_url=webhook_url, secret_token='benchmark')
+
+    async with application:
+        started = time.perf_counter()
+        await receiver.start()
+        await application.start()
+        if webhook_url:
+            await deliver_webhook(bot_server.port, WEBHOOK_PATH, receiver.secret_token, updates, 40)
+        await api.done.wait()
+        elapsed = time.perf_counter() - started
+        await receiver.stop()
+        await application.stop()
+
+    await bot_server.stop()
+    await api.server.stop()
+    ordered = all(sequence == sorted(sequence) for sequence in order.values())
+    return count / elapsed, ordered
+
+
+def bench_updates(count: int, users: int, latency: float, concurrency: int):
+    """Оновлень/с: послідовний polling проти паралельної обробки через polling та webhook"""
+    print(f"📊 {count} оновлень від {users} користувачів, затримка Bot API {latency * 1000:.0f} мс")
+    for mode, limit in (('polling', 1), ('polling', concurrency), ('webhook', concurrency)):
+        rate, ordered = asyncio.run(run_updates_mode(mode, limit, count, users, latency))
+        print(f"  {mode:8} паралельно {limit:4}: {rate:8.0f} оновлень/с, "
+              f"порядок для кожного користувача {'збережено' if ordered else 'ПОРУШЕНО'}")
+
+
+async def progress_session(bot, chat_id: int, edits: int, interval: float):
+    """
+    Як batch_check: повідомлення про прогрес, часті оновлення без очікування
+    відправки та фінальний текст. Повертає кількість оновлень прогресу, що завершились помилкою
+    """
+    message = await bot.send_message(chat_id, '⏳ Перевірено рядків: 0...')
+    tasks = []
+    try:
+        for step in range(1, edits + 1):
+            tasks.append(asyncio.create_task(
+                bot.edit_message_text(f'⏳ Перевірено рядків: {step * 1000}...', chat_id, message.message_id)))
+            await asyncio.sleep(interval)
+        await bot.edit_message_text('✅ Готово', chat_id, message.message_id)
+    finally:
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    return sum(isinstance(result, Exception) for result in results)
+
+
+async def cancelled_successor_session(bot, api, chat_id: int, timeout: float = 5):
+    """
+    Редагування, що чекає в черзі чату, замінює новіше, а те скасовують (напр. обробник
+    зупинено). Старіше має все одно дійти до Telegram, а не чекати вічно.
+    Повертає, чи дійшов його текст за timeout секунд
+    """
+    message = await bot.send_message(chat_id, '⏳ Перевірено рядків: 0...')
+    # Витрачаємо сплеск чату, щоб наступні редагування чекали токена в черзі
+    for step in range(1, CHAT_BURST):
+        await bot.edit_message_text(f'⏳ Перевірено рядків: {step * 1000}...', chat_id, message.message_id)
+    superseded = asyncio.create_task(bot.edit_message_text('✅ Готово', chat_id, message.message_id))
+    await asyncio.sleep(0.05)
+    successor = asyncio.create_task(bot.edit_message_text('⏳ Скасовано', chat_id, message.message_id))
+    await asyncio.sleep(0.05)
+    successor.cancel()
+    try:
+        await asyncio.wait_for(superseded, timeout)
+    except asyncio.TimeoutError:
+        return False
+    return api.texts[chat_id, message.message_id] == '✅ Готово'
+
+
+async def run_sends_mode(scheduled: bool, chats: int, edits: int, interval: float, latency: float):
+    api = FakeBotAPI([], latency, flood_control=True)
+    await api.server.start()
+    builder = (
+        Application.builder()
+        .token(BENCH_TOKEN)
+        .base_url(f'http://127.0.0.1:{api.server.port}/bot')
+        .request(HTTPXRequest(connection_pool_size=256))
+    )
+    if scheduled:
+        builder = builder.rate_limiter(MessageScheduler())
+    application = builder.build()
+
+    async with application:
+        api.calls = 0
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(progress_session(application.bot, 1000 + chat, edits, interval) for chat in range(chats)),
+            return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        final = sum(text == '✅ Готово' for text in api.texts.values())
+        resolved = await cancelled_successor_session(application.bot, api, 999) if scheduled else None
+
+    await api.server.stop()
+    failed = sum(isinstance(result, Exception) for result in results)
+    failed += sum(result for result in results if not isinstance(result, Exception))
+    return api.calls, api.rejected, failed, final, elapsed, resolved
+
+
+def bench_sends(chats: int, edits: int, interval: float, latency: float):
+    """Виклики Bot API, відповіді 429 та втрачені повідомлення: без планувальника проти MessageScheduler"""
+    print(f"📊 {chats} чатів одночасно: повідомлення, {edits} оновлень прогресу кожні "
+          f"{interval * 1000:.0f} мс і фінальний текст; ліміти {TELEGRAM_GLOBAL_LIMIT}/с загалом, "
+          f"{TELEGRAM_CHAT_LIMIT}/с у чат")
+    for scheduled in (False, True):
+        calls, rejected, failed, final, elapsed, resolved = asyncio.run(
+            run_sends_mode(scheduled, chats, edits, interval, latency))
+        print(f"  {'MessageScheduler' if scheduled else 'без планувальника':17}: {calls:5} викликів, "
+              f"{rejected:5} × 429, {failed:5} помилок, фінальний текст у {final}/{chats} чатах, {elapsed:6.1f} с")
+
+    # Без планувальника втрати очікувані; з ним — жодних
+    print(f"📊 Замінене редагування, чий наступник скасовано: {'надіслано' if resolved else 'НЕ НАДІСЛАНО'}")
+    if rejected or failed or final != chats or not resolved:
+        print("❌ MessageScheduler: очікувались 0 × 429, 0 помилок, фінальний текст у кожному чаті "
+              "та надіслане замінене редагування")
+        sys.exit(1)
+
+
+async def read_request_headers(reader):
+    """Пропускає рядок запиту і повертає заголовки (імена в нижньому регістрі)"""
+    await reader.readline()
+    headers = {}
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+class FlakyFileServer:
+    """
+    HTTP сервер одного файлу, що обриває кожну відповідь, передавши drop_fraction файлу.
+
+    Підтримує Range з If-Range по ETag (якщо ranges=True) та статично стиснену gzip
+    версію з власним ETag (якщо gzip=True); replace() підміняє файл новою версією.
+    """
+
+    def __init__(self, data: bytes, drop_fraction: float, ranges: bool = True, gzip: bool = False):
+        self.drop_fraction = drop_fraction
+        self.ranges = ranges
+        self.gzip = gzip
+        self.version = 0
+        self.replace(data)
+        self.requests = 0
+        self.sent = 0
+        self.server = None
+        self.port = None
+
+    def replace(self, data: bytes):
+        self.data = data
+        self.version += 1
+        self.etag = f'"v{self.version}"'
+        self.gzipped = gzip.compress(data, compresslevel=1) if self.gzip else None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        try:
+            headers = await read_request_headers(reader)
+            self.requests += 1
+
+            if self.gzip and 'gzip' in headers.get('accept-encoding', ''):
+                full, etag, extra = self.gzipped, self.etag[:-1] + '-gz"', 'Content-Encoding: gzip\r\n'
+            else:
+                full, etag, extra = self.data, self.etag, ''
+            status, body = '200 OK', full
+            requested = headers.get('range', '')
+            if self.ranges and requested.startswith('bytes=') and headers.get('if-range') == etag:
+                start = int(requested[6:].rstrip('-'))
+                status, body = '206 Partial Content', full[start:]
+                extra += f'Content-Range: bytes {start}-{len(full) - 1}/{len(full)}\r\n'
+
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Length: {len(body)}\r\nETag: {etag}\r\n'
+                         f'{"Accept-Ranges: bytes" if self.ranges else "Accept-Ranges: none"}\r\n{extra}'
+                         f'Connection: close\r\n\r\n'.encode())
+            chunk = body[:int(len(full) * self.drop_fraction)]
+            writer.write(chunk)
+            self.sent += len(chunk)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def run_download_mode(data: bytes, drop_fraction: float, ranges: bool, use_gzip: bool, change_after: int,
+                            timeout: float = 60):
+    server = FlakyFileServer(data, drop_fraction, ranges, use_gzip)
+    await server.start()
+    expected = data
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'dump.json')
+        async with httpx.AsyncClient(timeout=30) as client:
+            download = ResumableDownload(client, f'http://127.0.0.1:{server.port}/dump.json', path,
+                                         retries=3, retry_delay=0)
+            if change_after:
+                # Файл на сервері оновлюється, поки його докачують
+                expected = data.replace(b'"ID": "', b'"ID": "new-')
+                original_attempt = download._attempt
+
+                async def attempt(headers, offset):
+                    if server.requests == change_after:
+                        server.replace(expected)
+                    return await original_attempt(headers, offset)
+
+                download._attempt = attempt
+            started = time.perf_counter()
+            try:
+                # Обмеження часу: зациклене докачування має провалити перевірку, а не зависнути
+                await asyncio.wait_for(download.run(), timeout)
+                with open(path, 'rb') as f:
+                    result = 'файл збігається' if f.read() == expected else 'ФАЙЛ ПОШКОДЖЕНО'
+            except DownloadFailed:
+                result = 'не завантажено'
+            except asyncio.TimeoutError:
+                result = f'НЕ ЗАВЕРШЕНО за {timeout:.0f} с'
+            elapsed = time.perf_counter() - started
+    await server.stop()
+    return server.requests, server.sent, elapsed, result
+
+
+def bench_download(size_mb: int, drop_fraction: float):
+    """Докачування через Range проти завантаження з нуля на сервері, що обриває з'єднання"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'dump.json')
+        write_dump(path, size_mb)
+        with open(path, 'rb') as f:
+            data = f.read()
+    print(f"📊 Файл {len(data) / 1024 / 1024:.0f} МБ, сервер обриває кожну відповідь після "
+          f"{drop_fraction:.0%} файлу")
+    failed = []
+    for label, ranges, use_gzip, change_after in (
+            ('без Range (з нуля)', False, False, 0),
+            ('Range', True, False, 0),
+            ('gzip + Range', True, True, 0),
+            ('Range, файл змінено', True, False, 2)):
+        requests, sent, elapsed, result = asyncio.run(
+            run_download_mode(data, drop_fraction, ranges, use_gzip, change_after))
+        print(f"  {label:20}: {requests:3} запитів, передано {sent / 1024 / 1024:7.1f} МБ, "
+              f"{elapsed:6.2f} с, {result}")
+        # З Range файл має докачатися за ті самі спроби (а після зміни — бути новою версією);
+        # без Range обірване завантаження не докачується, це лише точка порівняння
+        if ranges and result != 'файл збігається':
+            failed.append(label)
+    if failed:
+        print(f"❌ Докачування не дало очікуваного файлу: {', '.join(failed)}")
+        sys.exit(1)
+
+
+class StallingServer:
+    """HTTP сервер одного файлу, що передає половину відповіді і зависає на stall секунд"""
+
+    def __init__(self, data: bytes, stall: float):
+        self.data = data
+        self.stall = stall
+        self.stalled = asyncio.Event()
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        try:
+            await read_request_headers(reader)
+            half = len(self.data) // 2
+            writer.write(f'HTTP/1.1 200 OK\r\nContent-Length: {len(self.data)}\r\nETag: "stall"\r\n'
+                         f'Connection: close\r\n\r\n'.encode() + self.data[:half])
+            await writer.drain()
+            self.stalled.set()
+            await asyncio.sleep(self.stall)
+            writer.write(self.data[half:])
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def bench_stall_async(size: int, stall: float, interval: float, max_latency: float):
+    # telegram_bot вимагає токен під час імпорту
+    os.environ.setdefault('BOT_TOKEN', BENCH_TOKEN)
+    import telegram_bot
+
+    with tempfile.TemporaryDirectory() as directory:
+        dump_path = os.path.join(directory, 'dump.json')
+        write_dump_records(dump_path, size)
+        with open(dump_path, 'rb') as f:
+            server = StallingServer(f.read(), stall)
+        await server.start()
+        cache = DatasetCache(f'http://127.0.0.1:{server.port}/dump.json', store=SnapshotStore(
+            os.path.join(directory, 'data')))
+        try:
+            fetch = asyncio.ensure_future(cache.get())
+            await server.stalled.wait()
+
+            # Поки завантаження стоїть, /start інших користувачів має відповідати одразу
+            latencies = []
+            while not fetch.done():
+                update = types.SimpleNamespace(message=FakeMessage())
+                context = types.SimpleNamespace(user_data={}, bot=types.SimpleNamespace(username='bench_bot'))
+                started = time.perf_counter()
+                await telegram_bot.start(update, context)
+                latencies.append(time.perf_counter() - started)
+                if len(update.message.replies) != 1:
+                    raise RuntimeError(f'start надіслав {len(update.message.replies)} повідомлень замість 1')
+                await asyncio.sleep(interval)
+            dataset = fetch.result()
+        finally:
+            await cache.aclose()
+            await server.stop()
+            shutdown_build_pool()
+
+    latencies.sort()
+    print(f"📊 Завантаження зависло на {stall:.1f} с: /start відповів {len(latencies)} разів, "
+          f"{latency_summary(latencies)}; після паузи завантажено {len(dataset)} записів")
+    # Кожні interval секунд — відповідь; блокуючий запит дав би одну-дві відповіді за всю паузу
+    failed = len(latencies) < stall / (interval * 2) or latencies[-1] > max_latency or len(dataset) != size
+    if failed:
+        print(f"❌ Обробники чекали на завантаження (очікувалось не менше {stall / (interval * 2):.0f} "
+              f"відповідей, кожна швидше {max_latency * 1000:.0f} мс)", file=sys.stderr)
+        sys.exit(1)
+
+
+def bench_stall(size: int, stall: float, interval: float, max_latency: float):
+    """Перевіряє, що інші обробники відповідають, поки завантаження бази зависло"""
+    asyncio.run(bench_stall_async(size, stall, interval, max_latency))
+
+
+class DumpServer:
+    """Локальний замінник data.gov.ua: віддає файл з диска з ETag і відповідає 304 на If-None-Match"""
+
+    def __init__(self, path):
+        self.path = path
+        stat = os.stat(path)
+        self.etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        try:
+            headers = await read_request_headers(reader)
+            if headers.get('if-none-match') == self.etag:
+                writer.write(f'HTTP/1.1 304 Not Modified\r\nETag: {self.etag}\r\nContent-Length: 0\r\n'
+                             f'Connection: close\r\n\r\n'.encode())
+            else:
+                writer.write(f'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {os.path.getsize(self.path)}\r\nETag: {self.etag}\r\n'
+                             f'Connection: close\r\n\r\n'.encode())
+                with open(self.path, 'rb') as f:
+                    while chunk := f.read(1024 * 1024):
+                        writer.write(chunk)
+                        await writer.drain()
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class FakeMessage:
+    """Замінник telegram.Message для perform_search: запам'ятовує відповіді замість відправки"""
+
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        self.replies.append(text)
+        return self
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def search_params(dataset, position, kind, rng):
+    """Параметри пошуку для запису: точний збіг, одрук у прізвищі або відсутня особа"""
+    person = dataset.records[position]
+    params = {'last_name': person.last_name, 'first_name': person.first_name,
+              'patronymic': person.patronymic, 'birth_date': person.birth_date}
+    if kind == 'typo':
+        params['last_name'] = with_typo(params['last_name'], rng)
+    elif kind == 'missing':
+        params['last_name'] += 'енко'
+    return params
+
+
+async def e2e_run(url: str, directory: str, queries: int):
+    # telegram_bot вимагає токен під час імпорту
+    os.environ.setdefault('BOT_TOKEN', BENCH_TOKEN)
+    import telegram_bot
+
+    result = {}
+    store = SnapshotStore(directory)
+    async with create_http_client() as client:
+        started = time.perf_counter()
+        validators = await store.downloader(client, url).run(store.conditional_headers())
+        await store.save_meta(validators)
+        result['download_s'] = time.perf_counter() - started
+
+        # Те саме, що робить робочий процес при оновленні бази (тут — у цьому процесі, заради пікового RSS)
+        result['parse_s'], result['index_s'] = store.build_index()
+        result['index_mb'] = os.path.getsize(store.index_path) / 1024 / 1024
+
+        started = time.perf_counter()
+        dataset = store.open_index()
+        result['open_ms'] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        if await download_dataset(client, url, store, reuse_loaded=True) is not None:
+            raise RuntimeError('очікувалась відповідь 304 на повторний запит')
+        result['refresh_304_ms'] = (time.perf_counter() - started) * 1000
+
+    federation.caches[store.name].snapshot = dataset
+    dataset.touch()
+    source = federation.sources[0]
+    rng = random.Random(7)
+    kinds = ('exact', 'typo', 'missing')
+    all_params = [search_params(dataset, position, kinds[i % len(kinds)], rng)
+                  for i, position in enumerate(rng.sample(range(len(dataset)), min(queries, len(dataset))))]
+
+    # Перший пошук за датою народження будує дерево нечіткого пошуку — це окрема метрика
+    cold_times = []
+    for params in all_params:
+        started = time.perf_counter()
+        telegram_bot.find_matches(dataset, params)
+        cold_times.append(time.perf_counter() - started)
+
+    match_times, render_times, search_times = [], [], []
+    found = 0
+    for params in all_params:
+        started = time.perf_counter()
+        matching, similar = telegram_bot.find_matches(dataset, params)
+        matched = time.perf_counter()
+        telegram_bot.render_result_message(params, [SourceResult(source, (matching, similar))])
+        match_times.append(matched - started)
+        render_times.append(time.perf_counter() - matched)
+        found += bool(matching)
+
+        # Повний шлях обробника: кеш відповідей, метрики, відповідь користувачу
+        update = types.SimpleNamespace(message=FakeMessage())
+        context = types.SimpleNamespace(user_data=dict(params))
+        started = time.perf_counter()
+        await telegram_bot.perform_search(update, context)
+        search_times.append(time.perf_counter() - started)
+        if len(update.message.replies) != 1:
+            raise RuntimeError(f'perform_search надіслав {len(update.message.replies)} повідомлень замість 1')
+
+    for name, times in (('cold_match', cold_times), ('match', match_times), ('render', render_times),
+                        ('search', search_times)):
+        result[f'{name}_p50_us'] = percentile(times, 0.5) * 1e6
+        result[f'{name}_p99_us'] = percentile(times, 0.99) * 1e6
+    result['records'] = len(dataset)
+    result['exact_found'] = found
+    result['serving_anon_mb'] = anonymous_memory_mb()
+    return result
+
+
+def calibration_ms(rounds: int = 5):
+    """
+    Час фіксованої роботи (нормалізація та відстань редагування, як у пошуку): мінімум
+    з rounds спроб. Показує швидкість самої машини, щоб відрізнити регресію коду від
+    повільнішого сусіда на спільному сервері
+    """
+    best = math.inf
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for i in range(2000):
+            normalize_text(f"Осауленко{i} Микита")
+            levenshtein(f"осауленко{i}", f"осавленко{i}")
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def e2e_child(url: str, directory: str, queries: int):
+    """Один розмір бази в окремому процесі, щоб піковий RSS не залежав від попередніх"""
+    result = asyncio.run(e2e_run(url, directory, queries))
+    result['peak_rss_mb'] = peak_rss_mb()
+    result['calibration_ms'] = calibration_ms()
+    print(json.dumps({key: round(value, 3) if isinstance(value, float) else value
+                      for key, value in result.items()}))
+
+
+async def run_e2e_size(dump_path: str, directory: str, queries: int):
+    server = DumpServer(dump_path)
+    await server.start()
+    try:
+        child = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), 'e2e-child',
+            f'http://127.0.0.1:{server.port}/mvswantedperson.json', directory, '--queries', str(queries),
+            stdout=asyncio.subprocess.PIPE,
+        )
+        output, _ = await child.communicate()
+    finally:
+        await server.stop()
+    if child.returncode:
+        raise RuntimeError(f'e2e-child завершився з кодом {child.returncode}')
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+# Метрики e2e, що перевіряються проти базового запуску (більше — гірше), та поріг шуму:
+# різницю, меншу за нього (в одиницях метрики), не вважаємо погіршенням навіть при великій
+# відносній зміні. p99 мікросекундних операцій на спільній машині скачуть у рази від запуску
+# до запуску, тож вони є у звіті, але не перевіряються
+E2E_GATES = {
+    'download_s': 0.1, 'parse_s': 0.1, 'index_s': 0.1, 'index_mb': 1, 'open_ms': 5, 'refresh_304_ms': 5,
+    'cold_match_p50_us': 50, 'match_p50_us': 20, 'render_p50_us': 20, 'search_p50_us': 50,
+    'serving_anon_mb': 10, 'peak_rss_mb': 20,
+}
+
+
+def find_regressions(results, baseline, tolerance: float):
+    """
+    Метрики, що погіршились більше ніж на tolerance (і більше за поріг шуму)
+    порівняно з базовим запуском того ж розміру. Метрики часу спершу зводяться
+    до швидкості машини базового запуску (див. calibration_ms)
+    """
+    previous = {result['records']: result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get(result['records'])
+        if old is None:
+            continue
+        speed = 1.0
+        if result.get('calibration_ms') and old.get('calibration_ms'):
+            speed = old['calibration_ms'] / result['calibration_ms']
+        for metric, noise in E2E_GATES.items():
+            current, expected = result.get(metric), old.get(metric)
+            if current is None or not expected:
+                continue
+            if metric.endswith(('_s', '_ms', '_us')):
+                current *= speed
+            if current > expected * (1 + tolerance) and current - expected > noise:
+                regressions.append({'records': result['records'], 'metric': metric,
+                                    'baseline': expected, 'current': round(current, 3)})
+    return regressions
+
+
+def median_result(runs):
+    """Медіана кожної метрики за кілька повторів (окремі запуски шумлять)"""
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def bench_e2e(sizes, queries: int, output: str, baseline: str, tolerance: float, repeats: int):
+    """
+    Наскрізний бенчмарк: генерація дампу, завантаження з локального сервера, парсинг,
+    індекс, 304 та пошуки через perform_search. Кожен розмір запускається repeats разів,
+    у звіт іде медіана. Людський звіт — у stderr, JSON — у output (або stdout); з baseline
+    код виходу 1, якщо щось погіршилось більше ніж на tolerance.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            dump_path = os.path.join(directory, 'dump.json')
+            write_dump_records(dump_path, size)
+            dump_mb = os.path.getsize(dump_path) / 1024 / 1024
+            runs = []
+            for _ in range(repeats):
+                # Кожен повтор — з порожнього каталогу, інакше завантаження закінчилося б на 304
+                data_directory = os.path.join(directory, f'data-{size}')
+                runs.append(asyncio.run(run_e2e_size(dump_path, data_directory, queries)))
+                shutil.rmtree(data_directory)
+            result = median_result(runs)
+            result['dump_mb'] = round(dump_mb, 1)
+            os.remove(dump_path)
+            results.append(result)
+            print(f"📊 {size} записів ({dump_mb:.0f} МБ): завантаження {result['download_s']:.2f} с, "
+                  f"парсинг {result['parse_s']:.2f} с, індекс {result['index_s']:.2f} с, "
+                  f"відкриття {result['open_ms']:.1f} мс, 304 {result['refresh_304_ms']:.1f} мс; "
+                  f"пошук p50/p99 {result['cold_match_p50_us']:.0f}/{result['cold_match_p99_us']:.0f} мкс "
+                  f"(повторний {result['match_p50_us']:.0f}/{result['match_p99_us']:.0f}), "
+                  f"відповідь {result['render_p50_us']:.0f}/{result['render_p99_us']:.0f} мкс, "
+                  f"perform_search {result['search_p50_us']:.0f}/{result['search_p99_us']:.0f} мкс; "
+                  f"піковий RSS {result['peak_rss_mb']:.0f} МБ", file=sys.stderr)
+
+    report = {
+        'benchmark': 'e2e',
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'queries': queries,
+        'repeats': repeats,
+        'results': results,
+    }
+    if baseline:
+        with open(baseline, encoding='utf-8') as f:
+            report['regressions'] = find_regressions(results, json.load(f), tolerance)
+        for regression in report['regressions']:
+            print(f"❌ {regression['records']} записів: {regression['metric']} "
+                  f"{regression['baseline']} → {regression['current']}", file=sys.stderr)
+    document = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(document + '\n')
+    else:
+        print(document)
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+# Той самий набір осіб у форматі іншого реєстру: інші назви полів, масив верхнього рівня, дата без часу
+MISSING_FIELDS = {
+    'last_name': ('surname',),
+    'first_name': ('name',),
+    'patronymic': ('middlename',),
+    'birth_date': ('birthday',),
+    'category': ('status',),
+    'ovd': ('region',),
+    'record_id': ('id',),
+}
+
+
+def iter_missing_records(count: int, seed: int = 43):
+    for record in iter_records(count, seed):
+        yield {
+            'id': f"m{record['ID']}",
+            'surname': record['LAST_NAME_U'],
+            'name': record['FIRST_NAME_U'],
+            'middlename': record['MIDDLE_NAME_U'],
+            'birthday': record['BIRTH_DATE'][:10],
+            'region': record['OVD'],
+            'status': 'Зник безвісти',
+        }
+
+
+def match_person(dataset, last_name, first_name, patronymic, birth_date):
+    """Те саме, що telegram_bot.find_matches: точний збіг, інакше схожі записи"""
+    matching = dataset.find(last_name, first_name, patronymic, birth_date)
+    similar = [] if matching else dataset.find_fuzzy(last_name, first_name, patronymic, birth_date)
+    return matching, similar
+
+
+async def run_federated_queries(sources_federation, queries):
+    """Запити через federation.search; повертає (загальні затримки, {джерело: затримки}, знайдено, недоступно)"""
+    totals, per_source = [], {}
+    found = unavailable = 0
+    for name, params in queries:
+        started = time.perf_counter()
+        results = await sources_federation.search(match_person, *params)
+        totals.append(time.perf_counter() - started)
+        for result in results:
+            per_source.setdefault(result.source.name, []).append(result.seconds)
+            if not result.ok:
+                unavailable += 1
+            elif result.source.name == name and result.value[0]:
+                found += 1
+    return totals, per_source, found, unavailable
+
+
+async def bench_sources_async(size: int, queries: int):
+    with tempfile.TemporaryDirectory() as directory:
+        dumps = {
+            'mvswantedperson': (iter_records(size), 'persons'),
+            'missing': (iter_missing_records(size), None),
+        }
+        servers = {}
+        for name, (records, records_key) in dumps.items():
+            _write_persons(os.path.join(directory, f'{name}.dump.json'), records, records_key=records_key)
+            servers[name] = DumpServer(os.path.join(directory, f'{name}.dump.json'))
+            await servers[name].start()
+        # Джерело, чий сервер не відповідає: порт вільний, з'єднання відхиляється
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            dead_port = probe.getsockname()[1]
+
+        live = [
+            DatasetSource('mvswantedperson', 'Розшукувані', f'http://127.0.0.1:{servers["mvswantedperson"].port}/a.json'),
+            DatasetSource('missing', 'Зниклі', f'http://127.0.0.1:{servers["missing"].port}/b.json',
+                          MISSING_FIELDS),
+        ]
+        offline = DatasetSource('offline', 'Недоступна', f'http://127.0.0.1:{dead_port}/c.json')
+        try:
+            live_federation = DatasetFederation(live, os.path.join(directory, 'data'))
+            rng = random.Random(7)
+            # Холодний старт: перший запит чекає лише на перше завантажене джерело,
+            # решта вантажаться паралельно; запити нижче меряються, коли готові всі
+            started = time.perf_counter()
+
+            async def load(name, cache):
+                await cache.get()
+                return f"{name} {time.perf_counter() - started:.2f} с"
+
+            loads = asyncio.gather(*(load(name, cache) for name, cache in live_federation.caches.items()))
+            await live_federation.search(match_person, 'Нема', 'Нема', 'Нема', '01.01.2000')
+            first = time.perf_counter() - started
+            per_source = ', '.join(await loads)
+            print(f"📊 Холодний старт {len(live)} джерел по {size} записів: перша відповідь за {first:.2f} с, "
+                  f"усі джерела за {time.perf_counter() - started:.2f} с ({per_source})")
+            # Пул одразу запускає новий робочий процес на заміну, і той кількасот мс імпортує модулі:
+            # на одному ядрі це мілісекундні паузи пошуку, тож меряємо вже без нього
+            shutdown_build_pool()
+
+            all_queries = []
+            for name, dataset in live_federation.snapshots.items():
+                for position in rng.sample(range(len(dataset)), min(queries // len(live), len(dataset))):
+                    person = dataset.records[position]
+                    all_queries.append((name, (person.last_name, person.first_name, person.patronymic,
+                                               person.birth_date)))
+            rng.shuffle(all_queries)
+            # Перший запит за датою народження будує дерево нечіткого пошуку (див. e2e) — тут меряємо повторні
+            await run_federated_queries(live_federation, all_queries)
+
+            for title, sources_federation in (('2 джерела', live_federation),
+                                              ('2 джерела + недоступне', DatasetFederation(
+                                                  live + [offline], os.path.join(directory, 'data')))):
+                for name, snapshot in live_federation.snapshots.items():
+                    sources_federation.caches[name].snapshot = snapshot
+                totals, per_source, found, unavailable = await run_federated_queries(sources_federation, all_queries)
+                latencies = ', '.join(f"{name} {percentile(times, 0.5) * 1e6:.0f}/{percentile(times, 0.99) * 1e6:.0f}"
+                                      for name, times in per_source.items())
+                print(f"📊 {title}: запит p50/p99 {percentile(totals, 0.5) * 1e6:.0f}/"
+                      f"{percentile(totals, 0.99) * 1e6:.0f} мкс; по джерелах (мкс) {latencies}; "
+                      f"знайдено у своєму джерелі {found}/{len(all_queries)}, відповідей без джерела {unavailable}")
+        finally:
+            for server in servers.values():
+                await server.stop()
+            shutdown_build_pool()
+
+
+def bench_sources(size: int, queries: int):
+    """
+    Кілька джерел у різних форматах JSON: холодний старт з паралельним завантаженням,
+    затримка запиту по кожному джерелу та відповідь, коли одне джерело недоступне
+    """
+    asyncio.run(bench_sources_async(size, queries))
+
+
+def prefix_scan(dataset, last_name, first_name, patronymic, birth_date, limit: int):
+    """Пошук за початком ПІБ без індексу: перебір усіх записів з нормалізацією кожного"""
+    query = (normalize_text(last_name), normalize_text(first_name), normalize_text(patronymic))
+    matches = []
+    for record in dataset.records:
+        if (normalize_text(record.last_name).startswith(query[0]) and
+                normalize_text(record.first_name).startswith(query[1]) and
+                normalize_text(record.patronymic).startswith(query[2]) and
+                record.birth_date.startswith(birth_date)):
+            matches.append(record)
+            if len(matches) >= limit:
+                break
+    return matches
+
+
+def typing_intervals(count: int, rng):
+    """Паузи між натисканнями (с): зазвичай 0.1-0.3 с, зрідка користувач зупиняється подумати"""
+    return [rng.uniform(0.5, 1.5) if rng.random() < 0.1 else max(0.05, rng.gauss(0.18, 0.06))
+            for _ in range(count)]
+
+
+def bench_inline(size: int, queries: int, debounce: float, scan_keystrokes: int):
+    """
+    Інлайн-режим: затримка пошуку на кожне натискання клавіші в mmap індексі,
+    повторний набір з кешу та скільки пошуків заощаджує debounce
+    """
+    os.environ.setdefault('BOT_TOKEN', BENCH_TOKEN)
+    from dataset import ResultCache
+    from telegram_bot import INLINE_MAX_RESULTS, parse_inline_query
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'dataset.idx')
+        started = time.perf_counter()
+        Dataset(iter_records(size)).save(path)
+        print(f"📊 Індекс {size} записів (з прізвищами за абеткою): {time.perf_counter() - started:.1f} с")
+        dataset = Dataset.open(path)
+        rng = random.Random(7)
+
+        keystrokes = []
+        for position in rng.sample(range(len(dataset)), queries):
+            person = dataset.records[position]
+            text = f"{person.last_name} {person.first_name} {person.patronymic} {person.birth_date}"
+            keystrokes.append((person, [text[:length] for length in range(1, len(text) + 1)]))
+
+        result_cache = ResultCache()
+        cold, cached = [], []
+        found = truncated_count = 0
+        for person, texts in keystrokes:
+            for text in texts:
+                params = parse_inline_query(text)
+                key = ('prefix',) + tuple(map(normalize_text, params[:3])) + params[3:]
+                started = time.perf_counter()
+                matches, truncated = dataset.find_prefix(*params, INLINE_MAX_RESULTS)
+                cold.append(time.perf_counter() - started)
+                truncated_count += truncated
+                if not truncated:
+                    result_cache.put(dataset.version, key, (matches, truncated))
+            found += any(match.record_id == person.record_id for match in matches)
+        for person, texts in keystrokes:
+            for text in texts:
+                params = parse_inline_query(text)
+                started = time.perf_counter()
+                key = ('prefix',) + tuple(map(normalize_text, params[:3])) + params[3:]
+                result_cache.get(dataset.version, key)
+                cached.append(time.perf_counter() - started)
+        cold.sort()
+        cached.sort()
+        print(f"📊 {len(cold)} натискань ({queries} запитів): пошук {latency_summary(cold)}; "
+              f"з кешу p50 {percentile(cached, 0.5) * 1e6:.1f} мкс, p99 {percentile(cached, 0.99) * 1e6:.1f} мкс")
+        print(f"📊 Повний запит знайшов особу: {found}/{queries}; перегляд обірвано "
+              f"(ліміт {PREFIX_SCAN_LIMIT} кандидатів) на {truncated_count} натисканнях")
+
+        # Debounce: пошук лише для натискань, після яких користувач не набирав debounce секунд
+        searched = 0
+        for _, texts in keystrokes:
+            intervals = typing_intervals(len(texts) - 1, rng)
+            searched += 1 + sum(interval >= debounce for interval in intervals)
+        total = sum(len(texts) for _, texts in keystrokes)
+        print(f"📊 Debounce {debounce * 1000:.0f} мс: {searched} пошуків замість {total} "
+              f"(-{(1 - searched / total) * 100:.0f}%)")
+
+        if scan_keystrokes:
+            person, texts = keystrokes[0]
+            sample = texts[::max(1, len(texts) // scan_keystrokes)][:scan_keystrokes]
+            scan, indexed = [], []
+            for text in sample:
+                params = parse_inline_query(text)
+                started = time.perf_counter()
+                prefix_scan(dataset, *params[:4], INLINE_MAX_RESULTS)
+                scan.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                dataset.find_prefix(*params, INLINE_MAX_RESULTS)
+                indexed.append(time.perf_counter() - started)
+            print(f"📊 Без індексу (перебір записів), {len(sample)} натискань: "
+                  f"середнє {sum(scan) / len(scan) * 1000:.1f} мс проти {sum(indexed) / len(indexed) * 1000:.3f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    index_parser = subparsers.add_parser('index', help='лінійний пошук проти індексу')
+    index_parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    index_parser.add_argument('--queries', type=int, default=20)
+
+    parse_parser = subparsers.add_parser('parse', help="піковий RSS json.load проти потокового парсингу")
+    parse_parser.add_argument('--size-mb', type=int, default=500)
+    parse_parser.add_argument('--modes', nargs='+', default=['full', 'streaming'], choices=['full', 'streaming'])
+
+    memory_parser = subparsers.add_parser('memory', help="пам'ять списку словників проти PersonRecord")
+    memory_parser.add_argument('--size', type=int, default=1_000_000)
+
+    fuzzy_parser = subparsers.add_parser('fuzzy', help='затримка нечіткого пошуку')
+    fuzzy_parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    fuzzy_parser.add_argument('--queries', type=int, default=20)
+    fuzzy_parser.add_argument('--max-distance', type=int, default=FUZZY_MAX_DISTANCE)
+
+    batch_parser = subparsers.add_parser('batch', help='пропускна здатність пакетної перевірки CSV')
+    batch_parser.add_argument('--size', type=int, default=1_000_000)
+    batch_parser.add_argument('--rows', type=int, default=100_000)
+    batch_parser.add_argument('--max-distance', type=int, default=FUZZY_MAX_DISTANCE)
+
+    persistence_parser = subparsers.add_parser('persistence', help='запис та старт SQLitePersistence')
+    persistence_parser.add_argument('--users', type=int, default=100_000)
+    persistence_parser.add_argument('--batch', type=int, default=1000)
+    persistence_parser.add_argument('--cache-size', type=int, default=10_000)
+
+    health_parser = subparsers.add_parser('health', help='проби health сервера під час пошуків')
+    health_parser.add_argument('--size', type=int, default=100_000)
+    health_parser.add_argument('--seconds', type=float, default=5)
+    health_parser.add_argument('--connections', type=int, default=8)
+    health_parser.add_argument('--interval', type=float, default=0.005, help='пауза між пошуками (с)')
+
+    health_client_parser = subparsers.add_parser('health-client')
+    health_client_parser.add_argument('port', type=int)
+    health_client_parser.add_argument('--seconds', type=float, default=5)
+    health_client_parser.add_argument('--connections', type=int, default=8)
+
+    updates_parser = subparsers.add_parser('updates', help='оновлень/с: polling проти webhook')
+    updates_parser.add_argument('--updates', type=int, default=1000)
+    updates_parser.add_argument('--users', type=int, default=100)
+    updates_parser.add_argument('--latency', type=float, default=0.05, help='затримка відповіді Bot API (с)')
+    updates_parser.add_argument('--concurrency', type=int, default=CONCURRENT_UPDATES)
+
+    sends_parser = subparsers.add_parser('sends', help='ліміти Telegram: 429 та злиття редагувань прогресу')
+    sends_parser.add_argument('--chats', type=int, default=50)
+    sends_parser.add_argument('--edits', type=int, default=10)
+    sends_parser.add_argument('--interval', type=float, default=0.1, help='пауза між оновленнями прогресу (с)')
+    sends_parser.add_argument('--latency', type=float, default=0.05, help='затримка відповіді Bot API (с)')
+
+    download_parser = subparsers.add_parser('download', help='докачування бази після обривів з\'єднання')
+    download_parser.add_argument('--size-mb', type=int, default=50)
+    download_parser.add_argument('--drop-fraction', type=float, default=0.3,
+                                 help='після якої частки файлу сервер обриває відповідь')
+
+    stall_parser = subparsers.add_parser('stall', help='обробники під час завислого завантаження бази')
+    stall_parser.add_argument('--size', type=int, default=10_000)
+    stall_parser.add_argument('--stall', type=float, default=3, help='на скільки зависає сервер (с)')
+    stall_parser.add_argument('--interval', type=float, default=0.05, help='пауза між /start (с)')
+    stall_parser.add_argument('--max-latency', type=float, default=0.1, help='найбільша допустима затримка /start (с)')
+
+    e2e_parser = subparsers.add_parser('e2e', help='наскрізний бенчмарк з JSON звітом і порівнянням з базовим')
+    e2e_parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    e2e_parser.add_argument('--queries', type=int, default=300)
+    e2e_parser.add_argument('--output', help='куди записати JSON звіт (типово stdout)')
+    e2e_parser.add_argument('--baseline', help='JSON звіт попереднього запуску для порівняння')
+    e2e_parser.add_argument('--tolerance', type=float, default=0.3,
+                            help='допустиме погіршення метрики (частка) порівняно з baseline')
+    e2e_parser.add_argument('--repeats', type=int, default=3, help='скільки разів запускати кожен розмір (медіана)')
+
+    e2e_child_parser = subparsers.add_parser('e2e-child')
+    e2e_child_parser.add_argument('url')
+    e2e_child_parser.add_argument('directory')
+    e2e_child_parser.add_argument('--queries', type=int, default=300)
+
+    sources_parser = subparsers.add_parser('sources', help='пошук у кількох джерелах бази одночасно')
+    sources_parser.add_argument('--size', type=int, default=100_000, help='записів у кожному джерелі')
+    sources_parser.add_argument('--queries', type=int, default=300)
+
+    inline_parser = subparsers.add_parser('inline', help='інлайн-режим: пошук на кожне натискання клавіші')
+    inline_parser.add_argument('--size', type=int, default=1_000_000)
+    inline_parser.add_argument('--queries', type=int, default=200)
+    inline_parser.add_argument('--debounce', type=float, default=0.3, help='INLINE_DEBOUNCE (с)')
+    inline_parser.add_argument('--scan-keystrokes', type=int, default=5,
+                               help='скільки натискань порівняти з перебором без індексу (0 — не порівнювати)')
+
+    refresh_parser = subparsers.add_parser('refresh', help='затримка пошуків під час оновлення бази')
+    refresh_parser.add_argument('--size-mb', type=int, default=100)
+    refresh_parser.add_argument('--interval', type=float, default=0.005, help='пауза між пошуками (с)')
+
+    coldstart_parser = subparsers.add_parser('coldstart', help='старт з диска: парсинг JSON проти mmap індексу')
+    coldstart_parser.add_argument('--size-mb', type=int, default=100)
+
+    coldstart_child_parser = subparsers.add_parser('coldstart-child')
+    coldstart_child_parser.add_argument('directory')
+    coldstart_child_parser.add_argument('mode', choices=('parse', 'mmap'))
+
+    child_parser = subparsers.add_parser('parse-child')
+    child_parser.add_argument('path')
+    child_parser.add_argument('mode')
+
+    args = parser.parse_args()
+    if args.command == 'index':
+        bench_index(args.sizes, args.queries)
+    elif args.command == 'parse':
+        bench_parse(args.size_mb, args.modes)
+    elif args.command == 'memory':
+        bench_memory(args.size)
+    elif args.command == 'fuzzy':
+        bench_fuzzy(args.sizes, args.queries, args.max_distance)
+    elif args.command == 'batch':
+        bench_batch(args.size, args.rows, args.max_distance)
+    elif args.command == 'persistence':
+        bench_persistence(args.users, args.batch, args.cache_size)
+    elif args.command == 'health':
+        bench_health(args.size, args.seconds, args.connections, args.interval)
+    elif args.command == 'health-client':
+        asyncio.run(probe_client(args.port, args.seconds, args.connections))
+    elif args.command == 'updates':
+        bench_updates(args.updates, args.users, args.latency, args.concurrency)
+    elif args.command == 'sends':
+        bench_sends(args.chats, args.edits, args.interval, args.latency)
+    elif args.command == 'download':
+        bench_download(args.size_mb, args.drop_fraction)
+    elif args.command == 'stall':
+        bench_stall(args.size, args.stall, args.interval, args.max_latency)
+    elif args.command == 'e2e':
+        bench_e2e(args.sizes, args.queries, args.output, args.baseline, args.tolerance, args.repeats)
+    elif args.command == 'e2e-child':
+        e2e_child(args.url, args.directory, args.queries)
+    elif args.command == 'sources':
+        bench_sources(args.size, args.queries)
+    elif args.command == 'inline':
+        bench_inline(args.size, args.queries, args.debounce, args.scan_keystrokes)
+    elif args.command == 'refresh':
+        bench_refresh(args.size_mb, args.interval)
+    elif args.command == 'coldstart':
+        bench_coldstart(args.size_mb)
+    elif args.command == 'coldstart-child':
+        coldstart_child(args.directory, args.mode)
+    elif args.command == 'parse-child':
+        parse_child(args.path, args.mode)
+
+
+if __name__ == '__main__':
+    main()
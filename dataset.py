@@ -0,0 +1,1324 @@
+# -*- coding: utf-8 -*-
+"""
+Завантаження та кешування бази розшукуваних осіб МВС
+"""
+
+import asyncio
+import bisect
+import hashlib
+import itertools
+import json
+import mmap
+import multiprocessing
+import os
+import re
+import sys
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import httpx
+
+from download import DownloadFailed, ResumableDownload
+from metrics import DOWNLOAD_SECONDS, INDEX_BUILD_SECONDS, PARSE_SECONDS, REFRESHES
+
+JSON_URL = "https://data.gov.ua/dataset/59ecf2ab-47a1-4fae-a63c-fe5007d68130/resource/9694e34c-92a5-4839-91df-c32850db7ba9/download/mvswantedperson_1.json"
+
+# Як часто оновлювати базу у фоні (секунди)
+DATASET_TTL = int(os.getenv('DATASET_TTL', 3600))
+
+# Куди зберігати останню завантажену копію бази
+DATA_DIR = os.getenv('DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+
+# Скільки обривів поспіль без жодного нового байта терпіти (спроби, що щось докачали, не рахуються)
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_TIMEOUT = 180  # 3 хвилини
+RETRY_DELAY = 3  # Перша пауза перед повтором, далі подвоюється
+
+# Обмеження кількості одночасних з'єднань до data.gov.ua
+MAX_CONNECTIONS = int(os.getenv('MAX_CONNECTIONS', 4))
+
+# Потоковий парсинг (запис за записом) замість json.load всього файлу
+STREAMING_PARSE = os.getenv('STREAMING_PARSE', '1') != '0'
+
+# Парсинг і побудова індексу в окремому процесі, щоб не займати GIL циклу подій бота
+PROCESS_POOL = os.getenv('PROCESS_POOL', '1') != '0'
+
+# Назви полів дампу МВС для кожного поля PersonRecord: береться перше непорожнє
+# (українська версія з _U, далі старіші назви)
+MVS_FIELDS = {
+    'last_name': ('LAST_NAME_U', 'LAST_NAME', 'OVDSURNAME'),
+    'first_name': ('FIRST_NAME_U', 'FIRST_NAME', 'OVD'),
+    'patronymic': ('MIDDLE_NAME_U', 'PATRONYMIC', 'OVDPATRONYMIC'),
+    'birth_date': ('BIRTH_DATE', 'BIRTHDAY'),
+    'category': ('CATEGORY',),
+    'restraint': ('RESTRAINT',),
+    'article': ('ARTICLE_CRIM',),
+    'ovd': ('OVD',),
+    'record_id': ('ID',),
+}
+
+
+def field_keys(fields):
+    """Усі назви полів JSON, які потрібні для відповідності fields (без повторів)"""
+    return tuple(dict.fromkeys(key for keys in fields.values() for key in keys))
+
+
+def mapping_digest(fields, records_key):
+    """Відбиток того, як читаються записи джерела (fields та records_key)"""
+    mapping = {'fields': {field: list(keys) for field, keys in fields.items()}, 'records_key': records_key}
+    return hashlib.sha256(json.dumps(mapping, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# Поля записів, які бот використовує для пошуку та відповіді
+RECORD_FIELDS = field_keys(MVS_FIELDS)
+
+PARSE_CHUNK_SIZE = 1024 * 1024
+
+# Допустима сумарна кількість помилок у ПІБ для нечіткого пошуку (0 вимикає його)
+FUZZY_MAX_DISTANCE = int(os.getenv('FUZZY_MAX_DISTANCE', 2))
+
+# Скільки готових відповідей на повторні запити тримати в пам'яті
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', 10000))
+
+# Пошук по мірі набору (інлайн-режим): скільки записів повертати та скільки кандидатів
+# переглядати найбільше (короткий префікс з рідкісним фільтром інакше обходив би пів бази;
+# 5000 кандидатів — близько 20 мс роботи в циклі подій)
+PREFIX_RESULTS = 20
+PREFIX_SCAN_LIMIT = 5000
+
+# Бінарний файл індексу: сигнатура та версія формату (змінюється разом зі структурою Dataset)
+INDEX_MAGIC = b'MVSIDX\r\n'
+INDEX_FORMAT = 2
+# Секції, без яких знімок не відкрити (див. Dataset._sections)
+INDEX_SECTIONS = ('strings', 'string_offsets', 'columns', 'surnames', 'surname_offsets',
+                  *(f'{name}.{part}' for name in ('index', 'by_last_name', 'by_birth_date')
+                    for part in ('starts', 'hashes', 'positions')),
+                  'identities', 'years', 'year_starts', 'year_positions')
+
+
+class SnapshotStore:
+    """Копія бази на диску разом з валідаторами HTTP (ETag / Last-Modified)"""
+
+    def __init__(self, directory: str = DATA_DIR, name: str = 'mvswantedperson',
+                 fields: dict = MVS_FIELDS, records_key: str = 'persons'):
+        self.name = name
+        # Як читати записи саме цього джерела (див. DatasetSource)
+        self.fields = fields
+        self.records_key = records_key
+        # Індекс, зібраний за іншою відповідністю полів, не підходить навіть для того самого файлу
+        self.mapping = mapping_digest(fields, records_key)
+        self.body_path = os.path.join(directory, f'{name}.json')
+        self.meta_path = os.path.join(directory, f'{name}.meta.json')
+        # Готовий індекс для mmap: після рестарту не треба парсити JSON
+        self.index_path = os.path.join(directory, f'{name}.idx')
+
+    def exists(self):
+        return os.path.exists(self.body_path) and os.path.exists(self.meta_path)
+
+    def load_meta(self):
+        """Повертає збережені валідатори або порожній словник"""
+        if not self.exists():
+            return {}
+        try:
+            with open(self.meta_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def conditional_headers(self):
+        """Заголовки для умовного запиту до сервера"""
+        meta = self.load_meta()
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def downloader(self, client: httpx.AsyncClient, url: str):
+        """Завантаження в body_path; недокачаний файл лежить поруч (.part) до наступної спроби"""
+        return ResumableDownload(client, url, self.body_path, DOWNLOAD_RETRIES, RETRY_DELAY)
+
+    async def save_meta(self, validators: dict):
+        """Записує валідатори щойно завантаженої копії та її SHA-256 (версію знімка)"""
+        meta = {
+            'etag': validators.get('etag'),
+            'last_modified': validators.get('last_modified'),
+            'sha256': await asyncio.to_thread(_file_sha256, self.body_path),
+            'saved_at': time.time(),
+        }
+        with open(self.meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(self.meta_path + '.tmp', self.meta_path)
+
+    def read_records(self, streaming: bool = STREAMING_PARSE):
+        """Парсить збережену копію бази, залишаючи лише потрібні боту поля"""
+        keys = field_keys(self.fields)
+        if streaming:
+            return iter_json_records(self.body_path, keys, self.records_key)
+
+        with open(self.body_path, 'rb') as f:
+            data = json.load(f)
+
+        # Перевіряємо чи це масив чи об'єкт
+        records = data if isinstance(data, list) else data.get(self.records_key, [])
+        return [slim_record(record, keys) for record in records if isinstance(record, dict)]
+
+    def build_dataset(self):
+        """
+        Парсить збережену копію та одразу будує з неї індекс (блокуючий виклик).
+
+        Повертає (Dataset, час парсингу, час побудови індексу); виконується і в
+        робочому процесі, тому метрики записує той, хто викликав.
+        """
+        started = time.perf_counter()
+        # При потоковому парсингу він чергується з побудовою індексу, тому час парсингу сумуємо окремо
+        parse_time = [0.0]
+        records = _timed(self.read_records, parse_time)
+        dataset = Dataset(_timed_iter(records, parse_time), version=self.load_meta().get('sha256'),
+                          fields=self.fields, mapping=self.mapping)
+        return dataset, parse_time[0], time.perf_counter() - started - parse_time[0]
+
+    def build_index(self):
+        """Будує індекс і записує його у index_path; повертає (час парсингу, час побудови індексу)"""
+        dataset, parse_time, index_time = self.build_dataset()
+        dataset.save(self.index_path)
+        return parse_time, index_time
+
+    def open_index(self):
+        """
+        Відкриває збережений індекс через mmap, якщо він зібраний з поточної копії бази
+        за поточною відповідністю полів, інакше None
+        """
+        version = self.load_meta().get('sha256')
+        if not version or not os.path.exists(self.index_path):
+            return None
+        try:
+            dataset = Dataset.open(self.index_path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Не вдалося відкрити індекс бази: {e}")
+            return None
+        return dataset if dataset.version == version and dataset.mapping == self.mapping else None
+
+    def load_dataset(self):
+        """Парсить збережену копію та будує індекс у поточному процесі (блокуючий виклик)"""
+        dataset, parse_time, index_time = self.build_dataset()
+        PARSE_SECONDS.observe(parse_time)
+        INDEX_BUILD_SECONDS.observe(index_time)
+        dataset.save(self.index_path)
+        return dataset
+
+    async def load_dataset_async(self, process_pool: bool = PROCESS_POOL):
+        """
+        Парсить копію та будує індекс, не блокуючи цикл подій.
+
+        Робочий процес записує індекс у файл, а бот лише відкриває його через mmap:
+        між процесами не передається жодних даних, крім шляху.
+        """
+        if not process_pool:
+            return await asyncio.to_thread(self.load_dataset)
+        loop = asyncio.get_running_loop()
+        try:
+            parse_time, index_time = await loop.run_in_executor(_build_pool(), self.build_index)
+        except BrokenProcessPool:
+            # Робочий процес аварійно завершився (напр. через нестачу пам'яті): наступна спроба створить новий
+            shutdown_build_pool()
+            raise
+        PARSE_SECONDS.observe(parse_time)
+        INDEX_BUILD_SECONDS.observe(index_time)
+        return Dataset.open(self.index_path)
+
+
+_pool = None
+
+
+def _build_pool():
+    """
+    Пул з одного процесу для побудови знімків.
+
+    Процес запускається (spawn) на кожну побудову і завершується після неї,
+    щоб пам'ять, зайнята парсингом, поверталася системі.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                                    max_tasks_per_child=1)
+    return _pool
+
+
+def shutdown_build_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _timed(function, elapsed):
+    started = time.perf_counter()
+    try:
+        return function()
+    finally:
+        elapsed[0] += time.perf_counter() - started
+
+
+def _timed_iter(iterable, elapsed):
+    """Ітерує iterable, додаючи до elapsed[0] час, витрачений на отримання елементів"""
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            elapsed[0] += time.perf_counter() - started
+        yield item
+
+
+def slim_record(record, fields=RECORD_FIELDS):
+    """Залишає в записі лише поля, які використовує бот"""
+    return {field: record[field] for field in fields if record.get(field) is not None}
+
+
+class _JSONStream:
+    """Буфер над файлом, з якого значення JSON декодуються по одному"""
+
+    def __init__(self, f, chunk_size: int = PARSE_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Дочитує наступний шматок файлу; повертає False в кінці файлу"""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Відкидаємо вже оброблену частину, щоб буфер не ріс
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Повертає наступний непробільний символ (або '' в кінці файлу)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Очікувався один із символів {chars!r}", self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Декодує наступне значення JSON, дочитуючи файл за потреби"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Число на межі буфера може продовжуватись у наступному шматку
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def array(self):
+        """Ітерує елементи масиву, на початку якого стоїть потік"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+
+def iter_json_records(path, fields=RECORD_FIELDS, records_key: str = 'persons'):
+    """
+    Потоково читає дамп (масив або об'єкт з масивом під ключем records_key) запис за записом.
+
+    У пам'яті одночасно тримається лише поточний шматок файлу та один запис.
+    """
+    with open(path, encoding='utf-8') as f:
+        stream = _JSONStream(f)
+        if stream.peek() == '[':
+            items = stream.array()
+        else:
+            items = _iter_key(stream, records_key)
+        for record in items:
+            if isinstance(record, dict):
+                yield slim_record(record, fields)
+
+
+def _iter_key(stream, records_key):
+    """Шукає ключ records_key у об'єкті верхнього рівня, пропускаючи інші значення"""
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        key = stream.value()
+        stream.expect(':')
+        if key == records_key:
+            yield from stream.array()
+            return
+        stream.value()
+        if stream.expect(',}') == '}':
+            return
+
+
+def create_http_client():
+    """HTTP клієнт з обмеженим пулом з'єднань"""
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(DOWNLOAD_TIMEOUT, connect=30),
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+        follow_redirects=True,
+    )
+
+
+async def download_dataset(client: httpx.AsyncClient, url: str = JSON_URL,
+                           store: SnapshotStore = None, reuse_loaded: bool = False):
+    """
+    Асинхронно завантажує базу (з докачуванням після обривів) і повертає Dataset.
+
+    Якщо сервер відповів 304, використовується копія з диска; при reuse_loaded=True
+    повертається None, бо знімок у пам'яті вже актуальний.
+    """
+    store = store or SnapshotStore()
+    started = time.perf_counter()
+    try:
+        validators = await store.downloader(client, url).run(store.conditional_headers())
+    except DownloadFailed as e:
+        raise Exception(f"Не вдалося завантажити базу: {e}")
+    if validators is None:
+        return None if reuse_loaded else await store.load_dataset_async()
+    DOWNLOAD_SECONDS.observe(time.perf_counter() - started)
+    await store.save_meta(validators)
+
+    # Парсинг і побудова індексу виконуються в окремому процесі, щоб не зупиняти цикл подій
+    return await store.load_dataset_async()
+
+
+# Різні види апострофів (після NFKC) зводяться до стандартного
+APOSTROPHES = str.maketrans({"’": "'", "`": "'", "ʼ": "'", "‘": "'", "´": "'", "ъ": "'"})
+
+# Латинські літери, схожі на кириличні, та російські варіанти українських літер
+HOMOGLYPHS = str.maketrans({
+    'a': 'а', 'b': 'в', 'c': 'с', 'e': 'е', 'h': 'н', 'i': 'і', 'k': 'к', 'm': 'м',
+    'o': 'о', 'p': 'р', 't': 'т', 'x': 'х', 'y': 'у',
+    'ё': 'е', 'ы': 'и', 'э': 'е',
+})
+
+# Офіційна транслітерація (постанова КМУ №55 від 27.01.2010)
+KMU_2010 = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'h', 'ґ': 'g', 'д': 'd', 'е': 'e', 'є': 'ie',
+    'ж': 'zh', 'з': 'z', 'и': 'y', 'і': 'i', 'ї': 'i', 'й': 'i', 'к': 'k', 'л': 'l',
+    'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ь': '', 'ю': 'iu',
+    'я': 'ia', "'": '',
+})
+# Винятки: літери на початку слова та сполучення "зг"
+KMU_2010_SPECIAL = {'є': 'ye', 'ї': 'yi', 'й': 'y', 'ю': 'yu', 'я': 'ya', 'зг': 'zgh'}
+KMU_2010_SPECIAL_RE = re.compile(r"(?<![\w'])[єїйюя]|зг")
+
+CYRILLIC_RE = re.compile('[а-яіїєґё]')
+
+ISO_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def normalize_text(text):
+    """
+    Нормалізує текст: NFKC, прибирає пробіли, приводить до lower case, нормалізує апострофи.
+
+    У кириличному тексті латинські двійники літер замінюються на кириличні,
+    латинський текст приводиться до вигляду транслітерації КМУ-2010.
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize('NFKC', text).strip().lower().translate(APOSTROPHES)
+    if CYRILLIC_RE.search(text):
+        return text.translate(HOMOGLYPHS)
+    return transliterate(text)
+
+
+def transliterate(text):
+    """Транслітерує нормалізований український текст латиницею за правилами КМУ-2010"""
+    text = KMU_2010_SPECIAL_RE.sub(lambda match: KMU_2010_SPECIAL[match.group()], text)
+    return text.translate(KMU_2010)
+
+
+def normalize_birth_date(birth_date_raw):
+    """
+    Приводить дату народження до формату вводу користувача.
+
+    Формат у JSON: "1991-04-30T00:00:00" (в інших наборах даних також "1991-04-30"),
+    формат вводу: "30.04.1991"
+    """
+    if not birth_date_raw:
+        return ""
+    if 'T' not in birth_date_raw and not ISO_DATE_RE.fullmatch(birth_date_raw):
+        return birth_date_raw
+    # Витягуємо тільки дату (без часу)
+    birth_date_parts = birth_date_raw.split('T')[0]  # "1991-04-30"
+    try:
+        year, month, day = birth_date_parts.split('-')
+    except ValueError:
+        return birth_date_raw
+    return f"{day}.{month}.{year}"
+
+
+def field_value(record, keys):
+    """Перше непорожнє значення з полів keys (рядком) або ''"""
+    for key in keys:
+        value = record.get(key)
+        if value:
+            return value if isinstance(value, str) else str(value)
+    return ''
+
+
+def record_fields(record, fields=MVS_FIELDS):
+    """Повертає (прізвище, ім'я, по-батькові, дата народження) запису з урахуванням різних назв полів"""
+    return (
+        field_value(record, fields.get('last_name', ())),
+        field_value(record, fields.get('first_name', ())),
+        field_value(record, fields.get('patronymic', ())),
+        normalize_birth_date(field_value(record, fields.get('birth_date', ()))),
+    )
+
+
+def birth_year(birth_date):
+    """Рік народження (int) з дати у форматі ДД.ММ.РРРР або 0, якщо його немає"""
+    year = birth_date[-4:]
+    return int(year) if len(birth_date) == 10 and year.isdigit() else 0
+
+
+def _intern(value):
+    """Інтернує рядок, щоб однакові значення в різних записах займали пам'ять один раз"""
+    return sys.intern(value) if value else ''
+
+
+class PersonRecord:
+    """Компактний запис бази: лише поля, які бот використовує для пошуку та відповіді"""
+
+    __slots__ = ('last_name', 'first_name', 'patronymic', 'birth_date',
+                 'category', 'restraint', 'article', 'ovd', 'record_id')
+
+    def __init__(self, last_name, first_name, patronymic, birth_date,
+                 category='', restraint='', article='', ovd='', record_id=''):
+        self.last_name = last_name
+        self.first_name = first_name
+        self.patronymic = patronymic
+        self.birth_date = birth_date
+        self.category = category
+        self.restraint = restraint
+        self.article = article
+        self.ovd = ovd
+        self.record_id = record_id
+
+    @classmethod
+    def from_dict(cls, record, fields=MVS_FIELDS):
+        """Створює запис з елемента дампу; fields — назви полів джерела (див. MVS_FIELDS)"""
+        last_name, first_name, patronymic, birth_date = record_fields(record, fields)
+        # Прізвища майже унікальні, тому їх не інтернуємо; решта полів часто повторюється
+        return cls(
+            last_name,
+            _intern(first_name),
+            _intern(patronymic),
+            _intern(birth_date),
+            _intern(field_value(record, fields.get('category', ()))),
+            _intern(field_value(record, fields.get('restraint', ()))),
+            _intern(field_value(record, fields.get('article', ()))),
+            _intern(field_value(record, fields.get('ovd', ()))),
+            field_value(record, fields.get('record_id', ())),
+        )
+
+    @property
+    def identity(self):
+        """Ідентифікатор запису для порівняння знімків: ID з дампу або ПІБ і дата народження"""
+        return self.record_id or (self.last_name, self.first_name, self.patronymic, self.birth_date)
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    def __repr__(self):
+        return f"PersonRecord({self.last_name!r}, {self.first_name!r}, {self.patronymic!r}, {self.birth_date!r})"
+
+
+# Кількість полів PersonRecord (стовпців RecordTable)
+RECORD_COLUMNS = len(PersonRecord.__slots__)
+
+
+def search_key(last_name, first_name, patronymic, birth_date):
+    """Ключ індексу: нормалізовані прізвище, ім'я, по-батькові та дата народження"""
+    return (
+        normalize_text(last_name),
+        normalize_text(first_name),
+        normalize_text(patronymic),
+        birth_date.strip(),
+    )
+
+
+def levenshtein(a, b):
+    """Відстань редагування (вставка, видалення, заміна символу) між двома рядками"""
+    if a == b:
+        return 0
+    # Спільні початок і кінець (часто "-енко", "-ович") не змінюють відстань
+    limit = min(len(a), len(b))
+    prefix = 0
+    while prefix < limit and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+    a = a[prefix:len(a) - suffix]
+    b = b[prefix:len(b) - suffix]
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        distance = i
+        for j, char_b in enumerate(b):
+            # min(вставка, видалення, заміна) без виклику min() у гарячому циклі
+            distance += 1
+            deletion = previous[j + 1] + 1
+            if deletion < distance:
+                distance = deletion
+            substitution = previous[j] + (char_a != char_b)
+            if substitution < distance:
+                distance = substitution
+            current.append(distance)
+        previous = current
+    return previous[-1]
+
+
+class BKTree:
+    """
+    BK-дерево над рядками з метрикою Левенштейна.
+
+    Пошук у радіусі k відкидає піддерева за нерівністю трикутника,
+    тому порівнюється лише невелика частина слів.
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, word, item):
+        # Вузол: [слово, значення, {відстань: дочірній вузол}]
+        if self.root is None:
+            self.root = [word, item, {}]
+            return
+        node = self.root
+        while True:
+            distance = levenshtein(word, node[0])
+            if distance == 0:
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [word, item, {}]
+                return
+            node = child
+
+    def search(self, word, max_distance):
+        """Повертає [(відстань, значення)] для всіх слів на відстані не більше max_distance"""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = levenshtein(word, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[1]))
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+
+def transliterate_key(key):
+    """Вторинний ключ індексу: ПІБ ключа латиницею, дата народження без змін"""
+    return transliterate(key[0]), transliterate(key[1]), transliterate(key[2]), key[3]
+
+
+def _hash(text):
+    """Стабільний між процесами 64-бітний хеш рядка (вбудований hash() у кожному процесі інший)"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _key_hash(key):
+    return _hash('\x1f'.join(key))
+
+
+class StringTable:
+    """Рядки, записані підряд в одному UTF-8 буфері; рядок i — data[offsets[i]:offsets[i + 1]]"""
+
+    def __init__(self, data=b'', offsets=None):
+        self.data = data
+        self.offsets = offsets if offsets is not None else array('I', [0])
+
+    @classmethod
+    def from_strings(cls, strings):
+        """Таблиця з рядків strings у тому ж порядку"""
+        parts = [string.encode('utf-8') for string in strings]
+        offsets = array('I', [0])
+        for data in parts:
+            offsets.append(offsets[-1] + len(data))
+        return cls(b''.join(parts), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+
+class RecordTable:
+    """
+    Записи бази по стовпцях: номери рядків StringTable, по RECORD_COLUMNS на запис.
+
+    PersonRecord створюється лише для записів, до яких звертаються.
+    """
+
+    def __init__(self, strings: StringTable, columns):
+        self.strings = strings
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns) // RECORD_COLUMNS
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self)
+        start = position * RECORD_COLUMNS
+        if not 0 <= start < len(self.columns):
+            raise IndexError('record index out of range')
+        strings = self.strings
+        return PersonRecord(*[strings[i] for i in self.columns[start:start + RECORD_COLUMNS]])
+
+    def __iter__(self):
+        return (self[position] for position in range(len(self)))
+
+    def field(self, position, column):
+        """Одне поле запису (номер стовпця як у PersonRecord.__slots__) без створення PersonRecord"""
+        return self.strings[self.columns[position * RECORD_COLUMNS + column]]
+
+
+class HashPostings:
+    """
+    Незмінний мультисловник 64-бітний хеш -> номери записів у трьох плоских масивах.
+
+    Пари згруповано за кошиками (молодші біти хешу), як рядки CSR матриці:
+    кошик b займає [starts[b], starts[b + 1]). Хеш може збігтися в різних
+    ключів, тому знайдені записи перевіряє той, хто шукає.
+    """
+
+    @classmethod
+    def from_buffers(cls, starts, hashes, positions):
+        """Відновлює готову таблицю (напр. з mmap) без перебудови"""
+        postings = cls.__new__(cls)
+        postings.starts = starts
+        postings.hashes = hashes
+        postings.positions = positions
+        postings.mask = len(starts) - 2
+        return postings
+
+    def __init__(self, hashes: array, positions: array):
+        size = 1
+        while size < len(hashes):
+            size <<= 1
+        self.mask = mask = size - 1
+        starts = array('I', bytes(4 * (size + 1)))
+        for key_hash in hashes:
+            starts[(key_hash & mask) + 1] += 1
+        for bucket in range(size):
+            starts[bucket + 1] += starts[bucket]
+        free = array('I', starts)
+        self.starts = starts
+        self.hashes = array('Q', bytes(8 * len(hashes)))
+        self.positions = array('I', bytes(4 * len(hashes)))
+        for key_hash, position in zip(hashes, positions):
+            bucket = key_hash & mask
+            slot = free[bucket]
+            free[bucket] = slot + 1
+            self.hashes[slot] = key_hash
+            self.positions[slot] = position
+
+    def get(self, key_hash):
+        """Номери записів з таким хешем (у порядку додавання)"""
+        bucket = key_hash & self.mask
+        hashes = self.hashes
+        return [self.positions[slot] for slot in range(self.starts[bucket], self.starts[bucket + 1])
+                if hashes[slot] == key_hash]
+
+
+# Версії для знімків, зібраних не з файлу (тести, бенчмарки)
+_local_versions = itertools.count(1)
+
+
+class Dataset:
+    """
+    Знімок бази: записи, індекси для пошуку та час завантаження.
+
+    Усе зберігається в плоских буферах (bytes та array) без об'єкта на кожен запис
+    чи ключ. Буфери записуються у файл індексу (save) і відкриваються через mmap
+    (open): знімок готовий до пошуку за мілісекунди, а кілька процесів бота на
+    одному сервері ділять ті самі сторінки кешу файлової системи.
+    """
+
+    def __init__(self, records, version: str = None, fields: dict = MVS_FIELDS, mapping: str = None):
+        # Версія змінюється лише разом із вмістом бази (SHA-256 завантаженого файлу)
+        self.version = version or f'local-{next(_local_versions)}'
+        # Відбиток відповідності полів, за якою зібрано знімок (див. SnapshotStore)
+        self.mapping = mapping
+        string_ids = {}
+        string_parts = []
+        string_offsets = array('I', [0])
+        string_size = 0
+        columns = array('I')
+        # Пари (хеш, номер запису) для індексів: повний ключ, прізвище, дата народження
+        key_hashes, key_positions = array('Q'), array('I')
+        name_hashes, name_positions = array('Q'), array('I')
+        date_hashes = array('Q')
+        # Для порівняння знімків: хеш ID запису (або ПІБ і дати, якщо ID немає)
+        self.identities = array('Q')
+        # Номери записів за роком народження (для пошуку за неповними даними)
+        self.by_birth_year = {}
+        # Імена та по-батькові часто повторюються: нормалізуємо кожне значення один раз
+        names = {}
+        # Різні нормалізовані прізвища (кирилицею та латиницею) для пошуку за початком
+        surnames = set()
+        # records може бути генератором (потоковий парсинг): індекс будується по ходу читання
+        for position, record in enumerate(records):
+            person = PersonRecord.from_dict(record, fields)
+            values = person.__getstate__()
+            for value in values:
+                string_id = string_ids.get(value)
+                if string_id is None:
+                    data = value.encode('utf-8')
+                    string_parts.append(data)
+                    string_size += len(data)
+                    string_offsets.append(string_size)
+                    string_id = string_ids[value] = len(string_parts) - 1
+                columns.append(string_id)
+
+            last_name = normalize_text(person.last_name)
+            first_name, first_name_latin = names.get(person.first_name) or self._name_keys(names, person.first_name)
+            patronymic, patronymic_latin = names.get(person.patronymic) or self._name_keys(names, person.patronymic)
+            birth_date = person.birth_date.strip()
+            key = (last_name, first_name, patronymic, birth_date)
+            # Латиницею, щоб запит будь-якою абеткою знаходився одним зверненням до індексу
+            latin_key = (transliterate(last_name), first_name_latin, patronymic_latin, birth_date)
+            for indexed_key in {key, latin_key}:
+                key_hashes.append(_key_hash(indexed_key))
+                key_positions.append(position)
+            for name in {last_name, latin_key[0]}:
+                name_hashes.append(_hash(name))
+                name_positions.append(position)
+                surnames.add(name)
+            date_hashes.append(_hash(birth_date))
+            self.by_birth_year.setdefault(birth_year(birth_date), array('I')).append(position)
+            self.identities.append(_hash(person.record_id or '\x1f'.join(values[:4])))
+
+        del string_ids
+        self.records = RecordTable(StringTable(b''.join(string_parts), string_offsets), columns)
+        self.index = HashPostings(key_hashes, key_positions)
+        self.by_last_name = HashPostings(name_hashes, name_positions)
+        self.by_birth_date = HashPostings(date_hashes, array('I', range(len(date_hashes))))
+        # Відсортовані за абеткою: записи з прізвищами на заданий початок — суцільний діапазон
+        surnames.discard('')
+        self.surnames = StringTable.from_strings(sorted(surnames))
+        self._fuzzy_trees = {}
+        self.loaded_at = time.time()
+
+    @staticmethod
+    def _name_keys(names, name):
+        """Нормалізоване значення поля та його транслітерація"""
+        normalized = normalize_text(name)
+        names[name] = keys = (normalized, transliterate(normalized))
+        return keys
+
+    def _sections(self):
+        """Буфери знімка у порядку запису у файл: (назва, тип елементів array, буфер)"""
+        years = array('I', sorted(self.by_birth_year))
+        year_starts = array('I', [0])
+        year_positions = array('I')
+        for year in years:
+            year_positions.extend(self.by_birth_year[year])
+            year_starts.append(len(year_positions))
+        sections = [
+            ('strings', 'B', self.records.strings.data),
+            ('string_offsets', 'I', self.records.strings.offsets),
+            ('columns', 'I', self.records.columns),
+            ('surnames', 'B', self.surnames.data),
+            ('surname_offsets', 'I', self.surnames.offsets),
+        ]
+        for name in ('index', 'by_last_name', 'by_birth_date'):
+            postings = getattr(self, name)
+            sections += [(f'{name}.starts', 'I', postings.starts), (f'{name}.hashes', 'Q', postings.hashes),
+                         (f'{name}.positions', 'I', postings.positions)]
+        sections += [
+            ('identities', 'Q', self.identities),
+            ('years', 'I', years),
+            ('year_starts', 'I', year_starts),
+            ('year_positions', 'I', year_positions),
+        ]
+        return sections
+
+    def save(self, path):
+        """
+        Атомарно записує знімок у бінарний файл індексу.
+
+        Формат: INDEX_MAGIC, довжина заголовка (4 байти little-endian), JSON заголовок
+        з версіями та зміщеннями секцій, далі секції, вирівняні по 8 байт.
+        """
+        sections = self._sections()
+        layout = []
+        offset = 0
+        for name, typecode, buffer in sections:
+            size = memoryview(buffer).nbytes
+            layout.append({'name': name, 'typecode': typecode, 'offset': offset, 'size': size})
+            offset += (size + 7) // 8 * 8
+        header = json.dumps({
+            'format': INDEX_FORMAT,
+            'version': self.version,
+            'mapping': self.mapping,
+            'byteorder': sys.byteorder,
+            'itemsizes': {typecode: array(typecode).itemsize for typecode in 'IQ'},
+            'sections': layout,
+        }).encode('utf-8')
+        # Дані починаються з позиції, кратної 8, щоб масиви були вирівняні
+        data_start = (len(INDEX_MAGIC) + 4 + len(header) + 7) // 8 * 8
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(INDEX_MAGIC + len(header).to_bytes(4, 'little') + header)
+            for (name, typecode, buffer), section in zip(sections, layout):
+                f.seek(data_start + section['offset'])
+                f.write(buffer)
+            f.truncate(data_start + offset)
+            # Інакше після збою живлення під новою назвою може опинитися недописаний файл
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path):
+        """Відкриває файл індексу через mmap (лише читання); ValueError, якщо формат не підходить"""
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError(f'{path}: не файл індексу бази')
+        header_start = len(INDEX_MAGIC) + 4
+        header_size = int.from_bytes(mapped[len(INDEX_MAGIC):header_start], 'little')
+        if header_start + header_size > len(mapped):
+            raise ValueError(f'{path}: файл індексу обрізаний')
+        header = json.loads(mapped[header_start:header_start + header_size])
+        itemsizes = {typecode: array(typecode).itemsize for typecode in 'IQ'}
+        if (not isinstance(header, dict) or header.get('format') != INDEX_FORMAT
+                or header.get('byteorder') != sys.byteorder or header.get('itemsizes') != itemsizes):
+            raise ValueError(f'{path}: несумісна версія формату індексу')
+
+        view = memoryview(mapped)
+        data_start = (header_start + header_size + 7) // 8 * 8
+        buffers = {}
+        try:
+            for section in header['sections']:
+                # Обрізаний чи пошкоджений файл: cast() і доступ до записів падали б з іншими винятками
+                start = data_start + section['offset']
+                typecode = section['typecode']
+                itemsize = 1 if typecode == 'B' else itemsizes.get(typecode)
+                if (itemsize is None or section['offset'] % 8 or section['size'] < 0
+                        or section['size'] % itemsize or start + section['size'] > len(mapped)):
+                    raise ValueError(f"{path}: пошкоджена секція {section['name']} файлу індексу")
+                buffer = view[start:start + section['size']]
+                buffers[section['name']] = buffer if typecode == 'B' else buffer.cast(typecode)
+        except (KeyError, TypeError) as e:
+            raise ValueError(f'{path}: пошкоджений заголовок файлу індексу ({e!r})')
+        missing = [name for name in INDEX_SECTIONS if name not in buffers]
+        if missing:
+            raise ValueError(f"{path}: у файлі індексу немає секцій {', '.join(missing)}")
+
+        dataset = cls.__new__(cls)
+        dataset.version = header['version']
+        dataset.mapping = header.get('mapping')
+        dataset.records = RecordTable(StringTable(buffers['strings'], buffers['string_offsets']), buffers['columns'])
+        dataset.surnames = StringTable(buffers['surnames'], buffers['surname_offsets'])
+        for name in ('index', 'by_last_name', 'by_birth_date'):
+            setattr(dataset, name, HashPostings.from_buffers(
+                buffers[f'{name}.starts'], buffers[f'{name}.hashes'], buffers[f'{name}.positions']))
+        dataset.identities = buffers['identities']
+        year_starts, year_positions = buffers['year_starts'], buffers['year_positions']
+        dataset.by_birth_year = {year: year_positions[year_starts[i]:year_starts[i + 1]]
+                                 for i, year in enumerate(buffers['years'])}
+        dataset._fuzzy_trees = {}
+        dataset.loaded_at = time.time()
+        return dataset
+
+    def __len__(self):
+        return len(self.records)
+
+    def touch(self):
+        """Позначає знімок як щойно перевірений (сервер відповів 304)"""
+        self.loaded_at = time.time()
+
+    @property
+    def age(self):
+        """Вік знімка в секундах"""
+        return time.time() - self.loaded_at
+
+    def _record_key(self, person):
+        return search_key(person.last_name, person.first_name, person.patronymic, person.birth_date)
+
+    def _find_key(self, key):
+        matches = []
+        for position in self.index.get(_key_hash(key)):
+            person = self.records[position]
+            person_key = self._record_key(person)
+            if person_key == key or transliterate_key(person_key) == key:
+                matches.append(person)
+        return matches
+
+    def find(self, last_name, first_name, patronymic, birth_date):
+        """Повертає всі записи (PersonRecord) з повним збігом 4 параметрів"""
+        key = search_key(last_name, first_name, patronymic, birth_date)
+        # Поля, введені різними абетками, збігаються за транслітерацією
+        return self._find_key(key) or self._find_key(transliterate_key(key))
+
+    def _fuzzy_tree(self, birth_date, latin):
+        """
+        BK-дерево прізвищ осіб з даною датою народження (будується при першому запиті).
+
+        Кириличні та латинські ключі в окремих деревах: запит порівнюється лише зі своєю абеткою.
+        """
+        tree = self._fuzzy_trees.get((birth_date, latin))
+        if tree is None:
+            keys_by_last_name = {}
+            for position in self.by_birth_date.get(_hash(birth_date)):
+                key = self._record_key(self.records[position])
+                if key[3] != birth_date:
+                    continue
+                for indexed_key in {key, transliterate_key(key)}:
+                    if (CYRILLIC_RE.search(indexed_key[0]) is None) == latin:
+                        keys = keys_by_last_name.setdefault(indexed_key[0], {})
+                        keys.setdefault(indexed_key, []).append(position)
+            tree = BKTree()
+            for last_name, keys in keys_by_last_name.items():
+                tree.add(last_name, keys)
+            self._fuzzy_trees[(birth_date, latin)] = tree
+        return tree
+
+    def find_fuzzy(self, last_name, first_name, patronymic, birth_date, max_distance=FUZZY_MAX_DISTANCE):
+        """
+        Нечіткий пошук: дата народження збігається точно, а сумарна відстань
+        редагування прізвища, імені та по-батькові не перевищує max_distance.
+
+        Повертає [(відстань, PersonRecord)], найближчі записи першими.
+        """
+        query = search_key(last_name, first_name, patronymic, birth_date)
+        candidates = []
+        tree = self._fuzzy_tree(query[3], CYRILLIC_RE.search(query[0]) is None)
+        for last_name_distance, keys in tree.search(query[0], max_distance):
+            for key, positions in keys.items():
+                distance = last_name_distance + levenshtein(query[1], key[1])
+                if distance > max_distance:
+                    continue
+                distance += levenshtein(query[2], key[2])
+                if distance <= max_distance:
+                    candidates.extend((distance, self.records[position]) for position in positions)
+        candidates.sort(key=lambda candidate: candidate[0])
+        return candidates
+
+    def _last_name_positions(self, name):
+        """Номери записів з нормалізованим прізвищем name (кирилицею чи латиницею), за зростанням"""
+        positions = []
+        for position in self.by_last_name.get(_hash(name)):
+            last_name = normalize_text(self.records.field(position, 0))
+            if last_name == name or transliterate(last_name) == name:
+                positions.append(position)
+        return positions
+
+    def find_partial(self, last_name, birth_date='', year_from=None, year_to=None):
+        """
+        Пошук за прізвищем та датою народження або діапазоном років народження.
+
+        Перетинає списки записів з індексів прізвищ і років, обходячи коротший з них.
+        """
+        name = normalize_text(last_name)
+        positions = self._last_name_positions(name) or self._last_name_positions(transliterate(name))
+        birth_date = birth_date.strip()
+        if birth_date:
+            return [self.records[i] for i in positions if self.records.field(i, 3) == birth_date]
+        if year_from is None and year_to is None:
+            return [self.records[i] for i in positions]
+
+        years = {year: postings for year, postings in self.by_birth_year.items()
+                 if year and (year_from is None or year >= year_from) and (year_to is None or year <= year_to)}
+        if len(positions) <= sum(len(postings) for postings in years.values()):
+            matches = [i for i in positions if birth_year(self.records.field(i, 3)) in years]
+        else:
+            wanted = set(positions)
+            matches = sorted(i for postings in years.values() for i in postings if i in wanted)
+        return [self.records[i] for i in matches]
+
+    def _surnames_with_prefix(self, prefix):
+        """Нормалізовані прізвища (кирилицею чи латиницею), що починаються з prefix, за абеткою"""
+        surnames = self.surnames
+        start = bisect.bisect_left(surnames, prefix)
+        end = bisect.bisect_left(surnames, prefix + '\U0010ffff', start)
+        return (surnames[i] for i in range(start, end))
+
+    def find_prefix(self, last_name, first_name='', patronymic='', birth_date='', complete=0,
+                    limit=PREFIX_RESULTS, scan_limit=PREFIX_SCAN_LIMIT):
+        """
+        Пошук по мірі набору: поля ПІБ — за початком (кирилицею чи латиницею),
+        дата народження — за початком ДД.ММ.РРРР або року.
+
+        Перші complete полів ПІБ набрані повністю і мають збігатися точно.
+        Повертає (до limit записів за абеткою прізвищ, чи перегляд обірвано):
+        якщо кандидатів більше за scan_limit, а limit збігів серед них не набралося,
+        за межею можуть бути й інші збіги — порожній список тоді не означає «не знайдено».
+        """
+        query = (normalize_text(last_name), normalize_text(first_name), normalize_text(patronymic))
+        if not query[0]:
+            return [], False
+        latin = [CYRILLIC_RE.search(value) is None for value in query]
+        birth_date = birth_date.strip()
+        if len(birth_date) == 10:
+            # Повна дата відсікає найбільше: кандидати — з індексу дат
+            candidates = self.by_birth_date.get(_hash(birth_date))
+        elif complete:
+            candidates = self.by_last_name.get(_hash(query[0]))
+        else:
+            candidates = (position for name in self._surnames_with_prefix(query[0])
+                          for position in self.by_last_name.get(_hash(name)))
+
+        records = self.records
+        # Сире значення поля -> (нормалізоване, транслітероване); імена повторюються
+        names = {}
+        matches = []
+        for scanned, position in enumerate(candidates):
+            if scanned == scan_limit:
+                return matches, True
+            date = records.field(position, 3)
+            if birth_date and not (date.startswith(birth_date) or date[6:].startswith(birth_date)):
+                continue
+            for column, value in enumerate(query):
+                if not value:
+                    continue
+                raw = records.field(position, column)
+                keys = names.get(raw) or self._name_keys(names, raw)
+                field = keys[1] if latin[column] else keys[0]
+                if not (field == value if column < complete else field.startswith(value)):
+                    break
+            else:
+                matches.append(records[position])
+                if len(matches) >= limit:
+                    break
+        return matches, False
+
+
+class ResultCache:
+    """
+    LRU кеш готових відповідей на пошук для однієї версії бази.
+
+    Щойно приходить запит до іншої версії, усі відповіді попередньої відкидаються.
+    """
+
+    def __init__(self, size: int = RESULT_CACHE_SIZE):
+        self.size = size
+        self.version = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _check_version(self, version):
+        if version != self.version:
+            self.entries.clear()
+            self.version = version
+
+    def get(self, version, key):
+        self._check_version(version)
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, version, key, value):
+        self._check_version(version)
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def diff_datasets(old, new):
+    """Повертає (додані, видалені) записи нового знімка порівняно зі старим"""
+    old_identities = set(old.identities)
+    new_identities = set(new.identities)
+    added = [new.records[i] for i, identity in enumerate(new.identities) if identity not in old_identities]
+    removed = [old.records[i] for i, identity in enumerate(old.identities) if identity not in new_identities]
+    return added, removed
+
+
+class DatasetCache:
+    """
+    Спільний для всього процесу кеш бази одного джерела (див. sources.DatasetFederation).
+
+    Пошук завжди читає останній успішний знімок і не чекає на оновлення.
+    Одночасні запити під час холодного старту чекають на одне спільне завантаження.
+    """
+
+    def __init__(self, url: str = JSON_URL, ttl: int = DATASET_TTL, store: SnapshotStore = None):
+        self.url = url
+        self.ttl = ttl
+        self.store = store or SnapshotStore()
+        self.snapshot = None
+        self._inflight = None
+        self._client = None
+        self._refresh_task = None
+        self._listeners = []
+
+    @property
+    def is_stale(self):
+        return self.snapshot is None or self.snapshot.age >= self.ttl
+
+    async def get(self):
+        """Повертає актуальний знімок; чекає лише якщо знімка ще немає"""
+        if self.snapshot is None:
+            return await self.refresh()
+        if self.is_stale:
+            # Застарілий знімок віддаємо одразу, оновлюємо у фоні
+            self._start_refresh()
+        return self.snapshot
+
+    async def refresh(self):
+        """Оновлює знімок; паралельні виклики ділять одне завантаження"""
+        return await asyncio.shield(self._start_refresh())
+
+    def _start_refresh(self):
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(self._load())
+            self._inflight.add_done_callback(self._log_failure)
+        return self._inflight
+
+    def _log_failure(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ Не вдалося оновити базу {self.store.name}: {task.exception()}")
+
+    @property
+    def client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = create_http_client()
+        return self._client
+
+    def on_update(self, listener):
+        """Реєструє корутину listener(old, new), яку викликають після заміни знімка новим"""
+        self._listeners.append(listener)
+
+    def start(self):
+        """Запускає фонове оновлення бази"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.run_refresh_loop())
+
+    async def aclose(self):
+        """Зупиняє фонове оновлення, скасовує завантаження та закриває HTTP з'єднання і пул процесів"""
+        for task in (self._refresh_task, self._inflight):
+            if task is not None and not task.done():
+                task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+        shutdown_build_pool()
+
+    async def _load(self):
+        started = time.monotonic()
+        try:
+            dataset = await download_dataset(self.client, self.url, self.store, self.snapshot is not None)
+        except Exception:
+            REFRESHES.inc(label='failed')
+            raise
+        if dataset is None:
+            REFRESHES.inc(label='not_modified')
+            self.snapshot.touch()
+            print(f"📦 База {self.store.name} не змінилася (304), використовую поточний знімок")
+            return self.snapshot
+        REFRESHES.inc(label='updated')
+        previous, self.snapshot = self.snapshot, dataset
+        print(f"📦 Базу {self.store.name} оновлено: {len(dataset)} записів за {time.monotonic() - started:.1f} с")
+        if previous is not None:
+            for listener in self._listeners:
+                try:
+                    await listener(previous, dataset)
+                except Exception as e:
+                    # Помилка обробника не повинна скасовувати оновлення бази
+                    print(f"⚠️ Помилка обробника оновлення бази: {e}")
+        return self.snapshot
+
+    async def load_from_disk(self):
+        """Піднімає знімок з диска, щоб відповідати одразу після рестарту"""
+        if self.snapshot is not None or not self.store.exists():
+            return self.snapshot
+        try:
+            # Готовий індекс відкривається за мілісекунди; без нього (чи зі старим) — парсинг JSON
+            dataset = self.store.open_index() or await self.store.load_dataset_async()
+        except (OSError, ValueError, BrokenProcessPool) as e:
+            print(f"⚠️ Не вдалося прочитати збережену базу {self.store.name}: {e}")
+            return None
+        if self.snapshot is None:
+            self.snapshot = dataset
+            # Знімок вважаємо застарілим, щоб одразу пройшла перевірка на сервері
+            self.snapshot.loaded_at = 0
+            print(f"💾 Завантажено збережену базу {self.store.name}: {len(dataset)} записів")
+        return self.snapshot
+
+    async def run_refresh_loop(self):
+        """Фонове оновлення бази раз на TTL"""
+        await self.load_from_disk()
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                # Залишаємо попередній знімок, спробуємо пізніше
+                pass
+            delay = self.ttl if self.snapshot is not None else RETRY_DELAY * 10
+            await asyncio.sleep(delay)
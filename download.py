@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Завантаження великого файлу з докачуванням через HTTP Range та перевіркою цілісності
+"""
+
+import asyncio
+import json
+import os
+import re
+import zlib
+
+import httpx
+
+CHUNK_SIZE = 1024 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+class IntegrityError(Exception):
+    """Завантажене не збігається з тим, що оголосив сервер (довжина, контрольна сума gzip, діапазон)"""
+
+
+class DownloadFailed(Exception):
+    """Файл не вдалося завантажити за відведену кількість спроб"""
+
+
+class ResumableDownload:
+    """
+    Завантаження url у path через тимчасовий файл path + '.part'.
+
+    У .part пишуться байти саме в тому вигляді, в якому їх віддає сервер (зокрема
+    стиснені gzip), тож після обриву наступна спроба просить лише решту
+    (Range + If-Range з валідатором першої відповіді), а не починає
+    багатомегабайтне завантаження з нуля. Недокачаний файл переживає і рестарт
+    бота: поруч зберігаються валідатор та очікуваний розмір. У path файл
+    з'являється (атомарно) лише після перевірки довжини та контрольної суми gzip.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, url: str, path: str, retries: int = 3, retry_delay: float = 3):
+        self.client = client
+        self.url = url
+        self.path = path
+        self.part_path = path + '.part'
+        self.state_path = path + '.part.json'
+        self.retries = retries
+        self.retry_delay = retry_delay
+        # Валідатори, стиснення та розмір відповіді, з якої почато поточний .part
+        self.state = self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get('url') != self.url or not os.path.exists(self.part_path):
+            return None
+        return state
+
+    def _save_state(self, response):
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        self.state = {
+            'url': self.url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'encoding': response.headers.get('Content-Encoding', 'identity'),
+            # Розмір тіла в тому вигляді, як його передає сервер (стисненого для gzip)
+            'total': int(response.headers['Content-Length']) if 'Content-Length' in response.headers else None,
+        }
+        with open(self.state_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(self.state_path + '.tmp', self.state_path)
+
+    def discard(self):
+        """Видаляє недокачаний файл"""
+        self.state = None
+        for path in (self.part_path, self.state_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @property
+    def offset(self):
+        """Скільки байтів уже завантажено і можна докачати"""
+        if self.state is None or self._if_range() is None:
+            return 0
+        try:
+            return os.path.getsize(self.part_path)
+        except OSError:
+            return 0
+
+    def _if_range(self):
+        # If-Range приймає лише сильний ETag. Дата зміни годиться тільки для нестиснутого
+        # файлу: стиснення «на льоту» може щоразу давати інші байти (тоді ETag слабкий)
+        etag = self.state.get('etag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        if self.state.get('encoding') == 'identity':
+            return self.state.get('last_modified')
+        return None
+
+    async def run(self, headers: dict = None):
+        """
+        Завантажує файл з повторами; повертає валідатори ({'etag', 'last_modified'})
+        або None, якщо сервер відповів 304 на умовні заголовки з headers.
+
+        Спроба, яка щось докачала, не вважається невдалою: обмежена лише
+        кількість обривів поспіль без жодного прогресу.
+        """
+        failures = 0
+        while True:
+            offset = self.offset
+            try:
+                return await self._attempt(headers or {}, offset)
+            except IntegrityError as e:
+                # Докачувати нема чого: файл на сервері змінився або прийшло не те
+                self.discard()
+                failures += 1
+                error = e
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                failures = 0 if self.offset > offset else failures + 1
+                error = e
+            if failures >= self.retries:
+                raise DownloadFailed(
+                    f"Не вдалося завантажити файл після {self.retries} спроб. "
+                    f"Помилка: {type(error).__name__}: {str(error)}"
+                )
+            delay = self.retry_delay * 2 ** max(0, failures - 1)
+            print(f"⚠️ Помилка завантаження ({type(error).__name__}, отримано {self.offset} байт), "
+                  f"повтор через {delay} с")
+            await asyncio.sleep(delay)  # Не блокує інші оновлення
+
+    async def _attempt(self, headers, offset):
+        request_headers = {'Accept-Encoding': 'gzip'}
+        if offset:
+            request_headers.update({'Range': f'bytes={offset}-', 'If-Range': self._if_range()})
+        else:
+            request_headers.update(headers)
+
+        async with self.client.stream('GET', self.url, headers=request_headers) as response:
+            if response.status_code == 304 and not offset:
+                return None
+            if response.status_code == 206 and offset:
+                self._check_range(response, offset)
+                mode = 'ab'
+            elif response.status_code == 416:
+                raise IntegrityError(f"сервер не має діапазону з байта {offset}")
+            else:
+                response.raise_for_status()
+                # 200 на Range означає, що файл змінився (If-Range не збігся): починаємо заново
+                self._save_state(response)
+                mode = 'wb'
+
+            with open(self.part_path, mode) as f:
+                # Без chunk_size: при обриві на диску лишається все, що встигло прийти
+                async for chunk in response.aiter_raw():
+                    f.write(chunk)
+
+        # Розпакування та перевірка сотень МБ — у потоці, щоб не блокувати цикл подій
+        await asyncio.to_thread(self._finish)
+        validators = {'etag': self.state.get('etag'), 'last_modified': self.state.get('last_modified')}
+        self.discard()
+        return validators
+
+    def _check_range(self, response, offset):
+        """Перевіряє, що 206 продовжує саме наш файл"""
+        encoding = response.headers.get('Content-Encoding', 'identity')
+        if encoding != self.state.get('encoding'):
+            raise IntegrityError(f"діапазон прийшов у стисненні {encoding}, а початок файлу — "
+                                 f"у {self.state.get('encoding')}")
+        match = CONTENT_RANGE_RE.fullmatch(response.headers.get('Content-Range', ''))
+        if match is None or int(match.group(1)) != offset:
+            raise IntegrityError(f"очікувався діапазон з байта {offset}, отримано "
+                                 f"{response.headers.get('Content-Range')!r}")
+        if match.group(3) != '*':
+            self.state['total'] = int(match.group(3))
+
+    def _finish(self):
+        """Перевіряє довжину (та CRC32 для gzip) і атомарно кладе файл у path"""
+        total = self.state.get('total')
+        size = os.path.getsize(self.part_path)
+        if total is not None and size != total:
+            raise IntegrityError(f"розмір файлу {size} байт, а сервер оголосив {total}")
+
+        encoding = self.state.get('encoding')
+        if encoding == 'identity':
+            os.replace(self.part_path, self.path)
+            return
+        if encoding != 'gzip':
+            raise IntegrityError(f"непідтримуване стиснення: {encoding}")
+        tmp_path = self.path + '.tmp'
+        # zlib перевіряє CRC32 та довжину з кінця потоку gzip
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            with open(self.part_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                while chunk := src.read(CHUNK_SIZE):
+                    dst.write(decompressor.decompress(chunk))
+                dst.write(decompressor.flush())
+            if not decompressor.eof:
+                raise IntegrityError("потік gzip обірвано")
+        except zlib.error as e:
+            os.remove(tmp_path)
+            raise IntegrityError(f"пошкоджений потік gzip: {e}")
+        except IntegrityError:
+            os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP сервер для health/metrics перевірок (і webhook Telegram) у тому ж циклі подій, що й бот
+"""
+
+import asyncio
+
+# Скільки тримати відкритим неактивне keep-alive з'єднання (секунди)
+KEEPALIVE_TIMEOUT = 15
+
+# Максимальний розмір рядка запиту чи заголовка
+MAX_LINE = 8 * 1024
+
+# Максимальний розмір тіла POST запиту (оновлення Telegram займають кілька КБ)
+MAX_BODY = 1024 * 1024
+
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 503: 'Service Unavailable'}
+
+
+class HealthServer:
+    """
+    Мінімальний HTTP/1.1 сервер на asyncio з підтримкою keep-alive.
+
+    handler(path) повертає (код, Content-Type, тіло) і має бути швидким:
+    він виконується прямо в циклі подій бота. POST запити приймаються лише
+    на шляхи, зареєстровані через add_post_handler.
+    """
+
+    def __init__(self, handler, host: str = '0.0.0.0', port: int = 10000):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.server = None
+        # шлях -> async handler(заголовки, тіло) -> (код, Content-Type, тіло)
+        self.post_handlers = {}
+        # Задачі відкритих з'єднань
+        self.connections = set()
+
+    def add_post_handler(self, path: str, handler):
+        self.post_handlers[path] = handler
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, self.host, self.port, limit=MAX_LINE)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is None:
+            return
+        self.server.close()
+        for task in list(self.connections):
+            task.cancel()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while await self._handle_request(reader, writer):
+                pass
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ValueError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            # Скасування з stop(): завершуємося тихо, щоб asyncio не логував помилку
+            pass
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+    async def _handle_request(self, reader, writer):
+        """Обробляє один запит; повертає True, якщо з'єднання лишається відкритим"""
+        request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+        if not request_line:
+            return False
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3:
+            await self._send(writer, 400, 'text/plain', b'Bad Request', False, False)
+            return False
+        method, target, version = parts
+
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', 0) or 0)
+        if length > MAX_BODY:
+            await self._send(writer, 413, 'text/plain', b'Payload Too Large', False, True)
+            return False
+        # Тіло треба дочитати, навіть якщо воно не потрібне, інакше зламається keep-alive
+        body = await reader.readexactly(length) if length else b''
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        path = target.split('?', 1)[0]
+
+        if method == 'POST' and path in self.post_handlers:
+            status, content_type, response = await self.post_handlers[path](headers, body)
+            await self._send(writer, status, content_type, response, keep_alive, True)
+            return keep_alive
+        if method not in ('GET', 'HEAD'):
+            await self._send(writer, 405, 'text/plain', b'Method Not Allowed', keep_alive, True)
+            return keep_alive
+
+        status, content_type, response = self.handler(path)
+        await self._send(writer, status, content_type, response, keep_alive, method == 'GET')
+        return keep_alive
+
+    @staticmethod
+    async def _send(writer, status, content_type, body, keep_alive, with_body):
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            f"\r\n"
+        ).encode('latin-1')
+        writer.write(head + body if with_body else head)
+        await writer.drain()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Метрики бота у текстовому форматі Prometheus (для /metrics)
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Межі бакетів гістограм (секунди): від мікросекундного пошуку до кількахвилинного завантаження
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REGISTRY = []
+
+
+def _format_labels(labelname, label, extra=''):
+    pairs = []
+    if labelname and label is not None:
+        pairs.append(f'{labelname}="{label}"')
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    """Базова метрика: одне значення на кожне значення мітки (необов'язкової)"""
+
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelname=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelname = labelname
+        self.values = {}
+        self.function = None
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def set_function(self, function):
+        """Значення обчислюється під час збору метрик (для метрики з міткою — словник {мітка: значення})"""
+        self.function = function
+
+    def samples(self):
+        if self.function is not None:
+            if self.labelname:
+                return [(self.name, _format_labels(self.labelname, label), value)
+                        for label, value in self.function().items()]
+            return [(self.name, '', self.function())]
+        with self._lock:
+            return [(self.name, _format_labels(self.labelname, label), value)
+                    for label, value in self.values.items()]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, label=None):
+        with self._lock:
+            self.values[label] = self.values.get(label, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, label=None):
+        with self._lock:
+            self.values[label] = value
+
+    def inc(self, amount=1, label=None):
+        with self._lock:
+            self.values[label] = self.values.get(label, 0) + amount
+
+    def dec(self, amount=1, label=None):
+        self.inc(-amount, label)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelname=None, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelname)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, label=None):
+        with self._lock:
+            state = self.values.get(label)
+            if state is None:
+                # [лічильники по бакетах, сума, кількість]
+                self.values[label] = state = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, label=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, label)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for label, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((f'{self.name}_bucket',
+                                    _format_labels(self.labelname, label, f'le="{bound}"'), cumulative))
+                samples.append((f'{self.name}_bucket', _format_labels(self.labelname, label, 'le="+Inf"'), count))
+                samples.append((f'{self.name}_sum', _format_labels(self.labelname, label), total))
+                samples.append((f'{self.name}_count', _format_labels(self.labelname, label), count))
+        return samples
+
+
+def render_metrics():
+    """Усі метрики у текстовому форматі Prometheus"""
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+# Завантаження та побудова бази
+DOWNLOAD_SECONDS = Histogram('mvs_download_seconds', 'Час завантаження файлу бази з data.gov.ua')
+PARSE_SECONDS = Histogram('mvs_parse_seconds', 'Час парсингу JSON бази')
+INDEX_BUILD_SECONDS = Histogram('mvs_index_build_seconds', 'Час побудови індексів бази (без парсингу)')
+REFRESHES = Counter('mvs_refresh_total', 'Перевірки оновлення бази за результатом', 'result')
+DATASET_RECORDS = Gauge('mvs_dataset_records', 'Кількість записів у поточному знімку бази', 'source')
+SNAPSHOT_AGE = Gauge('mvs_snapshot_age_seconds', 'Час від останньої успішної перевірки знімка бази', 'source')
+
+# Пошук
+MATCH_SECONDS = Histogram('search_match_seconds', 'Час пошуку в індексі одного джерела (без кешу)')
+SOURCE_SEARCH_SECONDS = Histogram('search_source_seconds',
+                                  'Затримка відповіді джерела на запит (разом з очікуванням знімка та кешем)',
+                                  'source')
+SEARCHES_IN_FLIGHT = Gauge('searches_in_flight', 'Пошуки, що виконуються зараз')
+RESULT_CACHE_HITS = Counter('result_cache_hits_total', 'Відповіді, взяті з кешу')
+RESULT_CACHE_MISSES = Counter('result_cache_misses_total', 'Відповіді, сформовані заново')
+RESULT_CACHE_HIT_RATIO = Gauge('result_cache_hit_ratio', 'Частка відповідей з кешу')
+INLINE_QUERIES = Counter('inline_queries_total', 'Інлайн-запити за результатом (debounced — замінені '
+                         'новішим, truncated — перегляд кандидатів обірвано)', 'result')
+
+# Telegram Bot API
+TELEGRAM_REQUEST_SECONDS = Histogram('telegram_request_seconds', 'Затримка викликів Telegram Bot API', 'method')
+TELEGRAM_SEND_WAIT_SECONDS = Histogram('telegram_send_wait_seconds', 'Очікування вихідного запиту в черзі лімітів Telegram')
+TELEGRAM_COALESCED_EDITS = Counter('telegram_coalesced_edits_total', 'Редагування, замінені новішими до відправки')
+TELEGRAM_RETRY_AFTER = Counter('telegram_retry_after_total', 'Відповіді 429 (RetryAfter) від Telegram')
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Збереження даних користувачів між перезапусками бота у SQLite (режим WAL)
+"""
+
+import asyncio
+import json
+import os
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from dataset import DATA_DIR
+
+STATE_DB = os.getenv('STATE_DB', os.path.join(DATA_DIR, 'bot_state.sqlite3'))
+
+# Скільки користувачів тримати завантаженими в пам'яті
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+
+# Зміни накопичуються і записуються однією транзакцією через цю паузу (секунди)
+FLUSH_DELAY = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (user_id, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+) WITHOUT ROWID;
+"""
+
+
+def _connect(path):
+    connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Persistence для Application на SQLite.
+
+    user_data завантажується ліниво, коли користувач вперше звертається до бота
+    після старту; у пам'яті тримаються лише USER_CACHE_SIZE останніх активних
+    користувачів. Зміни записуються пакетами в окремому потоці.
+    """
+
+    def __init__(self, path: str = STATE_DB, cache_size: int = USER_CACHE_SIZE, update_interval: float = 60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.cache_size = cache_size
+        # Читання — у циклі подій, запис — у фоновому потоці; WAL дозволяє їм не заважати одне одному
+        self._reader = _connect(path)
+        self._reader.executescript(SCHEMA)
+        self._writer = _connect(path)
+        self._write_lock = threading.Lock()
+        # user_id -> user_data завантажених користувачів, від давно до нещодавно активних
+        self._loaded = OrderedDict()
+        # Ще не записані зміни: user_id -> {ключ: pickle} (None — видалити користувача)
+        self._pending_users = {}
+        self._pending_conversations = {}
+        # Зміни, які саме зараз записуються у фоновому потоці
+        self._writing_users = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+        self._application = None
+        # Вивантажені користувачі, чий запис Application.user_data прибрано через drop_user_data
+        self._evicted = set()
+
+    def attach(self, application):
+        """
+        Дозволяє прибирати вивантажених з пам'яті користувачів і з Application.user_data
+        (інакше там залишався б запис на кожного користувача з моменту старту) та не
+        вивантажувати тих, чиї оновлення ще обробляються (див. PerUserUpdateProcessor).
+        """
+        self._application = application
+
+    # user_data
+
+    async def get_user_data(self):
+        # Дані завантажуються ліниво в refresh_user_data
+        return {}
+
+    def _load_user(self, user_id):
+        for pending in (self._pending_users, self._writing_users):
+            if user_id in pending:
+                return {key: pickle.loads(value) for key, value in (pending[user_id] or {}).items()}
+        rows = self._reader.execute('SELECT key, value FROM user_data WHERE user_id = ?', (user_id,))
+        return {key: pickle.loads(value) for key, value in rows}
+
+    @staticmethod
+    def _serialize(data):
+        return {key: pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL) for key, value in data.items()}
+
+    async def refresh_user_data(self, user_id, user_data):
+        """Викликається перед кожним обробником: підвантажує дані користувача з бази"""
+        if user_id in self._loaded:
+            self._loaded.move_to_end(user_id)
+            return
+        user_data.update(self._load_user(user_id))
+        self._loaded[user_id] = user_data
+        self._evict()
+
+    def _in_flight(self, user_id):
+        """Чи обробляється (або чекає своєї черги) оновлення користувача"""
+        is_processing = getattr(self._application and self._application.update_processor, 'is_processing', None)
+        return is_processing is not None and is_processing(user_id)
+
+    def _evict(self):
+        """
+        Вивантажує найдавніше активних користувачів понад cache_size. Користувачі, чиї
+        обробники ще працюють (напр. пакетна перевірка), лишаються: обробник писав би
+        у словник, який уже ніхто не збереже
+        """
+        evicted = []
+        for user_id in self._loaded:
+            if len(self._loaded) - len(evicted) <= self.cache_size:
+                break
+            if not self._in_flight(user_id):
+                evicted.append(user_id)
+        for user_id in evicted:
+            # Зміни, які Application ще не передав на запис, ставимо в чергу самі
+            self._pending_users[user_id] = self._serialize(self._loaded.pop(user_id))
+            if self._application is not None:
+                # Application прибере запис одразу, а нас викличе в drop_user_data
+                # при наступному update_persistence
+                self._evicted.add(user_id)
+                self._application.drop_user_data(user_id)
+        if evicted:
+            self._schedule_flush()
+
+    async def update_user_data(self, user_id, data):
+        if user_id not in self._loaded:
+            # Користувача вивантажено з пам'яті: актуальна копія вже в базі
+            return
+        self._pending_users[user_id] = self._serialize(data)
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id):
+        if user_id in self._evicted:
+            # Це не видалення, а вивантаження (див. _evict): дані лишаються в базі
+            self._evicted.discard(user_id)
+            if user_id in self._loaded:
+                # Користувач повернувся до update_persistence, і Application пропустив
+                # його зміни разом з «видаленням» — записуємо їх самі
+                self._pending_users[user_id] = self._serialize(self._loaded[user_id])
+                self._schedule_flush()
+            return
+        self._loaded.pop(user_id, None)
+        self._pending_users[user_id] = None
+        self._schedule_flush()
+
+    async def get_user_values(self, key):
+        """{user_id: значення} для одного ключа user_data всіх користувачів (без завантаження решти)"""
+        await self._flush()
+        rows = self._reader.execute('SELECT user_id, value FROM user_data WHERE key = ?', (key,))
+        return {user_id: pickle.loads(value) for user_id, value in rows}
+
+    # Розмови ConversationHandler
+
+    async def get_conversations(self, name):
+        rows = self._reader.execute('SELECT key, state FROM conversations WHERE name = ?', (name,))
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name, key, new_state):
+        self._pending_conversations[(name, json.dumps(list(key)))] = (
+            None if new_state is None else pickle.dumps(new_state)
+        )
+        self._schedule_flush()
+
+    # Запис
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_soon())
+
+    async def _flush_soon(self):
+        await asyncio.sleep(FLUSH_DELAY)
+        await self._flush()
+
+    async def _flush(self):
+        # Пакети записуються строго по черзі, щоб старіші дані не перезаписали новіші
+        async with self._flush_lock:
+            users, self._pending_users = self._pending_users, {}
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            if not (users or conversations):
+                return
+            self._writing_users = users
+            try:
+                await asyncio.to_thread(self._write, users, conversations)
+            except BaseException:
+                # Повертаємо пакет у чергу, не перетираючи новіші зміни
+                for user_id, values in users.items():
+                    self._pending_users.setdefault(user_id, values)
+                for key, state in conversations.items():
+                    self._pending_conversations.setdefault(key, state)
+                raise
+            finally:
+                self._writing_users = {}
+
+    def _write(self, users, conversations):
+        """Записує накопичені зміни однією транзакцією"""
+        with self._write_lock:
+            cursor = self._writer.cursor()
+            cursor.execute('BEGIN')
+            try:
+                cursor.executemany('DELETE FROM user_data WHERE user_id = ?', [(user_id,) for user_id in users])
+                cursor.executemany(
+                    'INSERT INTO user_data (user_id, key, value) VALUES (?, ?, ?)',
+                    [(user_id, key, value)
+                     for user_id, values in users.items() if values
+                     for key, value in values.items()]
+                )
+                for (name, key), state in conversations.items():
+                    if state is None:
+                        cursor.execute('DELETE FROM conversations WHERE name = ? AND key = ?', (name, key))
+                    else:
+                        cursor.execute('INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)',
+                                       (name, key, state))
+                cursor.execute('COMMIT')
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+
+    async def flush(self):
+        """Викликається при зупинці бота: дописує все, що залишилось у черзі"""
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        await self._flush()
+        self._reader.close()
+        self._writer.close()
+
+    # Дані, які бот не зберігає
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
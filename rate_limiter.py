@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Планувальник вихідних запитів до Bot API: ліміти Telegram, злиття редагувань та RetryAfter
+"""
+
+import asyncio
+import itertools
+import os
+import time
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import TELEGRAM_COALESCED_EDITS, TELEGRAM_RETRY_AFTER, TELEGRAM_SEND_WAIT_SECONDS
+
+# Ліміти Telegram: близько 30 повідомлень на секунду загалом і 1 на секунду в один чат
+# (невеликий сплеск у чат дозволено: відповідь і одразу її редагування).
+# Обидва — із запасом: Telegram рахує запити за часом надходження, і через різну
+# затримку мережі рівно 30/с (чи 1/с у чат) зрідка перевищують ліміт, а кожна 429
+# зупиняє всі чати
+GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 25))
+CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', 0.9))
+CHAT_BURST = int(os.getenv('TELEGRAM_CHAT_BURST', 3))
+
+# Скільки разів повторювати запит після відповіді 429 (RetryAfter)
+MAX_RETRIES = 3
+
+# Редагування, де новіший запит повністю замінює ще не надісланий старіший
+COALESCED_ENDPOINTS = frozenset({'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup'})
+
+# Після скількох чатів прибирати стан неактивних
+MAX_IDLE_CHATS = 1000
+
+
+class TokenBucket:
+    """Відро токенів: поповнюється на rate токенів за секунду, вміщує не більше capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Скільки секунд чекати до наступного токена (0, якщо він уже є)"""
+        self._refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def try_take(self):
+        if self.wait_time():
+            return False
+        self.tokens -= 1
+        return True
+
+    @property
+    def is_full(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def wait(self):
+        """Чекає, доки з'явиться токен (не забираючи його)"""
+        while delay := self.wait_time():
+            await asyncio.sleep(delay)
+
+    async def take(self):
+        while not self.try_take():
+            await asyncio.sleep(self.wait_time())
+
+
+class _Chat:
+    """Черга одного чату: запити йдуть по одному, у порядку надходження"""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.bucket = TokenBucket(CHAT_RATE, CHAT_BURST)
+        self.users = 0
+
+
+class _NotSent(Exception):
+    """Редагування скасоване, не дійшовши до Telegram: ті, кого воно замінило, надсилають свої"""
+
+
+# Порядок надходження редагувань (повторна спроба зберігає номер першої)
+_edit_sequence = itertools.count()
+
+
+class _Edit:
+    """Редагування повідомлення, яке ще може бути замінене новішим"""
+
+    def __init__(self, sequence: int):
+        self.sequence = sequence
+        self.result = asyncio.get_running_loop().create_future()
+        self.superseded_by = None
+
+    def copy_outcome(self, source):
+        if self.result.done():
+            return
+        if source.cancelled():
+            self.result.cancel()
+        elif source.exception() is not None:
+            self.fail(source.exception())
+        else:
+            self.result.set_result(source.result())
+
+    def fail(self, exception):
+        self.result.set_exception(exception)
+        # Виняток отримає і сам викликач, тож asyncio не має скаржитися на непрочитаний
+        self.result.exception()
+
+
+class MessageScheduler(BaseRateLimiter):
+    """
+    Rate limiter для Application: усі запити з chat_id проходять через спільне
+    відро токенів та відро свого чату.
+
+    Поки редагування повідомлення чекає своєї черги, новіше редагування того ж
+    повідомлення його заміняє: надсилається лише останній текст, а всі, хто
+    чекав, отримують його результат. На 429 відправка в усі чати
+    призупиняється на retry_after секунд, після чого запит повторюється.
+    """
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, max_retries: int = MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.max_retries = max_retries
+        self._chats = {}
+        # (метод, chat_id, message_id) -> останнє ще не надіслане редагування
+        self._edits = {}
+        # До якого моменту (time.monotonic) Telegram просив нічого не надсилати
+        self._paused_until = 0.0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        return await self._process(callback, args, kwargs, endpoint, data, next(_edit_sequence))
+
+    async def _process(self, callback, args, kwargs, endpoint, data, sequence):
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            # answerCallbackQuery, getFile, setWebhook тощо не входять у ліміти повідомлень
+            return await self._send(callback, args, kwargs)
+
+        edit = key = None
+        if endpoint in COALESCED_ENDPOINTS and data.get('message_id') is not None:
+            key = (endpoint, chat_id, data['message_id'])
+            edit = _Edit(sequence)
+            previous = self._edits.get(key)
+            if previous is not None and previous.sequence > sequence:
+                # Повторна спроба старішого редагування: новіше вже в черзі і замінює її
+                edit.superseded_by = previous
+            else:
+                if previous is not None:
+                    previous.superseded_by = edit
+                self._edits[key] = edit
+
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat()
+        chat.users += 1
+        queued = time.monotonic()
+        try:
+            async with chat.lock:
+                if edit is None or edit.superseded_by is None:
+                    await chat.bucket.wait()
+                # Поки чекали токена, могло надійти новіше редагування
+                if edit is None or edit.superseded_by is None:
+                    await self.global_bucket.take()
+                    chat.bucket.try_take()
+                    TELEGRAM_SEND_WAIT_SECONDS.observe(time.monotonic() - queued)
+                    return await self._send_edit(edit, callback, args, kwargs)
+        except BaseException:
+            # Скасоване в черзі: ті, хто чекає на це редагування, не мають чекати вічно
+            if edit is not None and not edit.result.done():
+                if edit.superseded_by is not None:
+                    edit.superseded_by.result.add_done_callback(edit.copy_outcome)
+                else:
+                    edit.fail(_NotSent())
+            raise
+        finally:
+            chat.users -= 1
+            if edit is not None and self._edits.get(key) is edit:
+                del self._edits[key]
+            if len(self._chats) > MAX_IDLE_CHATS:
+                self._forget_idle_chats()
+
+        # Замінене редагування нічого не надсилає, а повертає результат того, що його
+        # замінило (воно стоїть у черзі того ж чату далі і, можливо, теж буде замінене)
+        TELEGRAM_COALESCED_EDITS.inc()
+        edit.superseded_by.result.add_done_callback(edit.copy_outcome)
+        try:
+            return await asyncio.shield(edit.result)
+        except _NotSent:
+            # Те, що замінило це редагування, так і не надіслано: надсилаємо своє
+            return await self._process(callback, args, kwargs, endpoint, data, sequence)
+
+    async def _send_edit(self, edit, callback, args, kwargs):
+        """Надсилає запит і передає результат редагуванням, які це замінило"""
+        if edit is None:
+            return await self._send(callback, args, kwargs)
+        try:
+            result = await self._send(callback, args, kwargs)
+        except asyncio.CancelledError:
+            edit.fail(_NotSent())
+            raise
+        except Exception as e:
+            edit.fail(e)
+            raise
+        edit.result.set_result(result)
+        return result
+
+    async def _send(self, callback, args, kwargs):
+        """Надсилає запит, повторюючи його після RetryAfter"""
+        for attempt in range(self.max_retries + 1):
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                TELEGRAM_RETRY_AFTER.inc()
+                # Flood control стосується всього бота, тому пауза спільна для всіх чатів
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def _forget_idle_chats(self):
+        for chat_id, chat in list(self._chats.items()):
+            # Повне відро після видалення буде таким самим, тож ліміт не порушиться
+            if not chat.users and chat.bucket.is_full:
+                del self._chats[chat_id]
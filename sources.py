@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Реєстр джерел бази (набори даних МВС у різних форматах JSON) та пошук одразу в усіх
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+
+from dataset import DATA_DIR, DATASET_TTL, JSON_URL, MVS_FIELDS, DatasetCache, PersonRecord, ResultCache, SnapshotStore
+from metrics import MATCH_SECONDS, SOURCE_SEARCH_SECONDS
+
+# JSON файл з описами додаткових джерел (див. load_sources); джерело з назвою вже
+# зареєстрованого замінює його, напр. щоб змінити адресу чи інтервал оновлення
+DATASET_SOURCES = os.getenv('DATASET_SOURCES', '')
+
+# Назва джерела стає частиною імен файлів на диску та міткою метрик
+SOURCE_NAME_RE = re.compile(r'[a-z0-9_-]+')
+
+# Без цих полів запис не потрапить у жоден індекс
+REQUIRED_FIELDS = ('last_name', 'birth_date')
+
+
+class DatasetSource:
+    """
+    Джерело бази: звідки завантажувати, як читати записи та як часто оновлювати.
+
+    fields — назви полів JSON для кожного поля PersonRecord (береться перше
+    непорожнє, як у MVS_FIELDS); records_key — ключ масиву записів, якщо файл
+    є об'єктом, а не масивом.
+    """
+
+    def __init__(self, name: str, title: str, url: str, fields: dict = MVS_FIELDS,
+                 ttl: int = DATASET_TTL, records_key: str = 'persons'):
+        if not SOURCE_NAME_RE.fullmatch(name):
+            raise ValueError(f"Недопустима назва джерела {name!r}: лише a-z, 0-9, _ та -")
+        unknown = set(fields) - set(PersonRecord.__slots__)
+        if unknown:
+            raise ValueError(f"Джерело {name}: невідомі поля {', '.join(sorted(unknown))}")
+        missing = [field for field in REQUIRED_FIELDS if not fields.get(field)]
+        if missing:
+            raise ValueError(f"Джерело {name}: не вказано поля {', '.join(missing)}")
+        self.name = name
+        self.title = title
+        self.url = url
+        # Одна назва поля рядком або перелік назв у порядку пріоритету
+        self.fields = {field: (keys,) if isinstance(keys, str) else tuple(keys) for field, keys in fields.items()}
+        self.ttl = ttl
+        self.records_key = records_key
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Джерело з опису у файлі DATASET_SOURCES"""
+        try:
+            return cls(data['name'], data.get('title', data['name']), data['url'], data.get('fields', MVS_FIELDS),
+                       int(data.get('ttl', DATASET_TTL)), data.get('records_key', 'persons'))
+        except KeyError as e:
+            raise ValueError(f"В описі джерела немає поля {e}")
+
+    def store(self, directory: str = DATA_DIR):
+        return SnapshotStore(directory, self.name, self.fields, self.records_key)
+
+    def __repr__(self):
+        return f"DatasetSource({self.name!r}, {self.url!r})"
+
+
+# Усі джерела, в яких шукає бот (назва -> DatasetSource), у порядку реєстрації
+SOURCES = {}
+
+
+def register_source(source: DatasetSource):
+    """Додає джерело до реєстру (джерело з такою самою назвою замінюється)"""
+    SOURCES[source.name] = source
+    return source
+
+
+def load_sources(path: str):
+    """
+    Читає описи джерел з JSON файлу: список об'єктів з полями name, url та
+    необов'язковими title, fields, ttl (секунди), records_key.
+    """
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: очікується список джерел")
+    return [DatasetSource.from_dict(item) for item in data]
+
+
+register_source(DatasetSource('mvswantedperson', 'Розшукувані особи (МВС)', JSON_URL))
+if DATASET_SOURCES:
+    for _source in load_sources(DATASET_SOURCES):
+        register_source(_source)
+
+
+class SourceUnavailable(Exception):
+    """Знімка джерела ще немає, а чекати на нього не можна"""
+
+
+class SourceResult:
+    """
+    Результат запиту до одного джерела: значення або помилка, затримка (секунди)
+    та версія знімка, в якому шукали (None, якщо джерело недоступне)
+    """
+
+    __slots__ = ('source', 'value', 'error', 'seconds', 'version')
+
+    def __init__(self, source: DatasetSource, value=None, error: Exception = None, seconds: float = 0.0,
+                 version: str = None):
+        self.source = source
+        self.value = value
+        self.error = error
+        self.seconds = seconds
+        self.version = version
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class DatasetFederation:
+    """
+    Кеші всіх джерел: кожне завантажується, індексується та оновлюється
+    незалежно, зі своїм TTL, у свої файли на диску.
+
+    Запит розсилається всім джерелам одночасно. Поки жодне джерело не має
+    знімка (холодний старт), запит чекає на перше завантажене; джерело, яке ще
+    завантажується чи недоступне, не затримує відповідь з решти.
+    """
+
+    def __init__(self, sources=None, directory: str = DATA_DIR):
+        self.sources = list(sources if sources is not None else SOURCES.values())
+        self.caches = {source.name: DatasetCache(source.url, source.ttl, source.store(directory))
+                       for source in self.sources}
+        # Окремий кеш відповідей на джерело: версії знімків джерел змінюються незалежно
+        self.result_caches = {source.name: ResultCache() for source in self.sources}
+
+    @property
+    def snapshots(self):
+        """Знімки джерел, які вже завантажені: {назва: Dataset}"""
+        return {name: cache.snapshot for name, cache in self.caches.items() if cache.snapshot is not None}
+
+    @property
+    def versions(self):
+        """Версії знімків усіх джерел у порядку джерел (None — знімка ще немає)"""
+        return tuple((name, cache.snapshot.version if cache.snapshot is not None else None)
+                     for name, cache in self.caches.items())
+
+    @property
+    def is_loaded(self):
+        """Чи є знімок хоча б одного джерела"""
+        return any(cache.snapshot is not None for cache in self.caches.values())
+
+    @property
+    def cache_hits(self):
+        return sum(cache.hits for cache in self.result_caches.values())
+
+    @property
+    def cache_misses(self):
+        return sum(cache.misses for cache in self.result_caches.values())
+
+    @property
+    def cache_hit_rate(self):
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else 0.0
+
+    def on_update(self, listener):
+        """Реєструє корутину listener(source, old, new) для оновлень знімка будь-якого джерела"""
+        for source in self.sources:
+            self.caches[source.name].on_update(lambda old, new, source=source: listener(source, old, new))
+
+    def start(self):
+        """Запускає фонове оновлення всіх джерел"""
+        for cache in self.caches.values():
+            cache.start()
+
+    async def aclose(self):
+        for cache in self.caches.values():
+            await cache.aclose()
+
+    async def _snapshot(self, source):
+        cache = self.caches[source.name]
+        if cache.snapshot is None:
+            # Фонове оновлення джерела продовжує спроби, а запит не чекає
+            raise SourceUnavailable(f"{source.title}: базу ще не завантажено")
+        return await cache.get()
+
+    async def _wait_first_snapshot(self):
+        """
+        Холодний старт: чекає, доки завантажиться перше джерело. Решта вантажаться
+        далі у фоні, не затримуючи запит; якщо не вдалося жодне, піднімає помилку першого.
+        """
+        tasks = [asyncio.ensure_future(self.caches[source.name].get()) for source in self.sources]
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Список, а не any(): помилку кожного завершеного треба забрати
+                if [task for task in done if task.exception() is None]:
+                    return
+        finally:
+            # Скасовується лише очікування: саме завантаження (DatasetCache.refresh) триває
+            for task in pending:
+                task.cancel()
+        raise tasks[0].exception()
+
+    async def get(self):
+        """
+        Знімки всіх доступних джерел {назва: Dataset}.
+
+        Якщо недоступні всі джерела, піднімає помилку першого.
+        """
+        if not self.is_loaded:
+            await self._wait_first_snapshot()
+        datasets = await asyncio.gather(*(self._snapshot(source) for source in self.sources),
+                                        return_exceptions=True)
+        available = {source.name: dataset for source, dataset in zip(self.sources, datasets)
+                     if not isinstance(dataset, BaseException)}
+        if not available:
+            raise datasets[0]
+        return available
+
+    async def search(self, function, *args, key=None, cacheable=None):
+        """
+        Виконує function(dataset, *args) у знімку кожного джерела одночасно.
+
+        Повертає [SourceResult] у порядку джерел. З key результат береться з кешу
+        джерела, доки не зміниться версія його знімка; cacheable(результат) може
+        заборонити кешування окремого результату. Якщо не вдалося жодне джерело,
+        піднімає помилку першого.
+        """
+        if not self.is_loaded:
+            await self._wait_first_snapshot()
+        results = await asyncio.gather(*(self._search_source(source, function, args, key, cacheable)
+                                         for source in self.sources))
+        if not any(result.ok for result in results):
+            raise results[0].error
+        return results
+
+    async def _search_source(self, source, function, args, key, cacheable):
+        started = time.perf_counter()
+        result = SourceResult(source)
+        try:
+            dataset = await self._snapshot(source)
+            result.version = dataset.version
+            result_cache = self.result_caches[source.name]
+            value = None if key is None else result_cache.get(dataset.version, key)
+            if value is None:
+                # Пошук в індексі займає мікросекунди, тож виконується прямо в циклі подій:
+                # паралельно йдуть очікування знімків, а не самі звернення до індексів
+                with MATCH_SECONDS.time():
+                    value = function(dataset, *args)
+                if key is not None and (cacheable is None or cacheable(value)):
+                    result_cache.put(dataset.version, key, value)
+            result.value = value
+        except Exception as e:
+            result.error = e
+        result.seconds = time.perf_counter() - started
+        SOURCE_SEARCH_SECONDS.observe(result.seconds, source.name)
+        return result
+
+
+# Єдиний екземпляр на процес
+federation = DatasetFederation()
@@ -4,12 +4,30 @@
 Telegram бот для перевірки наявності особи в базі розшукуваних осіб
 """
 
-import requests
+import asyncio
+import csv
+import httpx
+import io
 import json
 import os
-from http.client import IncompleteRead
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes, ConversationHandler
+import time
+from telegram import (Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle,
+                      InlineQueryResultsButton, InputTextMessageContent, ReplyKeyboardMarkup, ReplyKeyboardRemove)
+from telegram.error import TelegramError
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, InlineQueryHandler, MessageHandler, filters, ContextTypes, ConversationHandler
+from telegram.request import HTTPXRequest
+
+from batch import DEFAULT_HEADER, RESULT_COLUMNS, check_chunk, decode_upload, iter_chunks, open_csv, summarize
+from dataset import FUZZY_MAX_DISTANCE, Dataset, ResultCache, diff_datasets, normalize_text, search_key
+from health import HealthServer
+from metrics import (DATASET_RECORDS, INLINE_QUERIES, RESULT_CACHE_HIT_RATIO, RESULT_CACHE_HITS,
+                     RESULT_CACHE_MISSES, SEARCHES_IN_FLIGHT, SNAPSHOT_AGE, TELEGRAM_REQUEST_SECONDS,
+                     render_metrics)
+from persistence import SQLitePersistence
+from rate_limiter import MessageScheduler
+from sources import federation
+from updates import PerUserUpdateProcessor, UpdateReceiver, run_application
+from watchlist import MAX_WATCHLIST, Watchlist, params_key
 
 try:
     from config import BOT_TOKEN
@@ -18,9 +36,50 @@ except ImportError:
     if not BOT_TOKEN:
         raise ValueError("⚠️ Токен бота не знайдено! Створіть файл config.py або встановіть змінну оточення BOT_TOKEN")
 
-JSON_URL = "https://data.gov.ua/dataset/59ecf2ab-47a1-4fae-a63c-fe5007d68130/resource/9694e34c-92a5-4839-91df-c32850db7ba9/download/mvswantedperson_1.json"
-
 FIRST_NAME, LAST_NAME, PATRONYMIC, BIRTH_DATE, SAVE_CHOICE = range(5)
+PARTIAL_LAST_NAME, PARTIAL_BIRTH = range(5, 7)
+
+# Скільки знайдених записів показувати в одному повідомленні (ліміт Telegram 4096 символів)
+MAX_SHOWN_RECORDS = 5
+
+# Скільки результатів пошуку за неповними даними зберігати для гортання сторінок
+MAX_PARTIAL_RESULTS = 200
+
+# Для скількох останніх пошуків користувача працює кнопка «🔔 Стежити за змінами»
+MAX_WATCH_CANDIDATES = 10
+
+# Пакетна перевірка: максимальний розмір файлу (ліміт завантаження Bot API 20 МБ)
+# та як часто оновлювати повідомлення про прогрес (секунди)
+BATCH_MAX_BYTES = 20 * 1024 * 1024
+BATCH_PROGRESS_INTERVAL = 2
+
+# Інлайн-режим (@бот Прізвище Ім'я ДД.ММ.РРРР у будь-якому чаті): скільки результатів показувати
+# (ліміт Telegram 50) і скільки секунд Telegram може віддавати нашу відповідь на такий самий
+# запит зі свого кешу. Пауза між натисканнями клавіш — updates.INLINE_DEBOUNCE
+INLINE_MAX_RESULTS = 20
+INLINE_CACHE_TIME = 300
+
+# Підписки всіх користувачів (будуються з user_data при старті)
+watchlist = Watchlist()
+
+# Готові відповіді на повторні пошуки: ключ — введені параметри, версія — знімки всіх
+# баз (недоступна база теж входить у версію: щойно вона завантажиться, відповідь зміниться)
+reply_cache = ResultCache()
+
+# Метрики, які обчислюються під час збору
+DATASET_RECORDS.set_function(lambda: {name: len(dataset) for name, dataset in federation.snapshots.items()})
+SNAPSHOT_AGE.set_function(lambda: {name: dataset.age for name, dataset in federation.snapshots.items()})
+RESULT_CACHE_HITS.set_function(lambda: reply_cache.hits)
+RESULT_CACHE_MISSES.set_function(lambda: reply_cache.misses)
+RESULT_CACHE_HIT_RATIO.set_function(lambda: reply_cache.hit_rate)
+
+
+class TimedHTTPXRequest(HTTPXRequest):
+    """HTTP клієнт Bot API, що вимірює затримку кожного виклику"""
+    
+    async def do_request(self, url, method, *args, **kwargs):
+        with TELEGRAM_REQUEST_SECONDS.time(url.rsplit('/', 1)[-1]):
+            return await super().do_request(url, method, *args, **kwargs)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -61,6 +120,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             '• Прізвище\n'
             '• По-батькові\n'
             '• Дату народження (формат: ДД.ММ.РРРР)\n\n'
+            '🔎 Якщо відомі лише прізвище та рік народження, скористайтеся /partial\n'
+            f'⚡ Швидкий пошук у будь-якому чаті: @{context.bot.username} Прізвище Ім\'я ДД.ММ.РРРР\n'
+            '🔔 Особи, за змінами щодо яких ви стежите: /watchlist\n'
+            '📄 Щоб перевірити список осіб, надішліть CSV файл з колонками '
+            'Прізвище, Ім\'я, По-батькові, Дата народження\n\n'
             'Натисніть кнопку для початку:',
             reply_markup=reply_markup
         )
@@ -274,6 +338,11 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
+async def end_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Завершує розмову, яку перервав початок іншої (її починає обробник з групи 1)"""
+    return ConversationHandler.END
+
+
 async def main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Повернення до головного меню"""
     query = update.callback_query
@@ -317,6 +386,124 @@ async def main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
+def format_record(matching_record, source=None):
+    """Форматує знайдений запис (PersonRecord) для відповіді користувачу; source — з якої бази запис"""
+    record_message = (
+        f"📋 Дані:\n"
+        f"• Прізвище: {matching_record.last_name or 'N/A'}\n"
+        f"• Ім'я: {matching_record.first_name or 'N/A'}\n"
+        f"• По-батькові: {matching_record.patronymic or 'N/A'}\n"
+        f"• Дата народження: {matching_record.birth_date}\n"
+    )
+    
+    # Додаткова інформація, якщо є
+    if matching_record.category:
+        record_message += f"• Категорія: {matching_record.category}\n"
+    if matching_record.restraint:
+        record_message += f"• Запобіжний захід: {matching_record.restraint}\n"
+    if matching_record.article:
+        record_message += f"• Стаття: {matching_record.article}\n"
+    if matching_record.ovd:
+        record_message += f"• Орган: {matching_record.ovd}\n"
+    # Джерело показуємо, лише коли баз кілька
+    if source is not None and len(federation.sources) > 1:
+        record_message += f"• База: {source.title}\n"
+    
+    return record_message
+
+
+def find_matches(dataset, search_params):
+    """Шукає особу в знімку бази; повертає (точні збіги, схожі записи)"""
+    # Пошук збігу в індексі (всі записи з повним збігом 4 параметрів)
+    matching_records = dataset.find(
+        search_params["last_name"],
+        search_params["first_name"],
+        search_params["patronymic"],
+        search_params["birth_date"]
+    )
+    
+    # Якщо точного збігу немає, шукаємо записи з можливими помилками у ПІБ
+    similar_records = []
+    if not matching_records and FUZZY_MAX_DISTANCE > 0:
+        similar_records = dataset.find_fuzzy(
+            search_params["last_name"],
+            search_params["first_name"],
+            search_params["patronymic"],
+            search_params["birth_date"]
+        )
+    
+    return matching_records, similar_records
+
+
+def merge_matches(results):
+    """
+    Об'єднує результати find_matches з усіх джерел (SourceResult).
+
+    Повертає ([(джерело, запис)], [(відстань, джерело, запис)], [недоступні джерела]);
+    схожі записи потрібні, лише якщо точного збігу немає в жодному джерелі.
+    """
+    matching_records, similar_records, unavailable = [], [], []
+    for result in results:
+        if not result.ok:
+            unavailable.append(result.source)
+            continue
+        matching, similar = result.value
+        matching_records.extend((result.source, record) for record in matching)
+        similar_records.extend((distance, result.source, record) for distance, record in similar)
+    if matching_records:
+        similar_records = []
+    # Найближчі записи першими, незалежно від того, в якій базі вони знайдені
+    similar_records.sort(key=lambda candidate: candidate[0])
+    return matching_records, similar_records, unavailable
+
+
+def render_result_message(search_params, results):
+    """Формує текст відповіді за результатами пошуку в усіх джерелах"""
+    matching_records, similar_records, unavailable = merge_matches(results)
+    if matching_records:
+        result_message = f"🚨 <b>ОПА! ОСОБУ ЗНАЙДЕНО В БАЗІ РОЗШУКУВАНИХ!</b>\n\n"
+        if len(matching_records) > 1:
+            result_message += f"Знайдено записів: {len(matching_records)}\n\n"
+        
+        for source, matching_record in matching_records[:MAX_SHOWN_RECORDS]:
+            result_message += format_record(matching_record, source) + "\n"
+        
+        if len(matching_records) > MAX_SHOWN_RECORDS:
+            result_message += f"... та ще {len(matching_records) - MAX_SHOWN_RECORDS}\n"
+            
+    elif similar_records:
+        result_message = (
+            f"⚠️ <b>ТОЧНОГО ЗБІГУ НЕМАЄ, АЛЕ Є СХОЖІ ЗАПИСИ</b>\n\n"
+            f"Перевірте, чи не було помилки в написанні ПІБ.\n"
+            f"Знайдено схожих записів: {len(similar_records)}\n\n"
+        )
+        
+        for distance, source, similar_record in similar_records[:MAX_SHOWN_RECORDS]:
+            result_message += f"🔸 Відмінностей у ПІБ: {distance}\n" + format_record(similar_record, source) + "\n"
+        
+        if len(similar_records) > MAX_SHOWN_RECORDS:
+            result_message += f"... та ще {len(similar_records) - MAX_SHOWN_RECORDS}\n"
+            
+    else:
+        result_message = (
+            f"✅ <b>ВСЕ ДОБРЕ, ЖИВЕМО ДАЛІ</b>\n\n"
+            f"Перевірено за параметрами:\n"
+            f"• Прізвище: {search_params['last_name']}\n"
+            f"• Ім'я: {search_params['first_name']}\n"
+            f"• По-батькові: {search_params['patronymic']}\n"
+            f"• Дата народження: {search_params['birth_date']}\n"
+        )
+        if len(results) > 1:
+            checked = ', '.join(result.source.title for result in results if result.ok)
+            result_message += f"• Бази: {checked}\n"
+    
+    # Відповідь з решти баз не чекає на ту, що ще завантажується чи недоступна
+    if unavailable:
+        result_message += f"\n⚠️ Не вдалося перевірити: {', '.join(source.title for source in unavailable)}\n"
+    
+    return result_message
+
+
 async def perform_search(update: Update, context: ContextTypes.DEFAULT_TYPE, use_saved: bool = False):
     """Виконання пошуку особи в JSON"""
     
@@ -328,161 +515,63 @@ async def perform_search(update: Update, context: ContextTypes.DEFAULT_TYPE, use
         "birth_date": context.user_data.get('birth_date', '')
     }
     
+    SEARCHES_IN_FLIGHT.inc()
     try:
-        # Завантаження JSON з retry логікою
-        loading_msg = await update.message.reply_text("⏳ Завантажую дані з бази МВС...\nЗачекайте, це може зайняти деякий час")
-        
-        max_retries = 3
-        retry_count = 0
-        response = None
-        
-        while retry_count < max_retries:
-            try:
-                response = requests.get(
-                    JSON_URL, 
-                    timeout=180,  # 3 хвилини
-                    stream=True,  # Потокове завантаження для великих файлів
-                    headers={'Accept-Encoding': 'gzip, deflate'}  # Стиснення
-                )
-                response.raise_for_status()
-                break  # Успішно завантажено
-            except (requests.exceptions.Timeout, 
-                    requests.exceptions.ConnectionError, 
-                    requests.exceptions.ChunkedEncodingError, 
-                    IncompleteRead) as e:
-                retry_count += 1
-                if retry_count < max_retries:
-                    await loading_msg.edit_text(
-                        f"⚠️ Помилка завантаження (спроба {retry_count}/{max_retries})...\n"
-                        f"Повторюю запит через 3 секунди..."
-                    )
-                    import time
-                    time.sleep(3)  # Пауза перед повтором
-                else:
-                    # Остання спроба не вдалась
-                    raise Exception(
-                        f"Не вдалося завантажити базу після {max_retries} спроб. "
-                        f"Помилка: {str(e)}"
-                    )
-        
-        if response is None:
-            raise Exception("Не вдалося отримати відповідь від сервера")
-        
-        # Парсинг JSON
-        await loading_msg.edit_text("⏳ Обробляю дані... Це може зайняти до 1 хвилини.")
-        data = response.json()
-        
-        # Пошук збігу
-        found = False
-        matching_record = None
-        
-        # Перевіряємо чи це масив чи об'єкт
-        records = data if isinstance(data, list) else data.get('persons', [])
-        
-        for record in records:
-            # Отримуємо поля (перевіряємо різні варіанти назв)
-            # Українська версія полів (з підкресленням _U)
-            first_name = record.get('FIRST_NAME_U') or record.get('FIRST_NAME') or record.get('OVD') or ''
-            last_name = record.get('LAST_NAME_U') or record.get('LAST_NAME') or record.get('OVDSURNAME') or ''
-            patronymic = record.get('MIDDLE_NAME_U') or record.get('PATRONYMIC') or record.get('OVDPATRONYMIC') or ''
-            birth_date_raw = record.get('BIRTH_DATE') or record.get('BIRTHDAY') or ''
-            
-            # Обробка дати народження
-            # Формат у JSON: "1991-04-30T00:00:00" або "1978-12-26T00:00:00"
-            # Формат вводу користувача: "30.04.1991"
-            birth_date_normalized = ""
-            if birth_date_raw:
-                # Витягуємо тільки дату (без часу)
-                if 'T' in birth_date_raw:
-                    birth_date_parts = birth_date_raw.split('T')[0]  # "1991-04-30"
-                    # Конвертуємо в формат ДД.ММ.РРРР
-                    try:
-                        year, month, day = birth_date_parts.split('-')
-                        birth_date_normalized = f"{day}.{month}.{year}"  # "30.04.1991"
-                    except:
-                        birth_date_normalized = birth_date_raw
-                else:
-                    birth_date_normalized = birth_date_raw
-            
-            # Нормалізація пошукових даних
-            search_date_normalized = search_params["birth_date"].strip()
-            
-            # Нормалізація тексту (прибираємо зайві пробіли, нормалізуємо апострофи)
-            def normalize_text(text):
-                """Нормалізує текст: прибирає пробіли, приводить до lower case, нормалізує апострофи"""
-                if not text:
-                    return ""
-                # Замінюємо різні види апострофів на стандартний
-                text = text.replace("'", "'").replace("`", "'").replace("ʼ", "'")
-                return text.strip().lower()
-            
-            # Перевірка повного збігу всіх 4 параметрів
-            if (normalize_text(first_name) == normalize_text(search_params["first_name"]) and
-                normalize_text(last_name) == normalize_text(search_params["last_name"]) and
-                normalize_text(patronymic) == normalize_text(search_params["patronymic"]) and
-                birth_date_normalized == search_date_normalized):
-                
-                found = True
-                matching_record = record
-                break
+        # Проміжне повідомлення лише на час завантаження бази: пошук у готовому знімку
+        # займає мілісекунди, тож результат надсилається одним запитом до Telegram
+        loading_msg = None
+        if not federation.is_loaded:
+            loading_msg = await update.message.reply_text("⏳ Завантажую дані з бази МВС...\nЗачекайте, це може зайняти деякий час")
         
-        # Формування відповіді
-        if found:
-            result_message = (
-                f"🚨 <b>ОПА! ОСОБУ ЗНАЙДЕНО В БАЗІ РОЗШУКУВАНИХ!</b>\n\n"
-                f"📋 Дані:\n"
-                f"• Прізвище: {matching_record.get('LAST_NAME_U') or matching_record.get('OVDSURNAME', 'N/A')}\n"
-                f"• Ім'я: {matching_record.get('FIRST_NAME_U') or matching_record.get('OVD', 'N/A')}\n"
-                f"• По-батькові: {matching_record.get('MIDDLE_NAME_U') or matching_record.get('OVDPATRONYMIC', 'N/A')}\n"
-                f"• Дата народження: {birth_date_normalized}\n"
-            )
-            
-            # Додаткова інформація, якщо є
-            if matching_record.get('CATEGORY'):
-                result_message += f"• Категорія: {matching_record.get('CATEGORY')}\n"
-            if matching_record.get('RESTRAINT'):
-                result_message += f"• Запобіжний захід: {matching_record.get('RESTRAINT')}\n"
-            if matching_record.get('ARTICLE_CRIM'):
-                result_message += f"• Стаття: {matching_record.get('ARTICLE_CRIM')}\n"
-            if matching_record.get('OVD'):
-                result_message += f"• Орган: {matching_record.get('OVD')}\n"
-                
-        else:
-            result_message = (
-                f"✅ <b>ВСЕ ДОБРЕ, ЖИВЕМО ДАЛІ</b>\n\n"
-                f"Перевірено за параметрами:\n"
-                f"• Прізвище: {search_params['last_name']}\n"
-                f"• Ім'я: {search_params['first_name']}\n"
-                f"• По-батькові: {search_params['patronymic']}\n"
-                f"• Дата народження: {search_params['birth_date']}\n"
-            )
+        # Повторний однаковий запит до тих самих знімків усіх баз обходиться без пошуку
+        # та формування відповіді; інакше запит іде в останні знімки всіх баз одночасно
+        # (збіги в базі, чий знімок не змінився, беруться з її кешу за нормалізованим ключем).
+        # Відповідь без збігів повторює введені параметри, тому готова відповідь — лише
+        # для параметрів, введених так само (регістр, абетка, апостроф)
+        cache_key = search_key(
+            search_params["last_name"],
+            search_params["first_name"],
+            search_params["patronymic"],
+            search_params["birth_date"]
+        )
+        reply_key = tuple(search_params[field] for field in ('last_name', 'first_name', 'patronymic', 'birth_date'))
+        result_message = reply_cache.get(federation.versions, reply_key) if federation.is_loaded else None
+        if result_message is None:
+            results = await federation.search(find_matches, search_params, key=cache_key)
+            result_message = render_result_message(search_params, results)
+            versions = tuple((result.source.name, result.version) for result in results)
+            reply_cache.put(versions, reply_key, result_message)
         
        
         saved_data = context.user_data.get('saved_params')
+        # Кнопка підписки посилається на параметри саме цього пошуку: до її натискання
+        # user_data вже може містити параметри наступної перевірки
+        watch_callback = f"watch_add:{remember_watch_candidate(context.user_data, search_params)}"
         
         if saved_data:
            
             keyboard = [
                 [InlineKeyboardButton("🔄 Пошук знову", callback_data='search_saved')],
                 [InlineKeyboardButton("✏️ Змінити параметри", callback_data='start_check')],
+                [InlineKeyboardButton("🔔 Стежити за змінами", callback_data=watch_callback)],
                 [InlineKeyboardButton("🏠 Головне меню", callback_data='main_menu')]
             ]
         else:
             # Якщо немає збережених даних - тільки нова перевірка
             keyboard = [
                 [InlineKeyboardButton("🔄 Нова перевірка", callback_data='start_check')],
+                [InlineKeyboardButton("🔔 Стежити за змінами", callback_data=watch_callback)],
                 [InlineKeyboardButton("🏠 Головне меню", callback_data='main_menu')]
             ]
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await loading_msg.edit_text(
-            result_message,
-            reply_markup=reply_markup,
-            parse_mode='HTML'
-        )
+        if loading_msg is not None:
+            await loading_msg.edit_text(result_message, reply_markup=reply_markup, parse_mode='HTML')
+        else:
+            await update.message.reply_text(result_message, reply_markup=reply_markup, parse_mode='HTML')
         
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         error_type = type(e).__name__
         await update.message.reply_text(
             f"❌ <b>Помилка при завантаженні даних</b>\n\n"
@@ -512,8 +601,474 @@ async def perform_search(update: Update, context: ContextTypes.DEFAULT_TYPE, use
             f"Натисніть /start для нової перевірки.",
             parse_mode='HTML'
         )
+    finally:
+        SEARCHES_IN_FLIGHT.dec()
+
+
+def parse_birth_filter(text):
+    """
+    Розбирає дату народження або роки для пошуку за неповними даними.
+
+    Приймає "ДД.ММ.РРРР", "РРРР" або "РРРР-РРРР"; повертає (дата, рік від, рік до) або None.
+    """
+    text = text.strip().replace('–', '-').replace(' ', '')
+    if len(text) == 10 and text[2] == '.' and text[5] == '.':
+        return text, None, None
+    years = text.split('-')
+    if len(years) in (1, 2) and all(len(year) == 4 and year.isdigit() for year in years):
+        year_from, year_to = int(years[0]), int(years[-1])
+        return '', min(year_from, year_to), max(year_from, year_to)
+    return None
 
 
+async def partial_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обробник команди /partial: пошук за прізвищем та датою або роками народження"""
+    await update.message.reply_text(
+        "🔎 <b>Пошук за неповними даними</b>\n\n"
+        "📝 Введіть <b>прізвище</b> особи:\n\n"
+        "Приклад: Осауленко\n\n"
+        "Або /cancel для скасування",
+        parse_mode='HTML'
+    )
+    
+    return PARTIAL_LAST_NAME
+
+
+async def partial_last_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отримання прізвища для пошуку за неповними даними"""
+    context.user_data['partial_last_name'] = update.message.text.strip()
+    
+    await update.message.reply_text(
+        f"✅ Прізвище: {context.user_data['partial_last_name']}\n\n"
+        "📝 Тепер введіть <b>дату народження</b> або <b>рік</b> чи <b>діапазон років</b>:\n\n"
+        "Приклади: 01.02.1990, 1990, 1988-1992\n\n"
+        "Або /cancel для скасування",
+        parse_mode='HTML'
+    )
+    
+    return PARTIAL_BIRTH
+
+
+async def partial_birth(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отримання дати або років народження та пошук за неповними даними"""
+    birth_filter = parse_birth_filter(update.message.text)
+    if birth_filter is None:
+        await update.message.reply_text(
+            "❌ Не вдалося розібрати дату.\n\n"
+            "Введіть ДД.ММ.РРРР, РРРР або РРРР-РРРР\n\n"
+            "Або /cancel для скасування"
+        )
+        return PARTIAL_BIRTH
+    
+    birth_date, year_from, year_to = birth_filter
+    last_name = context.user_data['partial_last_name']
+    
+    try:
+        loading_msg = None
+        if not federation.is_loaded:
+            loading_msg = await update.message.reply_text("⏳ Завантажую дані з бази МВС...\nЗачекайте, це може зайняти деякий час")
+        
+        results = await federation.search(Dataset.find_partial, last_name, birth_date, year_from, year_to)
+        matching_records = [record for result in results if result.ok for record in result.value]
+    except Exception as e:
+        await update.message.reply_text(
+            f"❌ <b>Помилка при завантаженні даних</b>\n\n"
+            f"<i>Деталі: {str(e)[:200]}</i>\n\n"
+            f"Спробуйте пізніше.\n\n"
+            f"Натисніть /partial для нової перевірки.",
+            parse_mode='HTML'
+        )
+        return ConversationHandler.END
+    
+    if birth_date:
+        criteria = f"{last_name}, {birth_date}"
+    elif year_from == year_to:
+        criteria = f"{last_name}, {year_from} р.н."
+    else:
+        criteria = f"{last_name}, {year_from}–{year_to} р.н."
+    
+    # Результати зберігаються, щоб гортати сторінки без повторного пошуку; id пошуку
+    # в кнопках гортання не дає старому повідомленню показати результати новішого пошуку
+    context.user_data['partial_search_id'] = context.user_data.get('partial_search_id', 0) + 1
+    context.user_data['partial_results'] = {
+        'id': context.user_data['partial_search_id'],
+        'criteria': criteria,
+        'total': len(matching_records),
+        'records': matching_records[:MAX_PARTIAL_RESULTS],
+    }
+    
+    text, reply_markup = format_partial_page(context.user_data['partial_results'], 0)
+    if loading_msg is not None:
+        await loading_msg.edit_text(text, reply_markup=reply_markup, parse_mode='HTML')
+    else:
+        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='HTML')
+    
+    return ConversationHandler.END
+
+
+def format_partial_page(results, page):
+    """Повідомлення та кнопки гортання для сторінки результатів пошуку за неповними даними"""
+    records = results['records']
+    
+    if not records:
+        text = (
+            f"✅ <b>ВСЕ ДОБРЕ, ЖИВЕМО ДАЛІ</b>\n\n"
+            f"За параметрами «{results['criteria']}» записів не знайдено.\n"
+        )
+        keyboard = [[InlineKeyboardButton("🏠 Головне меню", callback_data='main_menu')]]
+        return text, InlineKeyboardMarkup(keyboard)
+    
+    pages = (len(records) + MAX_SHOWN_RECORDS - 1) // MAX_SHOWN_RECORDS
+    page = max(0, min(page, pages - 1))
+    
+    text = (
+        f"🚨 <b>ЗНАЙДЕНО ЗАПИСИ В БАЗІ РОЗШУКУВАНИХ</b>\n\n"
+        f"Параметри: {results['criteria']}\n"
+        f"Знайдено записів: {results['total']}\n"
+    )
+    if results['total'] > len(records):
+        text += f"Показано перші {len(records)}, уточніть рік народження\n"
+    text += f"Сторінка {page + 1}/{pages}\n\n"
+    
+    for matching_record in records[page * MAX_SHOWN_RECORDS:(page + 1) * MAX_SHOWN_RECORDS]:
+        text += format_record(matching_record) + "\n"
+    
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀️ Назад", callback_data=f"partial_page:{results['id']}:{page - 1}"))
+    if page < pages - 1:
+        navigation.append(InlineKeyboardButton("Далі ▶️", callback_data=f"partial_page:{results['id']}:{page + 1}"))
+    
+    keyboard = [navigation] if navigation else []
+    keyboard.append([InlineKeyboardButton("🏠 Головне меню", callback_data='main_menu')])
+    
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+async def partial_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Гортання сторінок результатів пошуку за неповними даними"""
+    query = update.callback_query
+    
+    # Зберігаються лише результати останнього пошуку: кнопки попередніх повідомлень
+    # не чіпають їх вміст, щоб не підмінити його результатами іншого пошуку
+    results = context.user_data.get('partial_results')
+    parts = query.data.split(':')
+    if not results or len(parts) != 3 or parts[1] != str(results.get('id')):
+        await query.answer("❌ Результати цього пошуку вже недоступні. Натисніть /partial для нового пошуку",
+                           show_alert=True)
+        return
+    
+    await query.answer()
+    text, reply_markup = format_partial_page(results, int(parts[2]))
+    await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='HTML')
+
+
+def parse_inline_query(text):
+    """
+    Розбирає інлайн-запит "Прізвище Ім'я По-батькові ДД.ММ.РРРР", набраний частково.
+
+    Повертає (прізвище, ім'я, по-батькові, початок дати, скільки слів ПІБ набрано
+    повністю): слово вважається набраним, якщо за ним уже є пробіл чи дата.
+    """
+    names, birth_date = [], ''
+    partial = False
+    for token in text.split():
+        if token[0].isdigit():
+            birth_date = token
+            partial = False
+        elif len(names) < 3:
+            names.append(token)
+            partial = True
+    complete = len(names) - (partial and not text[-1:].isspace())
+    names += [''] * (3 - len(names))
+    return names[0], names[1], names[2], birth_date, complete
+
+
+def inline_article(result_id, record, source):
+    """Результат інлайн-режиму: у чат надсилається картка знайденого запису"""
+    description = record.birth_date
+    if record.category:
+        description += f" · {record.category}"
+    if len(federation.sources) > 1:
+        description += f" · {source.title}"
+    return InlineQueryResultArticle(
+        id=str(result_id),
+        title=f"{record.last_name} {record.first_name} {record.patronymic}".strip(),
+        description=description,
+        input_message_content=InputTextMessageContent(
+            "🚨 <b>ЗАПИС У БАЗІ РОЗШУКУВАНИХ</b>\n\n" + format_record(record, source),
+            parse_mode='HTML'
+        ),
+    )
+
+
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Інлайн-режим: пошук за початком ПІБ, результати звужуються по мірі набору.
+    Сюди доходить лише останній запит серії натискань (див. PerUserUpdateProcessor)
+    """
+    query = update.inline_query
+    last_name, first_name, patronymic, birth_date, complete = parse_inline_query(query.query)
+    articles = []
+    truncated = False
+    if not federation.is_loaded:
+        hint = "⏳ База ще завантажується, спробуйте за хвилину"
+    elif not normalize_text(last_name):
+        hint = "Наберіть: Прізвище Ім'я ДД.ММ.РРРР"
+    else:
+        hint = "Збігів за початком ПІБ немає. Повна перевірка — в боті"
+        # Кожне наступне натискання з тим самим запитом — з кешу джерела; обірваний перегляд
+        # не кешується: короткий запит, уточнений пізніше, не має залишитися «без збігів»
+        cache_key = ('prefix', normalize_text(last_name), normalize_text(first_name),
+                     normalize_text(patronymic), birth_date, complete)
+        try:
+            results = await federation.search(Dataset.find_prefix, last_name, first_name, patronymic,
+                                              birth_date, complete, INLINE_MAX_RESULTS, key=cache_key,
+                                              cacheable=lambda value: not value[1])
+        except Exception as e:
+            print(f"⚠️ Помилка інлайн-пошуку: {e}")
+            results = []
+            hint = "❌ База тимчасово недоступна, спробуйте пізніше"
+        for result in results:
+            if result.ok:
+                records, source_truncated = result.value
+                truncated = truncated or source_truncated
+                for record in records:
+                    articles.append(inline_article(len(articles), record, result.source))
+        articles = articles[:INLINE_MAX_RESULTS]
+        if truncated:
+            hint = "Забагато збігів — допишіть ім'я чи повну дату або перевірте в боті"
+    
+    if truncated:
+        INLINE_QUERIES.inc(label='truncated')
+    else:
+        INLINE_QUERIES.inc(label='found' if articles else 'empty')
+    try:
+        if articles and not truncated:
+            await query.answer(articles, cache_time=INLINE_CACHE_TIME)
+        else:
+            # Підказку Telegram не кешує: база могла ще не завантажитись, а знайдене
+            # при обірваному перегляді — не все
+            await query.answer(articles, cache_time=0, button=InlineQueryResultsButton(hint, start_parameter='inline'))
+    except TelegramError as e:
+        # Напр. запит застарів, поки база завантажувалась
+        print(f"⚠️ Не вдалося відповісти на інлайн-запит: {e}")
+
+
+async def batch_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Пакетна перевірка: CSV файл зі списком осіб, у відповідь файл з результатами"""
+    document = update.message.document
+    
+    if document.file_size and document.file_size > BATCH_MAX_BYTES:
+        await update.message.reply_text(
+            f"❌ Файл завеликий (максимум {BATCH_MAX_BYTES // 1024 // 1024} МБ).\n\n"
+            f"Розділіть список на кілька файлів."
+        )
+        return
+    
+    progress_msg = await update.message.reply_text("⏳ Завантажую файл...")
+    
+    try:
+        telegram_file = await document.get_file()
+        data = await telegram_file.download_as_bytearray()
+        header, columns, rows = open_csv(decode_upload(bytes(data)))
+        
+        if not federation.is_loaded:
+            await progress_msg.edit_text("⏳ Завантажую дані з бази МВС...\nЗачекайте, це може зайняти деякий час")
+        datasets = list((await federation.get()).values())
+        
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow((header or DEFAULT_HEADER) + RESULT_COLUMNS)
+        
+        checked = found = similar = 0
+        last_progress = time.monotonic()
+        for chunk in iter_chunks(rows):
+            # Перевірка шматка у фоновому потоці, щоб інші користувачі не чекали
+            results = await asyncio.to_thread(check_chunk, datasets, chunk, columns)
+            writer.writerows(results)
+            
+            chunk_checked, chunk_found, chunk_similar = summarize(results)
+            checked += chunk_checked
+            found += chunk_found
+            similar += chunk_similar
+            
+            if time.monotonic() - last_progress >= BATCH_PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                # Не чекаємо відправки: перевірка не стоїть на лімітах Telegram, а застарілий
+                # прогрес, що ще не надісланий, MessageScheduler замінить новішим
+                context.application.create_task(progress_msg.edit_text(f"⏳ Перевірено рядків: {checked}..."))
+    except (UnicodeDecodeError, csv.Error) as e:
+        await progress_msg.edit_text(
+            f"❌ Не вдалося прочитати CSV файл:\n{str(e)[:200]}\n\n"
+            f"Очікуються колонки: {', '.join(DEFAULT_HEADER)}"
+        )
+        return
+    except Exception as e:
+        await progress_msg.edit_text(
+            f"❌ <b>Несподівана помилка</b>\n\n"
+            f"<i>Деталі: {str(e)[:200]}</i>\n\n"
+            f"Спробуйте ще раз або зверніться до адміністратора.",
+            parse_mode='HTML'
+        )
+        return
+    
+    if found:
+        summary = f"🚨 <b>Є ЗБІГИ З БАЗОЮ РОЗШУКУВАНИХ!</b>\n\n"
+    else:
+        summary = f"✅ <b>Збігів не знайдено</b>\n\n"
+    summary += (
+        f"Перевірено рядків: {checked}\n"
+        f"• Знайдено в базі: {found}\n"
+        f"• Схожі записи (можлива помилка в ПІБ): {similar}\n\n"
+        f"Результат для кожного рядка — у файлі."
+    )
+    
+    name = os.path.splitext(document.file_name or 'list.csv')[0]
+    await update.message.reply_document(
+        document=io.BytesIO(output.getvalue().encode('utf-8-sig')),  # BOM, щоб Excel відкрив кирилицю
+        filename=f"{name}_result.csv",
+        caption=summary,
+        parse_mode='HTML'
+    )
+    await progress_msg.delete()
+
+
+def remember_watch_candidate(user_data, search_params):
+    """
+    Запам'ятовує параметри пошуку для кнопки підписки під його результатом.
+
+    Повертає id пошуку для callback_data; зберігаються MAX_WATCH_CANDIDATES останніх.
+    """
+    search_id = user_data['watch_search_id'] = user_data.get('watch_search_id', 0) + 1
+    candidates = user_data.setdefault('watch_candidates', {})
+    candidates[search_id] = dict(search_params)
+    for old_id in sorted(candidates)[:-MAX_WATCH_CANDIDATES]:
+        del candidates[old_id]
+    return search_id
+
+
+async def watch_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Підписка на зміни в базі щодо особи з пошуку, під результатом якого натиснуто кнопку"""
+    query = update.callback_query
+    
+    # Старі кнопки без id пошуку (callback_data 'watch_add') не знають, про яку особу йдеться
+    _, _, search_id = query.data.partition(':')
+    params = context.user_data.get('watch_candidates', {}).get(int(search_id)) if search_id.isdigit() else None
+    if not params or not params['last_name']:
+        await query.answer("❌ Дані цього пошуку вже недоступні. Виконайте пошук ще раз", show_alert=True)
+        return
+    
+    subscriptions = context.user_data.setdefault('watchlist', [])
+    if any(params_key(saved) == params_key(params) for saved in subscriptions):
+        await query.answer("Ви вже стежите за цією особою")
+        return
+    if len(subscriptions) >= MAX_WATCHLIST:
+        await query.answer(f"❌ Можна стежити не більше ніж за {MAX_WATCHLIST} особами. Див. /watchlist", show_alert=True)
+        return
+    
+    subscriptions.append(params)
+    watchlist.add(update.effective_user.id, params)
+    await query.answer("🔔 Повідомлю, якщо запис про цю особу з'явиться в базі або зникне з неї", show_alert=True)
+
+
+def format_watchlist(subscriptions):
+    """Список підписок користувача з кнопками видалення"""
+    if not subscriptions:
+        text = (
+            "🔕 Ви ні за ким не стежите.\n\n"
+            "Після пошуку натисніть «🔔 Стежити за змінами», щоб отримувати повідомлення "
+            "про появу або зникнення особи з бази."
+        )
+        return text, None
+    
+    text = "🔔 <b>Ви стежите за змінами щодо осіб:</b>\n\n"
+    keyboard = []
+    for i, params in enumerate(subscriptions):
+        person = f"{params['last_name']} {params['first_name']} {params['patronymic']}, {params['birth_date']}"
+        text += f"{i + 1}. {person}\n"
+        keyboard.append([InlineKeyboardButton(f"❌ {i + 1}. {params['last_name']}", callback_data=f'watch_remove:{i}')])
+    
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+async def show_watchlist(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обробник команди /watchlist"""
+    text, reply_markup = format_watchlist(context.user_data.get('watchlist', []))
+    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='HTML')
+
+
+async def watch_remove(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Видалення підписки"""
+    query = update.callback_query
+    await query.answer()
+    
+    subscriptions = context.user_data.get('watchlist', [])
+    index = int(query.data.split(':')[1])
+    if index < len(subscriptions):
+        watchlist.remove(update.effective_user.id, subscriptions.pop(index))
+    
+    text, reply_markup = format_watchlist(subscriptions)
+    await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='HTML')
+
+
+async def notify_watchlist(application: Application, source, old, new):
+    """Після оновлення бази source повідомляє лише тих, чия особа з'явилась у ній або зникла з неї"""
+    if not len(watchlist):
+        return
+    added, removed = await asyncio.to_thread(diff_datasets, old, new)
+    notifications = watchlist.probe(added, removed)
+    print(f"🔔 Зміни в базі {source.name}: +{len(added)} / -{len(removed)}, повідомлень: {len(notifications)}")
+    
+    for chat_id, events in notifications.items():
+        text = "🔔 <b>Зміни в базі розшукуваних щодо осіб, за якими ви стежите</b>\n\n"
+        for event, params, person in events[:MAX_SHOWN_RECORDS]:
+            if event == 'added':
+                text += "🚨 <b>З'явився запис:</b>\n"
+            else:
+                text += "✅ <b>Запис видалено з бази:</b>\n"
+            text += format_record(person, source) + "\n"
+        try:
+            await application.bot.send_message(chat_id, text, parse_mode='HTML')
+        except TelegramError as e:
+            print(f"⚠️ Не вдалося надіслати повідомлення {chat_id}: {e}")
+
+
+def health_response(path):
+    """Відповідь HTTP сервера для Render, UptimeRobot та Prometheus: (код, тип, тіло)"""
+    if path == '/metrics':
+        return 200, 'text/plain; version=0.0.4; charset=utf-8', render_metrics().encode('utf-8')
+    if path == '/ready':
+        # Готовий, лише коли є знімок хоча б однієї бази для пошуку
+        if not federation.is_loaded:
+            return 503, 'text/plain', b'Dataset is not loaded yet'
+        return 200, 'text/plain', b'Ready'
+    return 200, 'text/plain', b'Bot is running'
+
+
+# HTTP сервер для Render (щоб не було timeout) працює в циклі подій бота, без окремого потоку
+health_server = HealthServer(health_response, port=int(os.environ.get('PORT', 10000)))
+
+
+async def post_init(application: Application):
+    """Запуск HTTP сервера, фонове завантаження та оновлення бази після старту бота"""
+    await health_server.start()
+    print(f"🌐 HTTP сервер запущено на порту {health_server.port}")
+    
+    application.persistence.attach(application)
+    # user_data завантажується ліниво, тому підписки читаємо з бази окремо
+    for user_id, subscriptions in (await application.persistence.get_user_values('watchlist')).items():
+        for params in subscriptions:
+            watchlist.add(user_id, params)
+    federation.on_update(lambda source, old, new: notify_watchlist(application, source, old, new))
+    federation.start()
+
+
+async def post_shutdown(application: Application):
+    """Закриття HTTP з'єднань до бази та HTTP сервера при зупинці бота"""
+    await federation.aclose()
+    await health_server.stop()
+
 
 def main():
     """Запуск бота"""
@@ -522,7 +1077,20 @@ def main():
     print("💾 Підтримка збереження параметрів активована")
     
     # Створення додатку
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Збережені параметри та підписки переживають перезапуск (SQLite у DATA_DIR)
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .request(TimedHTTPXRequest(connection_pool_size=256))
+        .persistence(SQLitePersistence())
+        # Різні користувачі обробляються паралельно, кроки розмови одного — по черзі
+        .concurrent_updates(PerUserUpdateProcessor())
+        # Ліміти Telegram на відправку, злиття проміжних редагувань і повтори після 429
+        .rate_limiter(MessageScheduler())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # ConversationHandler для послідовного введення даних
     conv_handler = ConversationHandler(
@@ -539,55 +1107,55 @@ def main():
                 CallbackQueryHandler(save_choice_no, pattern='save_no')
             ],
         },
-        fallbacks=[CommandHandler('cancel', cancel)],
+        fallbacks=[
+            CommandHandler('cancel', cancel),
+            # /partial посеред перевірки: ця розмова завершується, а пошук за неповними даними починається
+            CommandHandler('partial', end_conversation),
+        ],
         # Видалено per_message=True для усунення warning
+        name='check',
+        persistent=True,
+    )
+    
+    # Пошук за неповними даними (прізвище + дата або роки народження)
+    partial_handler = ConversationHandler(
+        entry_points=[CommandHandler('partial', partial_start)],
+        states={
+            PARTIAL_LAST_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, partial_last_name)],
+            PARTIAL_BIRTH: [MessageHandler(filters.TEXT & ~filters.COMMAND, partial_birth)],
+        },
+        fallbacks=[
+            CommandHandler('cancel', cancel),
+            # «Почати перевірку» посеред пошуку за неповними даними
+            CallbackQueryHandler(end_conversation, pattern='start_check'),
+        ],
+        name='partial',
+        persistent=True,
     )
     
     # Додавання обробників
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CallbackQueryHandler(search_saved, pattern='search_saved'))
     application.add_handler(CallbackQueryHandler(main_menu, pattern='main_menu'))
+    application.add_handler(CommandHandler("watchlist", show_watchlist))
+    application.add_handler(CallbackQueryHandler(watch_add, pattern='^watch_add'))
+    application.add_handler(CallbackQueryHandler(watch_remove, pattern='^watch_remove:'))
+    application.add_handler(CallbackQueryHandler(partial_page, pattern='^partial_page:'))
+    application.add_handler(InlineQueryHandler(inline_search))
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension('csv') | filters.Document.MimeType('text/csv'),
+        batch_check
+    ))
     application.add_handler(conv_handler)
+    # Окрема група: команда, що починає одну розмову, ще й завершує іншу (fallbacks),
+    # а в межах однієї групи оновлення обробляє лише перший обробник
+    application.add_handler(partial_handler, group=1)
     
-    # HTTP сервер для Render (щоб не було timeout)
-    import os
-    from threading import Thread
-    from http.server import HTTPServer, BaseHTTPRequestHandler
-    
-    class HealthCheckHandler(BaseHTTPRequestHandler):
-        def do_GET(self):
-            self.send_response(200)
-            self.send_header('Content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'Bot is running')
-        
-        def do_HEAD(self):
-            # Підтримка HEAD запитів для UptimeRobot
-            self.send_response(200)
-            self.send_header('Content-type', 'text/plain')
-            self.send_header('Content-Length', '14')
-            self.end_headers()
-        
-        def log_message(self, format, *args):
-            pass  # Не логувати HTTP запити
-    
-    def run_health_server():
-        port = int(os.environ.get('PORT', 10000))
-        server = HTTPServer(('0.0.0.0', port), HealthCheckHandler)
-        print(f"🌐 HTTP сервер запущено на порту {port}")
-        server.serve_forever()
-    
-    # Запуск HTTP сервера у фоновому потоці
-    health_thread = Thread(target=run_health_server, daemon=True)
-    health_thread.start()
-    
-    # Запуск бота з drop_pending_updates для уникнення конфліктів
+    # Webhook на HTTP сервері бота, якщо задано WEBHOOK_URL, інакше polling;
+    # оновлення, що накопичились поки бот був зупинений, не скидаються
     print("✅ Бот запущено! Натисніть Ctrl+C для зупинки.")
     print("💬 Відкрийте бота в Telegram та відправте /start")
-    application.run_polling(
-        allowed_updates=Update.ALL_TYPES,
-        drop_pending_updates=True  # Скидає старі оновлення при запуску
-    )
+    asyncio.run(run_application(application, UpdateReceiver(application, health_server)))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Отримання оновлень від Telegram (webhook або polling) та їх паралельна обробка
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import signal
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import INLINE_QUERIES
+
+# Скільки оновлень обробляти одночасно (1 — строго послідовно, як раніше).
+# Понад ~40 одночасних запитів пул з'єднань httpx сам стає вузьким місцем (benchmark.py updates)
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', 32))
+
+# Інлайн-запит приходить на кожне натискання клавіші: обробляється лише той, після якого
+# користувач стільки секунд нічого не набирав, на попередні з серії бот не відповідає.
+# При CONCURRENT_UPDATES=1 не діє (див. PerUserUpdateProcessor)
+INLINE_DEBOUNCE = float(os.getenv('INLINE_DEBOUNCE', 0.3))
+
+# Публічна адреса бота (напр. https://bot.onrender.com); без неї оновлення отримуються через polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')
+WEBHOOK_PATH = '/telegram'
+
+# Скільки чекати на обробку вже прийнятих оновлень при зупинці (секунди)
+DRAIN_TIMEOUT = 30
+
+
+def _ordering_key(update):
+    """Чиї оновлення мають оброблятися по черзі: користувача, інакше чату"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обробляє оновлення різних користувачів паралельно, а одного користувача —
+    строго в порядку надходження, щоб ConversationHandler бачив кроки розмови
+    так само, як при послідовній обробці.
+
+    Інлайн-запити не стають у чергу користувача: з серії запитів, що йдуть під
+    час набору, обробляється лише останній (через inline_debounce секунд).
+    З max_concurrent_updates=1 Application чекає на кожне оновлення, тож пауза
+    зупиняла б увесь бот, а наступне натискання все одно не прийшло б під час
+    неї, — тоді інлайн-запити обробляються одразу.
+    """
+
+    def __init__(self, max_concurrent_updates: int = CONCURRENT_UPDATES, inline_debounce: float = INLINE_DEBOUNCE):
+        super().__init__(max_concurrent_updates)
+        self.inline_debounce = inline_debounce if max_concurrent_updates > 1 else 0
+        # ключ -> [Lock, кількість оновлень, що його тримають або чекають]
+        self._locks = {}
+        # user_id -> останній інлайн-запит користувача (Update)
+        self._latest_inline = {}
+
+    async def process_update(self, update, coroutine):
+        if self.inline_debounce and isinstance(update, Update) and update.inline_query is not None:
+            return await self._process_inline(update, coroutine)
+        # Спершу черга користувача, потім загальний ліміт: оновлення, що чекають своєї
+        # черги, не займають місць у ліміті (інакше один користувач міг би зайняти всі)
+        key = _ordering_key(update)
+        if key is None:
+            return await super().process_update(update, coroutine)
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def _process_inline(self, update, coroutine):
+        # Пауза — до загального ліміту: інакше кожне натискання клавіші займало б у ньому місце
+        user_id = update.inline_query.from_user.id
+        self._latest_inline[user_id] = update
+        try:
+            await asyncio.sleep(self.inline_debounce)
+        except asyncio.CancelledError:
+            coroutine.close()
+            if self._latest_inline.get(user_id) is update:
+                del self._latest_inline[user_id]
+            raise
+        if self._latest_inline.get(user_id) is not update:
+            # Користувач набрав далі: цей запит застарів
+            coroutine.close()
+            INLINE_QUERIES.inc(label='debounced')
+            return
+        del self._latest_inline[user_id]
+        await super().process_update(update, coroutine)
+
+    def is_processing(self, key):
+        """Чи є оновлення користувача (або чату) key, що обробляються чи чекають своєї черги"""
+        return key in self._locks
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+class UpdateReceiver:
+    """
+    Джерело оновлень для Application.
+
+    З webhook_url оновлення приймаються на HTTP сервері бота (той самий PORT,
+    що й health перевірки), інакше — через getUpdates. Черга Telegram не
+    скидається при старті, а при зупинці спершу обробляється все прийняте:
+    неприйняті оновлення Telegram доставить після перезапуску.
+    """
+
+    def __init__(self, application, server, webhook_url: str = WEBHOOK_URL, secret_token: str = None):
+        self.application = application
+        self.server = server
+        self.webhook_url = webhook_url
+        self.secret_token = secret_token or os.getenv('WEBHOOK_SECRET') or hashlib.sha256(
+            application.bot.token.encode()).hexdigest()
+        self.accepting = False
+
+    async def handle_webhook(self, headers, body):
+        """POST від Telegram з одним оновленням"""
+        if headers.get('x-telegram-bot-api-secret-token') != self.secret_token:
+            return 403, 'text/plain', b'Forbidden'
+        if not self.accepting:
+            # Не 200: Telegram повторить доставку, коли бот знову запуститься
+            return 503, 'text/plain', b'Shutting down'
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except ValueError:
+            return 400, 'text/plain', b'Bad Request'
+        await self.application.update_queue.put(update)
+        return 200, 'text/plain', b'OK'
+
+    async def start(self):
+        if self.webhook_url:
+            self.server.add_post_handler(WEBHOOK_PATH, self.handle_webhook)
+            self.accepting = True
+            await self.application.bot.set_webhook(
+                url=self.webhook_url + WEBHOOK_PATH,
+                secret_token=self.secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=min(100, max(1, self.application.concurrent_updates)),
+            )
+            print(f"🔗 Webhook: {self.webhook_url}{WEBHOOK_PATH}")
+        else:
+            await self.application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+
+    async def stop(self):
+        """Перестає приймати нові оновлення і чекає обробки вже прийнятих"""
+        if self.webhook_url:
+            self.accepting = False
+        elif self.application.updater.running:
+            await self.application.updater.stop()
+        try:
+            await asyncio.wait_for(self.application.update_queue.join(), DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Не всі оновлення оброблено за {DRAIN_TIMEOUT} с до зупинки")
+
+
+async def run_application(application, receiver: UpdateReceiver):
+    """Життєвий цикл бота (замість run_polling): старт, робота до SIGINT/SIGTERM, зупинка"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows: Ctrl+C зупинить бота через KeyboardInterrupt
+            pass
+
+    try:
+        async with application:
+            if application.post_init:
+                await application.post_init(application)
+            await receiver.start()
+            await application.start()
+            await stop.wait()
+            await receiver.stop()
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    finally:
+        if application.post_shutdown:
+            await application.post_shutdown(application)
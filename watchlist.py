@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Підписки користувачів на зміни в базі щодо збережених осіб
+"""
+
+from dataset import search_key, transliterate_key
+
+# Скільки осіб один користувач може відстежувати
+MAX_WATCHLIST = 10
+
+
+def watch_key(last_name, first_name, patronymic, birth_date):
+    """
+    Ключ підписки: нормалізоване ПІБ латиницею та дата народження.
+
+    Кирилиця і латиниця зводяться до одного ключа, тому підписці та запису
+    достатньо одного звернення до словника.
+    """
+    return transliterate_key(search_key(last_name, first_name, patronymic, birth_date))
+
+
+def params_key(params):
+    return watch_key(params['last_name'], params['first_name'], params['patronymic'], params['birth_date'])
+
+
+class Watchlist:
+    """Обернений індекс підписок: ключ особи -> {chat_id: параметри пошуку}"""
+
+    def __init__(self):
+        self.subscribers = {}
+
+    def __len__(self):
+        return sum(len(chats) for chats in self.subscribers.values())
+
+    def add(self, chat_id, params):
+        self.subscribers.setdefault(params_key(params), {})[chat_id] = params
+
+    def remove(self, chat_id, params):
+        key = params_key(params)
+        chats = self.subscribers.get(key, {})
+        chats.pop(chat_id, None)
+        if not chats:
+            self.subscribers.pop(key, None)
+
+    def probe(self, added, removed):
+        """
+        Перевіряє лише змінені записи проти підписок.
+
+        Повертає {chat_id: [(подія, параметри, PersonRecord)]}, де подія 'added' або 'removed'.
+        """
+        notifications = {}
+        for event, records in (('added', added), ('removed', removed)):
+            for person in records:
+                chats = self.subscribers.get(
+                    watch_key(person.last_name, person.first_name, person.patronymic, person.birth_date)
+                )
+                for chat_id, params in (chats or {}).items():
+                    notifications.setdefault(chat_id, []).append((event, params, person))
+        return notifications